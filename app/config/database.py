@@ -1,25 +1,182 @@
+"""
+Motor síncrono de PostgreSQL y sesiones.
+
+El engine (y con él psycopg2, el dialecto y Settings) se crea la primera
+vez que se pide una sesión o se usa `engine`, no al importar el módulo:
+importar config.database no exige DATABASE_URL ni abre conexiones.
+"""
 import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.pool import QueuePool
+from config.entorno import cargar_entorno
+from services.metricas import metricas
 
-load_dotenv()
+cargar_entorno()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL no encontrada en variables de entorno")
-
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=False
+# Espera por una conexión del pool: si crece, el pool está saturado
+espera_pool = metricas.histograma(
+    "conuco_pool_espera_segundos", "Espera pa' sacar una conexión del pool, por motor"
+)
+timeouts_pool = metricas.contador(
+    "conuco_pool_timeouts_total", "Veces que se agotó DB_POOL_TIMEOUT esperando conexión"
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+
+class _PoolMedido:
+    """Mezcla pa' un QueuePool que mide cuánto se espera por cada conexión"""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timeouts_pool.sumar(motor=self.motor)
+            raise
+        finally:
+            espera_pool.observar(time.perf_counter() - inicio, motor=self.motor)
+
+
+class PoolMedido(_PoolMedido, QueuePool):
+    motor = "sync"
+
+
+def argumentos_pool() -> dict:
+    """Parámetros de pool comunes a ambos motores, tomados de Settings"""
+    from config.settings import settings
+
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True,
+        "query_cache_size": settings.db_query_cache_size
+    }
+
+
+# Contador de consultas enviadas a PostgreSQL (lo lee /telegram/status y las pruebas de carga)
+contador_consultas = {"total": 0}
+
+
+def instrumentar(engine):
+    """Cuenta y mide las consultas de un engine (al async se le pasa su sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _contar_consulta(conn, cursor, statement, parameters, context, executemany):
+        contador_consultas["total"] += 1
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _medir_consulta(conn, cursor, statement, parameters, context, executemany):
+        metricas.observar_etapa("db", time.perf_counter() - conn.info["inicio_consulta"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error_consulta(contexto):
+        if contexto.connection is not None and contexto.connection.info.get("inicio_consulta"):
+            contexto.connection.info["inicio_consulta"].pop()
+        metricas.errores.sumar(etapa="db")
+
+
+def estado_pool(pool) -> dict:
+    """Conexiones en uso/libres y saturación (en uso / máximo posible)"""
+    maximo = pool.size() + max(pool._max_overflow, 0)
+    return {
+        "en_uso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "tamano": pool.size(),
+        "saturacion": round(pool.checkedout() / maximo, 3) if maximo else 0
+    }
+
+
+metricas.medidor("conuco_consultas_db", "Consultas enviadas a PostgreSQL", lambda: contador_consultas["total"])
+
+_engine = None
+_sesiones = None
+_lock = threading.Lock()
+
+
+def obtener_engine():
+    global _engine, _sesiones
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                if not DATABASE_URL:
+                    raise ValueError("DATABASE_URL no encontrada en variables de entorno")
+                from sqlalchemy.orm import sessionmaker
+
+                engine = create_engine(
+                    DATABASE_URL,
+                    poolclass=PoolMedido,
+                    echo=False,
+                    **argumentos_pool()
+                )
+                instrumentar(engine)
+                metricas.medidor(
+                    "conuco_pool_db", "Conexiones del pool síncrono de la base",
+                    lambda: estado_pool(engine.pool), etiqueta="estado"
+                )
+                _sesiones = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
+
+
+def engine_aparte(url: str):
+    """
+    Engine pa' un almacén con su propia URL (ESTADOS_SQL_URL, PARTICION_SQL_URL).
+    SQLite en memoria ("sqlite://") vive en una sola conexión compartida por
+    todos los hilos: con el pool por defecto cada hilo abría su propia base,
+    vacía, y las tablas creadas en otro hilo no existían.
+    """
+    from sqlalchemy.engine import make_url
+
+    datos = make_url(url)
+    if datos.get_backend_name() == "sqlite" and datos.database in (None, "", ":memory:"):
+        from sqlalchemy.pool import StaticPool
+
+        return create_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    return create_engine(url)
+
+
+MIGRACIONES = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "migrations")
+
+
+def esquema_sqlite(engine, migracion: str):
+    """
+    SQLite (pruebas locales) no pasa por migrations/: le aplica el archivo
+    `migracion` pa' que el almacén tenga su tabla. Con PostgreSQL no hace
+    nada, ahí el esquema lo ponen las migraciones.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with open(os.path.join(MIGRACIONES, migracion), encoding="utf-8") as archivo:
+        sql = "\n".join(linea for linea in archivo if not linea.lstrip().startswith("--"))
+    with engine.begin() as conn:
+        for sentencia in sql.split(";"):
+            if sentencia.strip():
+                conn.exec_driver_sql(sentencia)
+
+
+def SessionLocal(**kwargs):
+    """Sesión nueva del motor síncrono (lo crea si es la primera)"""
+    obtener_engine()
+    return _sesiones(**kwargs)
+
+
+def __getattr__(nombre):
+    # `from config.database import engine` sigue funcionando, pero crea el motor recién ahí
+    if nombre == "engine":
+        return obtener_engine()
+    if nombre == "Base":
+        from sqlalchemy.orm import declarative_base
+
+        globals()["Base"] = declarative_base()
+        return globals()["Base"]
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 def get_db():
     db = SessionLocal()
@@ -28,6 +185,18 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def sesion():
+    """Sesión por petición: se abre al llegar el mensaje y se devuelve al pool al terminar"""
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 def test_connection():
     try:
         db = SessionLocal()
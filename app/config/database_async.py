@@ -0,0 +1,71 @@
+"""
+Acceso asíncrono a PostgreSQL con SQLAlchemy asyncio + asyncpg (DB_ASYNC=1).
+
+Mismo DATABASE_URL que el motor síncrono; el driver se cambia a asyncpg.
+El engine se crea la primera vez que se usa, así asyncpg solo hace falta
+cuando se activa este camino. Pool y caches salen de Settings (DB_POOL_SIZE,
+DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_STATEMENT_CACHE_SIZE...).
+"""
+import threading
+from contextlib import asynccontextmanager
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config.database import DATABASE_URL, _PoolMedido, argumentos_pool, estado_pool, instrumentar
+from config.settings import settings
+from services.metricas import metricas
+
+
+class PoolMedidoAsync(_PoolMedido, AsyncAdaptedQueuePool):
+    motor = "async"
+
+
+def url_async(url: str):
+    """postgresql://... → postgresql+asyncpg://... con el cache de sentencias de Settings"""
+    url = make_url(url).set(drivername="postgresql+asyncpg")
+    return url.update_query_dict({"prepared_statement_cache_size": str(settings.db_statement_cache_size)})
+
+
+_engine = None
+_sesiones = None
+_lock = threading.Lock()
+
+
+def obtener_engine_async():
+    global _engine, _sesiones
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                if not DATABASE_URL:
+                    raise ValueError("DATABASE_URL no encontrada en variables de entorno")
+                engine = create_async_engine(
+                    url_async(DATABASE_URL),
+                    poolclass=PoolMedidoAsync,
+                    connect_args={"statement_cache_size": settings.db_statement_cache_size},
+                    **argumentos_pool()
+                )
+                instrumentar(engine.sync_engine)
+                metricas.medidor(
+                    "conuco_pool_db_async", "Conexiones del pool asíncrono de la base",
+                    lambda: estado_pool(engine.sync_engine.pool), etiqueta="estado"
+                )
+                _sesiones = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+                _engine = engine
+    return _engine
+
+
+@asynccontextmanager
+async def sesion_async():
+    """Sesión async por mensaje; la conexión vuelve al pool al salir"""
+    obtener_engine_async()
+    async with _sesiones() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def get_db_async():
+    async with sesion_async() as db:
+        yield db
@@ -0,0 +1,23 @@
+"""
+Carga del .env, en un solo lugar y una sola vez por proceso.
+
+Lo llaman config.settings al importarse, config.database antes de leer
+DATABASE_URL y los servicios antes de leer su configuración, así no
+importa cuál módulo se importe primero.
+"""
+import threading
+
+_cargado = False
+_lock = threading.Lock()
+
+
+def cargar_entorno():
+    global _cargado
+    if _cargado:
+        return
+    with _lock:
+        if not _cargado:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _cargado = True
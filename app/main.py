@@ -1,38 +1,81 @@
 # Agregar este endpoint a tu main.py existente
+import os
+from config.database import contador_consultas, sesion
+from services.clima_service import clima_service
+from services.metricas import metricas
+from tasks.cola_mensajes import admitir_mensaje, admitir_update, cola_mensajes, deduplicador, extraer_mensaje
+from tasks.particiones import coordinador_particiones
+from tasks.precalentar_clima import iniciar_precalentamiento
+
+# Clima de todas las zonas al arrancar y cada CLIMA_PRECALENTAR_MINUTOS
+if os.getenv("CLIMA_PRECALENTAR", "0") == "1":
+    iniciar_precalentamiento()
+
+# Varios nodos, cada chat en uno (ver tasks/particiones.py). Los nodos corren
+# aparte (python -m tasks.particiones); cada worker del webhook solo lee el
+# anillo y le pasa los updates al dueño de cada chat
+if coordinador_particiones.activo:
+    coordinador_particiones.conectar()
 
 @app.route('/telegram', methods=['POST'])
 def handle_telegram_webhook():
     """Maneja los webhooks de Telegram"""
+    data = None
     try:
-        data = request.get_json()
+        with metricas.medir("parse"):
+            data = request.get_json()
         print(f"Webhook Telegram recibido: {data}")
         
+        # Reintento de un update que ya recibimos: 200 sin volver a procesarlo
+        if not admitir_update(data):
+            return jsonify({"status": "duplicate"}), 200
+        
         # Verificar que es un mensaje válido
         if not data or 'message' not in data:
             return jsonify({"status": "no message"}), 200
             
-        message = data['message']
+        # Extraer información del mensaje (texto o ubicación compartida)
+        mensaje = extraer_mensaje(data)
+        if not mensaje:
+            return jsonify({"status": "empty message"}), 200
+        chat_id, text = mensaje
         
-        # Extraer información del mensaje
-        chat_id = str(message['chat']['id'])
-        text = message.get('text', '').strip()
+        # El chat es de otro nodo: allá están su estado, su cache y sus límites
+        if coordinador_particiones.activo and not coordinador_particiones.es_propio(chat_id):
+            dueno = coordinador_particiones.dueno(chat_id)
+            if dueno is None:
+                raise RuntimeError("no hay nodos vivos en la partición")
+            if not coordinador_particiones.reenviar(dueno, {chat_id: [data]}):
+                raise RuntimeError(f"el nodo {dueno} no confirmó el update")
+            return jsonify({"status": "forwarded"}), 200
         
-        if not text:
-            return jsonify({"status": "empty message"}), 200
+        # Chats que mandan ráfagas: 200 igual, pa' que Telegram no reintente
+        if not admitir_mensaje(chat_id):
+            return jsonify({"status": "rate limited"}), 200
+            
+        # Modo cola: encolar y responder enseguida, los workers procesan y responden
+        if cola_mensajes.activa:
+            cola_mensajes.encolar(data)
+            return jsonify({"status": "queued"}), 200
             
         print(f"Mensaje de {chat_id}: {text}")
         
-        # Procesar mensaje con el servicio existente
-        respuesta = whatsapp_service.procesar_mensaje_entrante(chat_id, text, db)
-        
-        # Enviar respuesta
-        if respuesta:
-            whatsapp_service.enviar_mensaje(chat_id, respuesta)
+        with metricas.comando():
+            # Procesar mensaje con el servicio existente; sesión propia de esta petición
+            with sesion() as db:
+                respuesta = whatsapp_service.procesar_mensaje_entrante(chat_id, text, db)
+            
+            # Enviar respuesta
+            if respuesta:
+                whatsapp_service.responder(chat_id, respuesta)
             
         return jsonify({"status": "success"}), 200
         
     except Exception as e:
         print(f"Error procesando webhook Telegram: {e}")
+        # Con el 500 Telegram lo reintenta: que ese reintento sí se procese
+        if isinstance(data, dict) and data.get("update_id") is not None:
+            deduplicador.olvidar(data["update_id"])
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
@@ -43,5 +86,17 @@ def telegram_status():
     return jsonify({
         "status": "active",
         "service": "Mi Conuco Smart - Telegram Bot",
-        "timestamp": datetime.now().isoformat()
-    })
\ No newline at end of file
+        "timestamp": datetime.now().isoformat(),
+        "cache_clima": clima_service.estadisticas_cache(),
+        "consultas_db": contador_consultas["total"],
+        "modo": cola_mensajes.modo,
+        "cola_pendientes": cola_mensajes.pendientes() if cola_mensajes.activa else 0,
+        "envios_pendientes": whatsapp_service.cola_envios.pendientes() if whatsapp_service.envios_en_cola else 0
+    })
+
+
+# Métricas en formato Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Histogramas por etapa y comando, contadores y medidores del bot"""
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from .metricas import metricas
+
+
+class CacheReportes:
+    """
+    Último REPORTE armado por chat, pa' los que lo piden varias veces seguidas:
+    un hit es una búsqueda en memoria, sin ir a la base. Vale REPORTE_CACHE_TTL
+    segundos y solo el día en que se armó (los días de la siembra cambian, y
+    avanzar_siembras corre de noche). guardar_registro lo invalida al apuntar
+    una siembra; con PARTICIONES=1 eso pasa en el nodo dueño del chat, y sin
+    particiones otro worker puede seguir dando el reporte anterior hasta que
+    venza el TTL.
+    """
+
+    def __init__(self, ttl: int | None = None, maximo: int | None = None):
+        self.ttl = ttl if ttl is not None else int(os.getenv("REPORTE_CACHE_TTL", "300"))
+        self.maximo = maximo if maximo is not None else int(os.getenv("REPORTE_CACHE_MAX", "50000"))
+        self._reportes = OrderedDict()
+        self._lock = threading.Lock()
+        self.consultas = metricas.contador(
+            "conuco_cache_reportes_total", "Búsquedas en el cache de REPORTE por resultado"
+        )
+
+    def obtener(self, chat_id: str) -> str | None:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entrada = self._reportes.get(chat_id)
+            if entrada is not None:
+                expira, fecha, texto = entrada
+                if expira > time.monotonic() and fecha == date.today():
+                    self.consultas.sumar(resultado="hit")
+                    return texto
+                del self._reportes[chat_id]
+        self.consultas.sumar(resultado="miss")
+        return None
+
+    def guardar(self, chat_id: str, texto: str):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._reportes[chat_id] = (time.monotonic() + self.ttl, date.today(), texto)
+            self._reportes.move_to_end(chat_id)
+            while len(self._reportes) > self.maximo:
+                self._reportes.popitem(last=False)
+
+    def invalidar(self, chat_id: str):
+        with self._lock:
+            self._reportes.pop(chat_id, None)
+
+    def descartar_si(self, condicion) -> int:
+        """Saca los chats para los que condicion(chat_id) es verdad; devuelve cuántos"""
+        with self._lock:
+            fuera = [chat_id for chat_id in self._reportes if condicion(chat_id)]
+            for chat_id in fuera:
+                del self._reportes[chat_id]
+        return len(fuera)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._reportes)
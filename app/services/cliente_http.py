@@ -0,0 +1,119 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from .perezoso import Perezoso
+
+class ClienteHTTP:
+    """Cliente HTTP compartido (Telegram, Open-Meteo) con pool de conexiones,
+    límite de concurrencia por host, timeouts y reintentos con backoff."""
+
+    ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+    def __init__(self):
+        self.timeout_conexion = float(os.getenv("HTTP_TIMEOUT_CONEXION", "3.05"))
+        self.timeout_lectura = float(os.getenv("HTTP_TIMEOUT_LECTURA", "10"))
+        self.reintentos = int(os.getenv("HTTP_REINTENTOS", "3"))
+        self.backoff_base = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("HTTP_BACKOFF_MAX", "10"))
+        # Un Retry-After más largo que esto no se espera: se devuelve la respuesta tal cual
+        self.retry_after_max = float(os.getenv("HTTP_RETRY_AFTER_MAX", "30"))
+        self.max_por_host = int(os.getenv("HTTP_MAX_POR_HOST", "20"))
+
+        # Conexiones keep-alive reutilizadas: sin handshake TLS por cada mensaje
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=10, pool_maxsize=self.max_por_host)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+        self._semaforos = {}
+        self._lock = threading.Lock()
+
+    def _semaforo(self, url: str) -> threading.BoundedSemaphore:
+        """Semáforo por host pa' no pasarnos de conexiones simultáneas"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaforos:
+                self._semaforos[host] = threading.BoundedSemaphore(self.max_por_host)
+            return self._semaforos[host]
+
+    def _espera_reintento(self, intento: int, response=None) -> float | None:
+        """
+        Backoff exponencial con jitter. Retry-After y retry_after de Telegram
+        se respetan tal cual (reintentar antes solo gana otro 429); None si
+        piden esperar más de HTTP_RETRY_AFTER_MAX.
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is None:
+                try:
+                    retry_after = response.json().get("parameters", {}).get("retry_after")
+                except ValueError:
+                    retry_after = None
+            if retry_after is not None:
+                try:
+                    retry_after = float(retry_after)
+                except (TypeError, ValueError):
+                    retry_after = None
+                if retry_after is not None:
+                    return retry_after if retry_after <= self.retry_after_max else None
+        espera = min(self.backoff_base * (2 ** intento), self.backoff_max)
+        return random.uniform(0, espera)
+
+    def solicitar(self, metodo: str, url: str, reintentos: int | None = None, **kwargs) -> requests.Response:
+        """
+        Hace la petición con reintentos. Los POST solo se reintentan si la
+        conexión no llegó a establecerse o el servidor respondió 429/5xx,
+        pa' no duplicar mensajes ya entregados. Si un 429 pide esperar más de
+        HTTP_RETRY_AFTER_MAX se devuelve sin reintentar (el que llama falla).
+        """
+        reintentos = self.reintentos if reintentos is None else reintentos
+        kwargs.setdefault("timeout", (self.timeout_conexion, self.timeout_lectura))
+        idempotente = metodo.upper() in ("GET", "HEAD")
+        semaforo = self._semaforo(url)
+
+        intento = 0
+        while True:
+            try:
+                with semaforo:
+                    response = self.session.request(metodo, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Un ReadTimeout en un POST puede significar que el mensaje sí llegó
+                reintentable = idempotente or not isinstance(e, requests.exceptions.ReadTimeout)
+                if intento >= reintentos or not reintentable:
+                    raise
+                time.sleep(self._espera_reintento(intento))
+                intento += 1
+                continue
+
+            if response.status_code in self.ESTADOS_REINTENTABLES and intento < reintentos:
+                espera = self._espera_reintento(intento, response)
+                if espera is not None:
+                    time.sleep(espera)
+                    intento += 1
+                    continue
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.solicitar("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.solicitar("POST", url, **kwargs)
+
+    async def get_async(self, url: str, **kwargs) -> requests.Response:
+        """Versión async: corre en un hilo pa' no bloquear el event loop"""
+        return await asyncio.to_thread(self.solicitar, "GET", url, **kwargs)
+
+    async def post_async(self, url: str, **kwargs) -> requests.Response:
+        """Versión async: corre en un hilo pa' no bloquear el event loop"""
+        return await asyncio.to_thread(self.solicitar, "POST", url, **kwargs)
+
+    def cerrar(self):
+        """Cierra las conexiones del pool"""
+        self.session.close()
+
+cliente_http = Perezoso(ClienteHTTP)
@@ -1,37 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
 import requests
+from .cliente_http import cliente_http
+from .metricas import metricas
+from .perezoso import Perezoso
+from .pronosticos import VARIABLES_DIARIAS, VARIABLES_HORARIAS, almacen_pronosticos
 
 class ClimaService:
+    VARIABLES_DIARIAS = "temperature_2m_max,precipitation_sum,relative_humidity_2m_mean,precipitation_probability_max"
+
     def __init__(self):
-        self.BASE_URL = "https://api.open-meteo.com/v1/forecast"
+        self.BASE_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+        self.lote_zonas = int(os.getenv("CLIMA_LOTE_ZONAS", "50"))
+        # Días del pronóstico que acompañan al de hoy (proximos_dias)
+        self.dias_ventana = int(os.getenv("CLIMA_DIAS_VENTANA", "3"))
+        # local: leer de pronosticos_diarios (tasks/ingerir_pronosticos.py) y
+        # llamar a Open-Meteo solo si la zona no tiene el día de hoy guardado
+        self.fuente_local = os.getenv("CLIMA_FUENTE", "api") == "local"
+
+        # Cache de pronósticos por zona: todos los agricultores de la misma zona
+        # reciben el mismo pronóstico diario, así que una sola llamada basta.
+        self.cache_ttl = int(os.getenv("CLIMA_CACHE_TTL", "1800"))
+        self.cache_stale = int(os.getenv("CLIMA_CACHE_STALE", "10800"))
+        # Las claves por coordenadas (lugares sueltos) no tienen fin: se desalojan las menos usadas
+        self.cache_max = int(os.getenv("CLIMA_CACHE_MAX", "5000"))
+        self._cache = OrderedDict()
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+        self._contadores = {
+            "hits": 0, "misses": 0, "stale": 0, "coalescidas": 0, "llamadas_api": 0, "zonas_en_lote": 0, "errores": 0,
+            "lecturas_locales": 0
+        }
+
+    def _clave_cache(self, lat: float, lon: float, zona_id: int | None) -> tuple:
+        """Clave por zona si la conocemos, si no por coordenadas redondeadas (~1 km)"""
+        if zona_id is not None:
+            return ("zona", zona_id)
+        return ("coord", round(lat, 2), round(lon, 2))
+
+    def _guardar(self, clave: tuple, datos: dict):
+        """Guarda en el cache (con self._lock tomado) y desaloja las claves menos usadas"""
+        self._cache[clave] = {"datos": datos, "obtenido": time.monotonic(), "fecha": date.today()}
+        self._cache.move_to_end(clave)
+        while len(self._cache) > self.cache_max:
+            self._cache.popitem(last=False)
+
+    def _leer(self, clave: tuple) -> dict | None:
+        """Entrada del cache (con self._lock tomado), marcada como usada"""
+        entrada = self._cache.get(clave)
+        if entrada is not None:
+            self._cache.move_to_end(clave)
+        return entrada
+
+    @metricas.medido("clima")
+    def obtener_clima_actual(self, lat: float, lon: float, zona_id: int | None = None) -> dict | None:
+        """
+        Devuelve el resumen climático de hoy (más proximos_dias) usando el
+        cache por zona.
+        Si el dato está vencido pero dentro de la ventana stale, se sirve igual
+        y se refresca en segundo plano; llamadas simultáneas comparten una sola
+        petición a Open-Meteo.
+        """
+        clave = self._clave_cache(lat, lon, zona_id)
+        ahora = time.monotonic()
+
+        with self._lock:
+            entrada = self._leer(clave)
+            if entrada and entrada["fecha"] == date.today():
+                edad = ahora - entrada["obtenido"]
+                if edad < self.cache_ttl:
+                    self._contadores["hits"] += 1
+                    return entrada["datos"]
+                if edad < self.cache_ttl + self.cache_stale:
+                    self._contadores["stale"] += 1
+                    if clave not in self._en_vuelo:
+                        self._en_vuelo[clave] = threading.Event()
+                        threading.Thread(
+                            target=self._refrescar, args=(clave, lat, lon), daemon=True
+                        ).start()
+                    return entrada["datos"]
+
+            evento = self._en_vuelo.get(clave)
+            lider = evento is None
+            if lider:
+                self._contadores["misses"] += 1
+                evento = threading.Event()
+                self._en_vuelo[clave] = evento
+            else:
+                self._contadores["coalescidas"] += 1
+
+        if lider:
+            return self._refrescar(clave, lat, lon)
+
+        # Otra petición ya está buscando este pronóstico: esperamos su resultado
+        evento.wait(timeout=30)
+        with self._lock:
+            entrada = self._cache.get(clave)
+        if entrada and entrada["fecha"] == date.today():
+            return entrada["datos"]
+        return None
 
-    def obtener_clima_actual(self, lat: float, lon: float) -> dict | None:
+    def _refrescar(self, clave: tuple, lat: float, lon: float) -> dict | None:
+        """Consulta la API y guarda el resultado en cache, liberando a quienes esperan"""
+        try:
+            datos = None
+            if self.fuente_local and clave[0] == "zona":
+                datos = self._leer_local([clave[1]]).get(clave[1])
+            if datos is None:
+                datos = self._consultar_api(lat, lon)
+            with self._lock:
+                if datos:
+                    self._guardar(clave, datos)
+                else:
+                    self._contadores["errores"] += 1
+                    entrada = self._cache.get(clave)
+                    # Si falla el refresco, seguimos sirviendo el dato de hoy que ya teníamos
+                    if entrada and entrada["fecha"] == date.today():
+                        datos = entrada["datos"]
+            return datos
+        finally:
+            with self._lock:
+                evento = self._en_vuelo.pop(clave, None)
+            if evento:
+                evento.set()
+
+    @metricas.medido("clima_api")
+    def _consultar_api(self, lat: float, lon: float) -> dict | None:
         """
-        Obtiene un resumen climático completo para las próximas 24 horas.
+        Obtiene el resumen climático de hoy y de los días de la ventana.
         """
         params = {
             "latitude": lat,
             "longitude": lon,
-            "daily": "temperature_2m_max,precipitation_sum,relative_humidity_2m_mean,precipitation_probability_max",
+            "daily": self.VARIABLES_DIARIAS,
             "timezone": "auto",
-            "forecast_days": 1 # Solo necesitamos el pronóstico para HOY
+            "forecast_days": self.dias_ventana
         }
 
+        with self._lock:
+            self._contadores["llamadas_api"] += 1
+
         try:
-            response = requests.get(self.BASE_URL, params=params)
+            response = cliente_http.get(self.BASE_URL, params=params)
             response.raise_for_status()
             data = response.json()
-            
-            resumen_diario = data.get("daily")
-            if not resumen_diario:
-                return None
-
-            # Extraemos los datos del primer (y único) día del pronóstico
-            return {
-                "temperatura_max_24h": resumen_diario.get("temperature_2m_max", [0])[0],
-                "lluvia_24h": resumen_diario.get("precipitation_sum", [0])[0],
-                "humedad_media": resumen_diario.get("relative_humidity_2m_mean", [0])[0],
-                "prob_lluvia": resumen_diario.get("precipitation_probability_max", [0])[0]
-            }
+
+            return self._parsear_diario(data)
 
         except requests.exceptions.RequestException as e:
             print(f"Error al contactar la API de Open-Meteo: {e}")
@@ -40,4 +157,165 @@ class ClimaService:
             print(f"Error procesando la respuesta de la API del clima: {e}")
             return None
 
-clima_service = ClimaService()
\ No newline at end of file
+    def _parsear_diario(self, data: dict) -> dict | None:
+        """Resumen del primer día de una respuesta de Open-Meteo, con los siguientes en proximos_dias"""
+        resumen_diario = data.get("daily")
+        if not resumen_diario:
+            return None
+
+        def valor(variable: str, i: int):
+            valores = resumen_diario.get(variable) or []
+            return valores[i] if i < len(valores) else None
+
+        # El primer día es hoy
+        return {
+            "temperatura_max_24h": resumen_diario.get("temperature_2m_max", [0])[0],
+            "lluvia_24h": resumen_diario.get("precipitation_sum", [0])[0],
+            "humedad_media": resumen_diario.get("relative_humidity_2m_mean", [0])[0],
+            "prob_lluvia": resumen_diario.get("precipitation_probability_max", [0])[0],
+            "proximos_dias": [
+                {
+                    "fecha": date.fromisoformat(fecha),
+                    "temperatura_max": valor("temperature_2m_max", i),
+                    "lluvia": valor("precipitation_sum", i),
+                    "humedad_media": valor("relative_humidity_2m_mean", i),
+                    "prob_lluvia": valor("precipitation_probability_max", i)
+                }
+                for i, fecha in enumerate(resumen_diario.get("time", [])) if i > 0
+            ]
+        }
+
+    def _leer_local(self, zona_ids: list) -> dict:
+        """{zona_id: datos} de hoy desde el almacén de pronósticos; las zonas sin datos no aparecen"""
+        from config.database import sesion  # Solo hace falta con CLIMA_FUENTE=local
+
+        try:
+            with sesion() as db:
+                datos = almacen_pronosticos.resumenes(db, zona_ids, date.today(), self.dias_ventana)
+        except Exception as e:
+            print(f"Error leyendo pronósticos guardados: {e}")
+            return {}
+        with self._lock:
+            self._contadores["lecturas_locales"] += 1
+        return datos
+
+    def obtener_clima_zonas(self, zonas: list, forzar: bool = False) -> dict:
+        """
+        Clima de hoy pa' varias zonas a la vez. Open-Meteo acepta listas de
+        coordenadas separadas por coma, así que se piden en lotes de
+        CLIMA_LOTE_ZONAS zonas por llamada. `zonas` es una lista de dicts con
+        id, latitud y longitud; devuelve {zona_id: datos o None} y deja todo
+        en el cache. Sin `forzar`, las zonas con dato fresco no se piden.
+        """
+        resultado = {}
+        pendientes = []
+        ahora = time.monotonic()
+        with self._lock:
+            for zona in zonas:
+                entrada = self._leer(("zona", zona["id"]))
+                if (not forzar and entrada and entrada["fecha"] == date.today()
+                        and ahora - entrada["obtenido"] < self.cache_ttl):
+                    self._contadores["hits"] += 1
+                    resultado[zona["id"]] = entrada["datos"]
+                else:
+                    pendientes.append(zona)
+
+        if self.fuente_local and pendientes:
+            locales = self._leer_local([zona["id"] for zona in pendientes])
+            with self._lock:
+                for zona_id, datos in locales.items():
+                    self._guardar(("zona", zona_id), datos)
+                    resultado[zona_id] = datos
+            pendientes = [zona for zona in pendientes if zona["id"] not in locales]
+
+        for i in range(0, len(pendientes), self.lote_zonas):
+            lote = pendientes[i:i + self.lote_zonas]
+            datos_lote = self._consultar_api_lote(lote)
+            with self._lock:
+                for zona, datos in zip(lote, datos_lote):
+                    clave = ("zona", zona["id"])
+                    if datos:
+                        self._guardar(clave, datos)
+                    else:
+                        entrada = self._cache.get(clave)
+                        if entrada and entrada["fecha"] == date.today():
+                            datos = entrada["datos"]
+                    resultado[zona["id"]] = datos
+        return resultado
+
+    def _consultar_api_lote(self, zonas: list) -> list:
+        """Una sola llamada a Open-Meteo pa' todas las zonas del lote, en el mismo orden"""
+        respuestas = self._pedir_lote(zonas, {"daily": self.VARIABLES_DIARIAS, "forecast_days": self.dias_ventana})
+        try:
+            return [self._parsear_diario(r) if r else None for r in respuestas]
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Error procesando la respuesta de la API del clima: {e}")
+            return [None] * len(zonas)
+
+    def consultar_pronosticos(self, zonas: list, dias: int) -> list:
+        """
+        Pronóstico completo (diario y por hora) de `dias` días pa' cada zona,
+        tal como lo devuelve Open-Meteo, en el mismo orden (None si falló su
+        lote). Es lo que guarda tasks/ingerir_pronosticos.py; no pasa por el cache.
+        """
+        respuestas = []
+        for i in range(0, len(zonas), self.lote_zonas):
+            respuestas += self._pedir_lote(zonas[i:i + self.lote_zonas], {
+                "daily": VARIABLES_DIARIAS, "hourly": VARIABLES_HORARIAS, "forecast_days": dias
+            })
+        return respuestas
+
+    @metricas.medido("clima_api")
+    def _pedir_lote(self, zonas: list, variables: dict) -> list:
+        """Una llamada a Open-Meteo con varias coordenadas; respuestas crudas en el orden de las zonas"""
+        params = {
+            "latitude": ",".join(str(zona["latitud"]) for zona in zonas),
+            "longitude": ",".join(str(zona["longitud"]) for zona in zonas),
+            "timezone": "auto",
+            **variables
+        }
+
+        with self._lock:
+            self._contadores["llamadas_api"] += 1
+            self._contadores["zonas_en_lote"] += len(zonas)
+
+        try:
+            response = cliente_http.get(self.BASE_URL, params=params)
+            response.raise_for_status()
+            data = response.json()
+            # Con una sola coordenada Open-Meteo devuelve un objeto, con varias una lista
+            respuestas = data if isinstance(data, list) else [data]
+            if len(respuestas) != len(zonas):
+                raise ValueError(f"Se pidieron {len(zonas)} zonas y llegaron {len(respuestas)}")
+            return respuestas
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error al contactar la API de Open-Meteo: {e}")
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Error procesando la respuesta de la API del clima: {e}")
+        with self._lock:
+            self._contadores["errores"] += 1
+        return [None] * len(zonas)
+
+    def precalentar_cache(self, zonas: list) -> int:
+        """Refresca el clima de todas las zonas; devuelve cuántas quedaron con datos"""
+        resultado = self.obtener_clima_zonas(zonas, forzar=True)
+        return sum(1 for datos in resultado.values() if datos)
+
+    def estadisticas_cache(self) -> dict:
+        """Contadores del cache de clima (hits, misses, stale, coalescidas, llamadas a la API)"""
+        with self._lock:
+            stats = dict(self._contadores)
+            stats["zonas_en_cache"] = len(self._cache)
+        return stats
+
+    def limpiar_cache(self):
+        """Vacía el cache de pronósticos"""
+        with self._lock:
+            self._cache.clear()
+
+clima_service = Perezoso(ClimaService)
+metricas.medidor(
+    "conuco_cache_clima", "Contadores del cache de clima",
+    lambda: clima_service.estadisticas_cache() if clima_service.construido else {}
+)
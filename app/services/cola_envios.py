@@ -0,0 +1,372 @@
+"""
+Cola de envíos a Telegram (TELEGRAM_ENVIOS=cola).
+
+Las respuestas y la difusión no salen directo: se encolan y un despachador
+las suelta respetando los límites de Telegram (TELEGRAM_LIMITE_GLOBAL
+mensajes/s en total y TELEGRAM_LIMITE_CHAT por chat). Las respuestas a
+mensajes (INTERACTIVO) pasan delante de la difusión (DIFUSION).
+
+El turno de cada chat se toma al despachar, no al encolar: así, si
+Telegram responde 429 y se pausa el chat por lo que diga retry_after, los
+mensajes que ya estaban en cola pa' ese chat también esperan; el que
+recibió el 429 se reprograma; si llegan varios 429 en el mismo segundo
+(ENVIOS_429_GLOBAL) se pausa también el cubo global, porque el límite que
+se pasó es el del bot; los 5xx y los errores de conexión se
+reintentan con backoff exponencial hasta ENVIOS_REINTENTOS veces. Lo que no
+se pudo entregar (o Telegram rechaza con 4xx, p. ej. el usuario bloqueó el
+bot) va a la tabla de fallidos (ENVIOS_FALLIDOS_BACKEND: memoria o sql).
+Un timeout de lectura va directo a fallidos sin reintentar, igual que en
+cliente_http: el mensaje pudo haber llegado y repetirlo le duplica el
+mensaje al agricultor.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from sqlalchemy import text
+from .limitador import CuboTokens, LimitadorPorClave
+from .metricas import metricas
+
+INTERACTIVO = 0
+DIFUSION = 1
+
+
+class Envio:
+    __slots__ = ("chat_id", "texto", "prioridad", "al_terminar", "intentos", "encolado", "ultimo_error")
+
+    def __init__(self, chat_id: str, texto: str, prioridad: int, al_terminar=None):
+        self.chat_id = chat_id
+        self.texto = texto
+        self.prioridad = prioridad
+        self.al_terminar = al_terminar
+        self.intentos = 0
+        self.encolado = time.monotonic()
+        self.ultimo_error = None
+
+
+class AlmacenFallidos(ABC):
+    """Dónde quedan los envíos que no se pudieron entregar"""
+
+    @abstractmethod
+    def guardar(self, envio: Envio):
+        ...
+
+    @abstractmethod
+    def pendientes(self, limite: int) -> list:
+        """Saca hasta `limite` fallidos pa' reintentarlos: [(chat_id, texto)]"""
+
+
+class AlmacenFallidosMemoria(AlmacenFallidos):
+    """Los últimos `maximo` fallidos del proceso (pruebas locales)"""
+
+    def __init__(self, maximo: int = 10_000):
+        self._fallidos = deque(maxlen=maximo)
+        self._lock = threading.Lock()
+
+    def guardar(self, envio: Envio):
+        with self._lock:
+            self._fallidos.append((envio.chat_id, envio.texto, envio.intentos, envio.ultimo_error))
+
+    def pendientes(self, limite: int) -> list:
+        with self._lock:
+            sacados = [self._fallidos.popleft() for _ in range(min(limite, len(self._fallidos)))]
+        return [(chat_id, texto) for chat_id, texto, _, _ in sacados]
+
+
+class AlmacenFallidosSQL(AlmacenFallidos):
+    """
+    Tabla envios_fallidos (migrations/009_envios_fallidos.sql); sobrevive
+    reinicios y se puede revisar a mano
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def guardar(self, envio: Envio):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO envios_fallidos (chat_id, texto, intentos, ultimo_error)
+                VALUES (:c, :t, :i, :e)
+            """), {"c": envio.chat_id, "t": envio.texto, "i": envio.intentos, "e": envio.ultimo_error})
+
+    def pendientes(self, limite: int) -> list:
+        with self.engine.begin() as conn:
+            filas = conn.execute(text("""
+                UPDATE envios_fallidos SET reenviado_en = now()
+                WHERE id IN (
+                    SELECT id FROM envios_fallidos WHERE reenviado_en IS NULL
+                    ORDER BY id LIMIT :n FOR UPDATE SKIP LOCKED
+                )
+                RETURNING chat_id, texto
+            """), {"n": limite}).fetchall()
+        return [(fila.chat_id, fila.texto) for fila in filas]
+
+
+def crear_almacen_fallidos() -> AlmacenFallidos:
+    """Elige el backend según ENVIOS_FALLIDOS_BACKEND (memoria o sql)"""
+    if os.getenv("ENVIOS_FALLIDOS_BACKEND", "memoria") == "sql":
+        from config.database import engine
+        return AlmacenFallidosSQL(engine)
+    return AlmacenFallidosMemoria()
+
+
+def _retry_after(response) -> float | None:
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after"))
+    except (TypeError, ValueError, AttributeError):
+        pass
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ColaEnvios:
+    """
+    `funcion_envio(chat_id, texto)` hace un solo intento y devuelve la
+    respuesta HTTP (o lanza si no hubo conexión); los reintentos los maneja
+    la cola sin dejar un hilo dormido por cada mensaje.
+    """
+
+    def __init__(self, funcion_envio, almacen_fallidos: AlmacenFallidos | None = None):
+        self.funcion_envio = funcion_envio
+        self.fallidos = almacen_fallidos or crear_almacen_fallidos()
+        self.hilos = int(os.getenv("ENVIOS_HILOS", "8"))
+        self.reintentos = int(os.getenv("ENVIOS_REINTENTOS", "5"))
+        self.backoff_base = float(os.getenv("ENVIOS_BACKOFF_BASE", "1"))
+        self.backoff_max = float(os.getenv("ENVIOS_BACKOFF_MAX", "60"))
+        self.limite_global = CuboTokens(float(os.getenv("TELEGRAM_LIMITE_GLOBAL", "30")))
+        self.limite_chat = LimitadorPorClave(float(os.getenv("TELEGRAM_LIMITE_CHAT", "1")))
+        self.umbral_429_global = int(os.getenv("ENVIOS_429_GLOBAL", "3"))
+        self._ultimos_429 = deque(maxlen=self.umbral_429_global)
+
+        # Un heap por prioridad: (listo_en, secuencia, envío)
+        self._colas = {INTERACTIVO: [], DIFUSION: []}
+        self._secuencia = itertools.count()
+        # Chats sin turno: {chat_id: (el que espera en el heap, deque de los que van detrás)}
+        self._esperando = {}
+        self._en_curso = 0
+        self._condicion = threading.Condition()
+        self._pool = None
+        self._despachador = None
+        # Los envíos esperan en el heap (donde cuenta la prioridad), no en el pool
+        self._cupo = threading.BoundedSemaphore(self.hilos)
+
+        self.resultados = metricas.contador(
+            "conuco_envios_total", "Intentos de envío a Telegram por resultado"
+        )
+        self.latencia = metricas.histograma(
+            "conuco_envio_cola_segundos", "Desde que se encola hasta que Telegram lo acepta, por prioridad",
+            buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+        )
+        metricas.medidor(
+            "conuco_envios_pendientes", "Envíos esperando en la cola o en vuelo", self.estadisticas
+        )
+
+    def _iniciar(self):
+        if self._despachador is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="envio")
+        self._despachador = threading.Thread(target=self._despachar, daemon=True)
+        self._despachador.start()
+
+    def encolar(self, chat_id: str, texto: str, prioridad: int = INTERACTIVO, al_terminar=None):
+        """`al_terminar(entregado: bool)` se llama cuando el envío se entrega o se da por fallido"""
+        self._programar(Envio(str(chat_id), texto, prioridad, al_terminar), 0)
+
+    def _programar(self, envio: Envio, espera: float):
+        with self._condicion:
+            self._iniciar()
+            heapq.heappush(
+                self._colas[envio.prioridad], (time.monotonic() + espera, next(self._secuencia), envio)
+            )
+            self._condicion.notify_all()
+
+    def _siguiente(self) -> Envio:
+        """
+        Saca el próximo envío listo, dando preferencia a los interactivos. Si
+        su chat no tiene turno (límite por chat o pausado por un 429) vuelve
+        al heap pa' cuando lo tenga; mientras tanto los demás envíos de ese
+        chat esperan detrás de él, en orden, fuera del heap.
+        """
+        with self._condicion:
+            while True:
+                ahora = time.monotonic()
+                proximo = None
+                for prioridad in (INTERACTIVO, DIFUSION):
+                    cola = self._colas[prioridad]
+                    while cola and cola[0][0] <= ahora:
+                        _, _, envio = heapq.heappop(cola)
+                        if self._con_turno(envio, ahora):
+                            self._en_curso += 1
+                            return envio
+                    if cola and (proximo is None or cola[0][0] < proximo):
+                        proximo = cola[0][0]
+                self._condicion.wait(None if proximo is None else proximo - ahora)
+
+    def _con_turno(self, envio: Envio, ahora: float) -> bool:
+        """
+        True si el envío puede salir ya (y le toma el turno a su chat). Si
+        no, queda esperando: el primero de su chat en el heap y los que
+        llegan detrás en self._esperando[chat_id].
+        """
+        primero, detras = self._esperando.get(envio.chat_id, (None, None))
+        if primero is not None and envio is not primero:
+            detras.append(envio)
+            return False
+        cubo = self.limite_chat.cubo(envio.chat_id)
+        if not cubo.intentar():
+            self._esperando[envio.chat_id] = (envio, detras if detras is not None else deque())
+            heapq.heappush(self._colas[envio.prioridad], (ahora + cubo.falta(), next(self._secuencia), envio))
+            return False
+        if detras:
+            siguiente = detras.popleft()
+            self._esperando[envio.chat_id] = (siguiente, detras)
+            heapq.heappush(
+                self._colas[siguiente.prioridad], (ahora + cubo.falta(), next(self._secuencia), siguiente)
+            )
+        elif primero is not None:
+            del self._esperando[envio.chat_id]
+        return True
+
+    def _despachar(self):
+        while True:
+            self._cupo.acquire()
+            envio = self._siguiente()
+            # El cubo global marca el paso del despachador: ~30 envíos/s
+            self.limite_global.esperar()
+            self._pool.submit(self._enviar, envio)
+
+    def _enviar(self, envio: Envio):
+        envio.intentos += 1
+        try:
+            try:
+                response = self.funcion_envio(envio.chat_id, envio.texto)
+            except requests.exceptions.ConnectionError as e:
+                # No se llegó a Telegram (incluye ConnectTimeout): reintentar no duplica
+                envio.ultimo_error = str(e)
+                self._reintentar(envio)
+                return
+            except Exception as e:
+                # ReadTimeout y demás: no se sabe si llegó, mejor a fallidos que repetido
+                envio.ultimo_error = f"{type(e).__name__}: {e}"
+                self._fallar(envio)
+                return
+
+            if response.status_code == 200:
+                self.resultados.sumar(resultado="entregado")
+                self.latencia.observar(
+                    time.monotonic() - envio.encolado,
+                    prioridad="interactivo" if envio.prioridad == INTERACTIVO else "difusion"
+                )
+                self._avisar(envio, True)
+            elif response.status_code == 429:
+                self.resultados.sumar(resultado="429")
+                espera = _retry_after(response) or self.backoff_base
+                envio.ultimo_error = f"429 retry_after={espera}"
+                self.limite_chat.cubo(envio.chat_id).pausar(espera)
+                if self._rafaga_429():
+                    self.limite_global.pausar(espera)
+                if envio.intentos > self.reintentos:
+                    self._fallar(envio)
+                else:
+                    self._reprogramar_primero(envio, espera)
+            elif response.status_code >= 500:
+                envio.ultimo_error = f"HTTP {response.status_code}"
+                self._reintentar(envio)
+            else:
+                # 400/403: chat inexistente, bot bloqueado... reintentar no sirve
+                envio.ultimo_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                self._fallar(envio)
+        finally:
+            self._cupo.release()
+            with self._condicion:
+                self._en_curso -= 1
+                self._condicion.notify_all()
+
+    def _reprogramar_primero(self, envio: Envio, espera: float):
+        """Después de un 429 el envío vuelve adelante de los de su chat que esperan turno"""
+        with self._condicion:
+            primero, detras = self._esperando.get(envio.chat_id, (None, deque()))
+            if primero is not None:
+                cola = self._colas[primero.prioridad]
+                cola[:] = [entrada for entrada in cola if entrada[2] is not primero]
+                heapq.heapify(cola)
+                detras.appendleft(primero)
+            self._esperando[envio.chat_id] = (envio, detras)
+            heapq.heappush(
+                self._colas[envio.prioridad], (time.monotonic() + espera, next(self._secuencia), envio)
+            )
+            self._condicion.notify_all()
+
+    def _rafaga_429(self) -> bool:
+        """True si los últimos ENVIOS_429_GLOBAL 429 llegaron en menos de un segundo"""
+        ahora = time.monotonic()
+        with self._condicion:
+            self._ultimos_429.append(ahora)
+            return len(self._ultimos_429) == self._ultimos_429.maxlen and ahora - self._ultimos_429[0] < 1
+
+    def _reintentar(self, envio: Envio):
+        if envio.intentos > self.reintentos:
+            self._fallar(envio)
+            return
+        self.resultados.sumar(resultado="reintento")
+        espera = min(self.backoff_base * (2 ** (envio.intentos - 1)), self.backoff_max)
+        self._programar(envio, random.uniform(espera / 2, espera))
+
+    def _fallar(self, envio: Envio):
+        self.resultados.sumar(resultado="fallido")
+        print(f"Envío a {envio.chat_id} falló tras {envio.intentos} intentos: {envio.ultimo_error}")
+        try:
+            self.fallidos.guardar(envio)
+        except Exception as e:
+            print(f"Error guardando envío fallido de {envio.chat_id}: {e}")
+        self._avisar(envio, False)
+
+    def _avisar(self, envio: Envio, entregado: bool):
+        if envio.al_terminar is not None:
+            try:
+                envio.al_terminar(entregado)
+            except Exception as e:
+                print(f"Error en al_terminar del envío a {envio.chat_id}: {e}")
+
+    def reencolar_fallidos(self, limite: int = 1000) -> int:
+        """Vuelve a encolar (como difusión) fallidos guardados; devuelve cuántos"""
+        pendientes = self.fallidos.pendientes(limite)
+        for chat_id, texto in pendientes:
+            self.encolar(chat_id, texto, DIFUSION)
+        return len(pendientes)
+
+    def _en_cola(self) -> int:
+        return (sum(len(cola) for cola in self._colas.values())
+                + sum(len(detras) for _, detras in self._esperando.values()))
+
+    def pendientes(self) -> int:
+        with self._condicion:
+            return self._en_cola() + self._en_curso
+
+    def esperar_vacia(self, timeout: float | None = None) -> bool:
+        """Bloquea hasta que no quede nada por enviar; False si se acabó el timeout"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._condicion:
+            while self._en_cola() + self._en_curso:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._condicion.wait(restante)
+            return True
+
+    def estadisticas(self) -> dict:
+        with self._condicion:
+            return {
+                "interactivos": len(self._colas[INTERACTIVO]),
+                "difusion": len(self._colas[DIFUSION]),
+                "esperando_turno": sum(len(detras) for _, detras in self._esperando.values()),
+                "en_vuelo": self._en_curso
+            }
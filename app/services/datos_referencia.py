@@ -0,0 +1,238 @@
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_right
+from sqlalchemy import text
+from .enrutador import Enrutador, SINONIMOS_CULTIVOS
+from .nomenclator import ResolutorZonas, lugares
+
+# Etapas por defecto (día en que TERMINA cada etapa); se usan si la base no
+# tiene la tabla etapas_cultivo o no trae filas pa' ese cultivo.
+ETAPAS_POR_DEFECTO = {
+    "Tomate": [(30, "Crecimiento"), (55, "Floración"), (80, "Fructificación"), (float('inf'), "Cosecha")],
+    "Ají Cubanela": [(30, "Crecimiento"), (55, "Floración"), (80, "Fructificación"), (float('inf'), "Cosecha")],
+    "Banano": [(90, "Establecimiento"), (180, "Desarrollo"), (300, "Floración"), (float('inf'), "Fructificación")]
+}
+
+CULTIVOS_POR_DEFECTO = [
+    {"id": 1, "nombre": "Tomate", "codigo": "TOM", "dias_ciclo_promedio": 90},
+    {"id": 2, "nombre": "Ají Cubanela", "codigo": "AJI", "dias_ciclo_promedio": 120},
+    {"id": 3, "nombre": "Banano", "codigo": "BAN", "dias_ciclo_promedio": 365}
+]
+
+ZONAS_POR_DEFECTO = [
+    {"id": 1, "nombre": "Azua"},
+    {"id": 2, "nombre": "Santiago"},
+    {"id": 3, "nombre": "Constanza"},
+    {"id": 4, "nombre": "Hato Mayor"}
+]
+
+
+def _compilar_etapas(etapas: list) -> tuple:
+    """Lista de (límite, etapa) → (límites ordenados, etapas) pa' buscar con bisect"""
+    etapas = sorted(etapas, key=lambda e: e[0])
+    return [limite for limite, _ in etapas], [etapa for _, etapa in etapas]
+
+
+def _sinonimos_extra(cultivo: dict) -> list:
+    """Sinónimos de la columna cultivos.sinonimos (arreglo o texto separado por comas)"""
+    sinonimos = cultivo.get("sinonimos") or []
+    if isinstance(sinonimos, str):
+        sinonimos = sinonimos.split(",")
+    return [s.strip() for s in sinonimos if s and s.strip()]
+
+
+class DatosReferencia:
+    """
+    Catálogo en memoria: cultivos (con precios), zonas (con lat/lon) y etapas,
+    más el enrutador de nombres de cultivo (columna opcional cultivos.sinonimos)
+    y el resolutor de zonas por lugar o coordenadas (ver nomenclator.py).
+    Se carga de la base la primera vez, se refresca cada REFERENCIA_TTL
+    segundos y también cuando llega un NOTIFY por el canal 'datos_referencia'
+    (triggers de migrations/001 y 007): la primera carga arranca, una vez por
+    proceso, el hilo que escucha ese canal (REFERENCIA_NOTIFY=0 lo apaga).
+    """
+
+    CANAL_NOTIFY = "datos_referencia"
+
+    def __init__(self):
+        self.ttl = int(os.getenv("REFERENCIA_TTL", "600"))
+        self._lock = threading.Lock()
+        self._lock_async = None
+        self._cargado_en = None
+        self._invalidado = False
+        self._escuchando = False
+        self._aplicar(CULTIVOS_POR_DEFECTO, ZONAS_POR_DEFECTO, ETAPAS_POR_DEFECTO)
+
+    def _aplicar(self, cultivos: list, zonas: list, etapas: dict):
+        """Reemplaza el catálogo con diccionarios nuevos (nunca se ve uno a medio llenar)"""
+        self.cultivos = {c["id"]: c for c in cultivos}
+        self.cultivos_por_codigo = {c["codigo"]: c for c in cultivos}
+        self.menu = {
+            str(i): {"nombre": c["nombre"], "codigo": c["codigo"], "ciclo_dias": c["dias_ciclo_promedio"]}
+            for i, c in enumerate(cultivos, start=1)
+        }
+        self.enrutador_cultivos = Enrutador({
+            opcion: [c["codigo"], c["nombre"], *SINONIMOS_CULTIVOS.get(c["codigo"], []), *_sinonimos_extra(c)]
+            for opcion, c in zip(self.menu, cultivos)
+        })
+        self.zonas = {z["id"]: z for z in zonas}
+        self.resolutor_zonas = ResolutorZonas(zonas, lugares)
+        self.etapas = {nombre: _compilar_etapas(lista) for nombre, lista in etapas.items()}
+
+    def cargar(self, db):
+        """Lee el catálogo completo de la base"""
+        cultivos = [dict(fila) for fila in db.execute(text("SELECT * FROM cultivos ORDER BY id")).mappings()]
+        zonas = [dict(fila) for fila in db.execute(text("SELECT * FROM zonas_agroecologicas ORDER BY id")).mappings()]
+
+        etapas = dict(ETAPAS_POR_DEFECTO)
+        if db.execute(text("SELECT to_regclass('etapas_cultivo') IS NOT NULL")).scalar():
+            filas = db.execute(text("""
+                SELECT c.nombre, e.dia_limite, e.etapa
+                FROM etapas_cultivo e JOIN cultivos c ON c.id = e.cultivo_id
+            """)).fetchall()
+            por_cultivo = {}
+            for fila in filas:
+                limite = float('inf') if fila.dia_limite is None else fila.dia_limite
+                por_cultivo.setdefault(fila.nombre, []).append((limite, fila.etapa))
+            etapas.update(por_cultivo)
+
+        # Precios ya resumidos por tasks/ingerir_precios.py (migrations/007_precios.sql)
+        if db.execute(text("SELECT to_regclass('resumen_precios') IS NOT NULL")).scalar():
+            por_id = {cultivo["id"]: cultivo for cultivo in cultivos}
+            for fila in db.execute(text("SELECT * FROM resumen_precios")).mappings():
+                if fila["cultivo_id"] in por_id:
+                    por_id[fila["cultivo_id"]]["resumen_precio"] = dict(fila)
+
+        for zona in zonas:
+            zona.setdefault("nombre", next(
+                (z["nombre"] for z in ZONAS_POR_DEFECTO if z["id"] == zona["id"]), "Zona desconocida"
+            ))
+
+        self._aplicar(cultivos, zonas, etapas)
+        self._cargado_en = time.monotonic()
+        self._invalidado = False
+        self._iniciar_escucha()
+        print(f"Datos de referencia cargados: {len(cultivos)} cultivos, {len(zonas)} zonas")
+
+    def _vencido(self) -> bool:
+        return (self._cargado_en is None or self._invalidado
+                or time.monotonic() - self._cargado_en >= self.ttl)
+
+    def asegurar_cargado(self, db):
+        """Carga o refresca el catálogo si hace falta; barato cuando ya está al día"""
+        if not self._vencido():
+            return
+
+        # Si ya hay datos, solo un hilo refresca y los demás siguen con lo que hay
+        bloquear = self._cargado_en is None
+        if not self._lock.acquire(blocking=bloquear):
+            return
+        try:
+            if self._vencido():
+                self.cargar(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Error cargando datos de referencia: {e}")
+        finally:
+            self._lock.release()
+
+    async def asegurar_cargado_async(self, db):
+        """
+        asegurar_cargado pa' una AsyncSession. No usa el lock de hilos: run_sync
+        corre en el hilo del loop y bloquearlo ahí trancaría las demás tareas.
+        """
+        if not self._vencido():
+            return
+        if self._lock_async is None:
+            self._lock_async = asyncio.Lock()
+        if self._cargado_en is not None and self._lock_async.locked():
+            return
+        async with self._lock_async:
+            if not self._vencido():
+                return
+            try:
+                await db.run_sync(self.cargar)
+            except Exception as e:
+                await db.rollback()
+                print(f"Error cargando datos de referencia: {e}")
+
+    def invalidar(self):
+        """Marca el catálogo pa' recargarlo en el próximo uso"""
+        self._invalidado = True
+
+    def _iniciar_escucha(self):
+        """escuchar_cambios con el motor síncrono, la primera vez que se carga el catálogo"""
+        if self._escuchando or os.getenv("REFERENCIA_NOTIFY", "1") != "1":
+            return
+        self._escuchando = True
+        try:
+            # También en los procesos async: LISTEN va por psycopg2, en su propia conexión
+            from config.database import obtener_engine
+
+            engine = obtener_engine()
+        except Exception as e:
+            print(f"Sin escucha de cambios de referencia: {e}")
+            return
+        if engine.dialect.name == "postgresql":
+            self.escuchar_cambios(engine)
+
+    def escuchar_cambios(self, engine):
+        """
+        Hilo que hace LISTEN en PostgreSQL e invalida el catálogo con cada
+        NOTIFY datos_referencia (p. ej. desde un trigger en cultivos/zonas).
+        """
+        import select
+
+        def escuchar():
+            reconexion = False
+            while True:
+                try:
+                    # Conexión propia, fuera del pool: se queda escuchando pa' siempre
+                    crudo = engine.raw_connection()
+                    conn = crudo.driver_connection
+                    crudo.detach()
+                    conn.autocommit = True  # necesario pa' LISTEN
+                    conn.cursor().execute(f"LISTEN {self.CANAL_NOTIFY};")
+                    if reconexion:
+                        # Los NOTIFY de mientras estuvo caída se perdieron
+                        self.invalidar()
+                    reconexion = True
+                    while True:
+                        if select.select([conn], [], [], 60) == ([], [], []):
+                            continue
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.invalidar()
+                except Exception as e:
+                    print(f"Error escuchando cambios de referencia: {e}")
+                    time.sleep(5)
+
+        threading.Thread(target=escuchar, name="referencia-notify", daemon=True).start()
+
+    def cultivo(self, cultivo_id: int) -> dict | None:
+        return self.cultivos.get(cultivo_id)
+
+    def cultivo_por_codigo(self, codigo: str) -> dict | None:
+        return self.cultivos_por_codigo.get(codigo)
+
+    def zona(self, zona_id: int) -> dict | None:
+        return self.zonas.get(zona_id)
+
+    def nombre_zona(self, zona_id: int) -> str:
+        zona = self.zonas.get(zona_id)
+        return zona["nombre"] if zona else "Zona desconocida"
+
+    def etapa(self, cultivo: str, dias: int) -> str:
+        """Etapa del cultivo según los días desde la siembra"""
+        compilado = self.etapas.get(cultivo)
+        if not compilado:
+            return "Desarrollo"
+        limites, etapas = compilado
+        i = bisect_right(limites, dias)
+        return etapas[i] if i < len(etapas) else "Desarrollo"
+
+
+datos_referencia = DatosReferencia()
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class DeduplicadorUpdates(ABC):
+    """
+    Recuerda los update_id de Telegram ya recibidos por `ttl` segundos, pa'
+    descartar los que Telegram vuelve a mandar cuando tardamos en responder.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @abstractmethod
+    def visto(self, update_id: int) -> bool:
+        """True si ya está registrado y no ha vencido (no registra nada)"""
+
+    @abstractmethod
+    def nuevo(self, update_id: int) -> bool:
+        """Registra el update_id; True si no se había visto en la ventana"""
+
+    @abstractmethod
+    def olvidar(self, update_id: int):
+        """Lo saca del registro, pa' que el reintento de un update que falló sí se procese"""
+
+
+class DeduplicadorMemoria(DeduplicadorUpdates):
+    """LRU en el mismo proceso, con a lo sumo `maximo` ids"""
+
+    def __init__(self, ttl: int, maximo: int):
+        super().__init__(ttl)
+        self.maximo = maximo
+        self._vistos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora: float):
+        # Todos viven lo mismo: los vencidos están al principio
+        while self._vistos and next(iter(self._vistos.values())) <= ahora:
+            self._vistos.popitem(last=False)
+        while len(self._vistos) > self.maximo:
+            self._vistos.popitem(last=False)
+
+    def visto(self, update_id: int) -> bool:
+        with self._lock:
+            expira = self._vistos.get(update_id)
+            return expira is not None and expira > time.monotonic()
+
+    def nuevo(self, update_id: int) -> bool:
+        with self._lock:
+            ahora = time.monotonic()
+            expira = self._vistos.get(update_id)
+            if expira is not None and expira > ahora:
+                return False
+            self._vistos[update_id] = ahora + self.ttl
+            self._vistos.move_to_end(update_id)
+            self._purgar(ahora)
+            return True
+
+    def olvidar(self, update_id: int):
+        with self._lock:
+            self._vistos.pop(update_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purgar(time.monotonic())
+            return len(self._vistos)
+
+
+class DeduplicadorRedis(DeduplicadorUpdates):
+    """
+    Compartido entre workers y nodos con SET NX EX. Delante va el LRU en
+    memoria: un reintento que cae en el mismo proceso se descarta sin ir a
+    Redis. Si Redis falla se deja pasar el update (mejor repetido que perdido).
+    """
+
+    def __init__(self, ttl: int, maximo: int, redis_url: str, prefijo: str = "conuco:update"):
+        super().__init__(ttl)
+        import redis  # Solo hace falta con UPDATES_DEDUP_BACKEND=redis
+
+        self.redis = redis.Redis.from_url(redis_url)
+        self.prefijo = prefijo
+        self.local = DeduplicadorMemoria(ttl, maximo)
+
+    def _clave(self, update_id: int) -> str:
+        return f"{self.prefijo}:{update_id}"
+
+    def visto(self, update_id: int) -> bool:
+        if self.local.visto(update_id):
+            return True
+        try:
+            return bool(self.redis.exists(self._clave(update_id)))
+        except Exception as e:
+            print(f"Error consultando update_id {update_id} en Redis: {e}")
+            return False
+
+    def nuevo(self, update_id: int) -> bool:
+        if self.local.visto(update_id):
+            return False
+        self.local.nuevo(update_id)
+        try:
+            return bool(self.redis.set(self._clave(update_id), 1, nx=True, ex=self.ttl))
+        except Exception as e:
+            print(f"Error consultando update_id {update_id} en Redis: {e}")
+            return True
+
+    def olvidar(self, update_id: int):
+        self.local.olvidar(update_id)
+        try:
+            self.redis.delete(self._clave(update_id))
+        except Exception as e:
+            print(f"Error olvidando update_id {update_id} en Redis: {e}")
+
+
+def crear_deduplicador() -> DeduplicadorUpdates:
+    """Elige el backend según UPDATES_DEDUP_BACKEND (memoria o redis)"""
+    backend = os.getenv("UPDATES_DEDUP_BACKEND", "memoria")
+    # Telegram deja de reintentar mucho antes de una hora
+    ttl = int(os.getenv("UPDATES_DEDUP_TTL", "3600"))
+    maximo = int(os.getenv("UPDATES_DEDUP_MAX", "200000"))
+
+    if backend == "redis":
+        from config.settings import settings  # pydantic solo cuando hay redis
+
+        return DeduplicadorRedis(ttl, maximo, settings.redis_url)
+    return DeduplicadorMemoria(ttl, maximo)
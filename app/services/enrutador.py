@@ -0,0 +1,225 @@
+import re
+import unicodedata
+
+# Tabla pa' quitar tildes con str.translate (mucho más rápido que NFD + category
+# carácter por carácter). Cubre Latin-1 y Latin Extended-A, que es lo que
+# escriben los agricultores; lo demás cae al camino lento.
+_SIN_TILDES = {}
+for _codigo in range(0xC0, 0x180):
+    _base = ''.join(c for c in unicodedata.normalize('NFD', chr(_codigo)) if unicodedata.category(c) != 'Mn')
+    if _base != chr(_codigo):
+        _SIN_TILDES[_codigo] = _base
+
+
+_PALABRAS = re.compile(r"[A-Z0-9/]+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Mayúsculas, sin tildes y con un solo espacio entre palabras"""
+    texto = ' '.join(texto.upper().split())
+    if texto.isascii():
+        return texto
+    texto = texto.translate(_SIN_TILDES)
+    if texto.isascii():
+        return texto
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+def _distancia(a: str, b: str, maximo: int) -> int:
+    """
+    Distancia de edición (con trasposiciones: "REPOTRE" está a 1 de
+    "REPORTE") con corte: devuelve maximo + 1 en cuanto se pasa.
+    """
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    antepenultima, anterior = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        actual = [i]
+        for j, cb in enumerate(b, start=1):
+            valor = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb))
+            if antepenultima and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                valor = min(valor, antepenultima[j - 2] + 1)
+            actual.append(valor)
+        if min(actual) > maximo:
+            return maximo + 1
+        antepenultima, anterior = anterior, actual
+    return anterior[-1]
+
+
+def _borrados(palabra: str, veces: int) -> set:
+    """La palabra y todas las variantes con hasta `veces` letras borradas"""
+    variantes = frontera = {palabra}
+    for _ in range(veces):
+        frontera = {v[:i] + v[i + 1:] for v in frontera for i in range(len(v))}
+        variantes = variantes | frontera
+    return variantes
+
+
+# Marca de nodo compartido por varias intenciones
+_AMBIGUA = object()
+
+
+class _Nodo:
+    __slots__ = ("hijos", "intencion")
+
+    def __init__(self):
+        self.hijos = {}
+        # Intención común a todas las claves bajo este nodo; None si hay varias
+        self.intencion = None
+
+
+class Enrutador:
+    """
+    Tabla de intenciones compilada una sola vez: {intención: [sinónimos]}.
+
+    resolver(texto) prueba, en orden:
+      1. la clave exacta (ya normalizada),
+      2. un prefijo que solo lleve a una intención ("REPOR" → REPORTE),
+      3. la primera palabra ("REPORTE PORFA" → REPORTE),
+      4. errores de dedo: distancia de edición 1 (2 en palabras largas),
+         siempre que el mejor candidato no empate con otra intención.
+    Los resultados se recuerdan, porque los mensajes se repiten mucho.
+    """
+
+    PREFIJO_MINIMO = 3
+    MAX_MEMORIA = 4096
+    # En texto libre una palabra corta a una letra de un nombre es casualidad
+    # ("DEL RIO" → "EL RIO"), no un error de dedo
+    PALABRA_MINIMA_APROXIMADA = 4
+
+    def __init__(self, sinonimos: dict):
+        self.exactas = {}
+        for intencion, palabras in sinonimos.items():
+            for palabra in [intencion, *palabras]:
+                clave = normalizar_texto(str(palabra))
+                if clave:
+                    self.exactas.setdefault(clave, intencion)
+
+        self._raiz = _Nodo()
+        for clave, intencion in self.exactas.items():
+            self._insertar(clave, intencion)
+
+        # Índice de borrados (estilo SymSpell): dos palabras a distancia <= d
+        # comparten alguna variante con d letras borradas, así los errores de
+        # dedo no obligan a comparar contra todo el catálogo.
+        self._borrados = {}
+        for clave in self.exactas:
+            if len(clave) >= 3:
+                for variante in _borrados(clave, 2 if len(clave) >= 6 else 1):
+                    self._borrados.setdefault(variante, []).append(clave)
+
+        self._memoria = {}
+
+    def _insertar(self, clave: str, intencion):
+        nodo = self._raiz
+        for caracter in clave:
+            nodo = nodo.hijos.setdefault(caracter, _Nodo())
+            if nodo.intencion is None:
+                nodo.intencion = intencion
+            elif nodo.intencion != intencion:
+                nodo.intencion = _AMBIGUA
+
+    def _por_prefijo(self, clave: str):
+        if len(clave) < self.PREFIJO_MINIMO:
+            return None
+        nodo = self._raiz
+        for caracter in clave:
+            nodo = nodo.hijos.get(caracter)
+            if nodo is None:
+                return None
+        return None if nodo.intencion is _AMBIGUA else nodo.intencion
+
+    def _aproximada(self, clave: str):
+        if len(clave) < 4:
+            return None
+        maximo = 1 if len(clave) < 8 else 2
+        candidatas = {c for variante in _borrados(clave, maximo) for c in self._borrados.get(variante, ())}
+        mejor, intenciones = maximo + 1, set()
+        for candidata in candidatas:
+            distancia = _distancia(clave, candidata, maximo)
+            if distancia < mejor:
+                mejor, intenciones = distancia, {self.exactas[candidata]}
+            elif distancia == mejor and distancia <= maximo:
+                intenciones.add(self.exactas[candidata])
+        return intenciones.pop() if len(intenciones) == 1 else None
+
+    def _buscar(self, clave: str):
+        intencion = self.exactas.get(clave)
+        if intencion is not None:
+            return intencion
+        intencion = self._por_prefijo(clave)
+        if intencion is not None:
+            return intencion
+        primera = clave.split(' ', 1)[0]
+        if primera != clave:
+            intencion = self.exactas.get(primera)
+            if intencion is not None:
+                return intencion
+        return self._aproximada(clave)
+
+    def resolver(self, texto: str):
+        """Intención del texto, o None si no se parece a nada conocido"""
+        clave = normalizar_texto(texto)
+        try:
+            return self._memoria[clave]
+        except KeyError:
+            pass
+        intencion = self._buscar(clave)
+        if len(self._memoria) >= self.MAX_MEMORIA:
+            self._memoria.clear()
+        self._memoria[clave] = intencion
+        return intencion
+
+    def resolver_en_texto(self, texto: str, max_palabras: int = 5):
+        """Intención de la frase conocida dentro de un texto libre (ver buscar_en_texto)"""
+        return self.buscar_en_texto(texto, max_palabras)[0]
+
+    def buscar_en_texto(self, texto: str, max_palabras: int = 5) -> tuple:
+        """
+        Busca una frase conocida dentro de un texto libre ("paraje Tireo,
+        Constanza"); devuelve (intención, aproximada). Gana la frase exacta
+        más larga y, a igual largo, la que va más al final (el municipio
+        suele ir después del paraje). Si no hay exactas, se prueba por error
+        de dedo solo el texto completo y las frases de varias palabras
+        largas: una palabra suelta del texto ("vivo en SABANA") se parece a
+        demasiados nombres. Las aproximadas conviene confirmarlas.
+        """
+        clave = ("texto", normalizar_texto(texto))
+        try:
+            return self._memoria[clave]
+        except KeyError:
+            pass
+        palabras = _PALABRAS.findall(clave[1])
+        frases = [
+            " ".join(palabras[i:i + n])
+            for n in range(min(max_palabras, len(palabras)), 0, -1)
+            for i in range(len(palabras) - n, -1, -1)
+        ]
+        resultado = next(((self.exactas[f], False) for f in frases if f in self.exactas), (None, False))
+        if resultado[0] is None:
+            completo = " ".join(palabras)
+            candidatas = [
+                f for f in frases
+                if f == completo or (" " in f and min(map(len, f.split(" "))) >= self.PALABRA_MINIMA_APROXIMADA)
+            ]
+            resultado = next(((i, True) for i in map(self._aproximada, candidatas) if i is not None), (None, False))
+        if len(self._memoria) >= self.MAX_MEMORIA:
+            self._memoria.clear()
+        self._memoria[clave] = resultado
+        return resultado
+
+
+SINONIMOS_COMANDOS = {
+    "REGISTRO": ["REGISTRAR", "APUNTAR", "ANOTAR", "SEMBRE", "NUEVA SIEMBRA", "/REGISTRO"],
+    "REPORTE": ["CLIMA", "CLIMITA", "PRECIO", "PRECIOS", "TIEMPO", "INFORME", "COMO VA", "/REPORTE"],
+    "AYUDA": ["INFO", "INFORMACION", "/START", "/HELP", "HELP", "MENU", "/AYUDA"]
+}
+
+# Nombres populares y errores comunes por código de cultivo
+SINONIMOS_CULTIVOS = {
+    "TOM": ["TOMATE", "TOMATES", "TOMATICO", "TOMATE INDUSTRIAL", "TOMATE DE ENSALADA"],
+    "AJI": ["AJI", "AJIES", "CUBANELA", "AJI CUBANELA", "AJI MORRON", "PIMIENTO"],
+    "BAN": ["BANANO", "BANANA", "GUINEO", "GUINEOS", "PLATANO", "MUSACEA"]
+}
+
+enrutador_comandos = Enrutador(SINONIMOS_COMANDOS)
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date
+from sqlalchemy import text
+
+class AlmacenEstados(ABC):
+    """
+    Estado de las conversaciones en curso (flujo de REGISTRO) por chat_id.
+    Los estados abandonados vencen a los `ttl` segundos de su última escritura.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @abstractmethod
+    def obtener(self, chat_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def guardar(self, chat_id: str, estado: dict):
+        ...
+
+    @abstractmethod
+    def eliminar(self, chat_id: str):
+        ...
+
+    def __contains__(self, chat_id: str) -> bool:
+        return self.obtener(chat_id) is not None
+
+    def __getitem__(self, chat_id: str) -> dict:
+        estado = self.obtener(chat_id)
+        if estado is None:
+            raise KeyError(chat_id)
+        return estado
+
+    def __setitem__(self, chat_id: str, estado: dict):
+        self.guardar(chat_id, estado)
+
+    def __delitem__(self, chat_id: str):
+        self.eliminar(chat_id)
+
+
+def _serializar(estado: dict) -> str:
+    """JSON con soporte pa' las fechas que guarda el flujo de registro"""
+    def convertir(valor):
+        if isinstance(valor, date):
+            return {"__fecha__": valor.isoformat()}
+        raise TypeError(f"No se puede serializar {type(valor).__name__}")
+    return json.dumps(estado, default=convertir)
+
+
+def _deserializar(datos: str) -> dict:
+    def convertir(obj):
+        if "__fecha__" in obj:
+            return date.fromisoformat(obj["__fecha__"])
+        return obj
+    return json.loads(datos, object_hook=convertir)
+
+
+class AlmacenEstadosMemoria(AlmacenEstados):
+    """En el mismo proceso; sirve pa' un solo worker y pa' pruebas"""
+
+    def __init__(self, ttl: int):
+        super().__init__(ttl)
+        self._estados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora: float):
+        # Ordenados por última escritura: los vencidos están al principio
+        while self._estados:
+            chat_id, (expira, _) = next(iter(self._estados.items()))
+            if expira > ahora:
+                break
+            del self._estados[chat_id]
+
+    def obtener(self, chat_id: str) -> dict | None:
+        with self._lock:
+            entrada = self._estados.get(chat_id)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.monotonic():
+                del self._estados[chat_id]
+                return None
+            return entrada[1]
+
+    def guardar(self, chat_id: str, estado: dict):
+        with self._lock:
+            ahora = time.monotonic()
+            self._estados[chat_id] = (ahora + self.ttl, estado)
+            self._estados.move_to_end(chat_id)
+            self._purgar(ahora)
+
+    def eliminar(self, chat_id: str):
+        with self._lock:
+            self._estados.pop(chat_id, None)
+
+    def claves(self) -> list:
+        """chat_id con estado vigente (pa' pasarlos a otro nodo al rebalancear)"""
+        with self._lock:
+            self._purgar(time.monotonic())
+            return list(self._estados)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purgar(time.monotonic())
+            return len(self._estados)
+
+
+class AlmacenEstadosRedis(AlmacenEstados):
+    """Compartido entre workers y nodos; Redis se encarga del vencimiento"""
+
+    def __init__(self, ttl: int, redis_url: str, prefijo: str = "conuco:estado"):
+        super().__init__(ttl)
+        import redis  # Solo hace falta con ESTADOS_BACKEND=redis
+
+        self.redis = redis.Redis.from_url(redis_url)
+        self.prefijo = prefijo
+
+    def _clave(self, chat_id: str) -> str:
+        return f"{self.prefijo}:{chat_id}"
+
+    def obtener(self, chat_id: str) -> dict | None:
+        datos = self.redis.get(self._clave(chat_id))
+        return _deserializar(datos) if datos else None
+
+    def guardar(self, chat_id: str, estado: dict):
+        self.redis.setex(self._clave(chat_id), self.ttl, _serializar(estado))
+
+    def eliminar(self, chat_id: str):
+        self.redis.delete(self._clave(chat_id))
+
+
+class AlmacenEstadosSQL(AlmacenEstados):
+    """
+    Compartido a través de la base de datos. Funciona con PostgreSQL (necesita
+    migrations/008_estados_conversacion.sql) y con SQLite (p. ej. "sqlite://"
+    en memoria pa' pruebas locales, donde la tabla se crea al construirlo).
+    """
+
+    def __init__(self, ttl: int, engine, purgar_cada: int = 300):
+        from config.database import esquema_sqlite
+
+        super().__init__(ttl)
+        self.engine = engine
+        self.purgar_cada = purgar_cada
+        self._ultima_purga = time.time()
+        esquema_sqlite(engine, "008_estados_conversacion.sql")
+
+    def obtener(self, chat_id: str) -> dict | None:
+        with self.engine.connect() as conn:
+            fila = conn.execute(text(
+                "SELECT datos FROM estados_conversacion WHERE chat_id = :c AND expira_en > :ahora"
+            ), {"c": chat_id, "ahora": time.time()}).fetchone()
+        return _deserializar(fila[0]) if fila else None
+
+    def guardar(self, chat_id: str, estado: dict):
+        ahora = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO estados_conversacion (chat_id, datos, expira_en)
+                VALUES (:c, :d, :e)
+                ON CONFLICT (chat_id) DO UPDATE SET datos = excluded.datos, expira_en = excluded.expira_en
+            """), {"c": chat_id, "d": _serializar(estado), "e": ahora + self.ttl})
+            if ahora - self._ultima_purga > self.purgar_cada:
+                self._ultima_purga = ahora
+                conn.execute(text(
+                    "DELETE FROM estados_conversacion WHERE expira_en <= :ahora"
+                ), {"ahora": ahora})
+
+    def eliminar(self, chat_id: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM estados_conversacion WHERE chat_id = :c"), {"c": chat_id})
+
+
+def crear_almacen_estados() -> AlmacenEstados:
+    """Elige el backend según ESTADOS_BACKEND (memoria, redis o sql)"""
+    backend = os.getenv("ESTADOS_BACKEND", "memoria")
+    ttl = int(os.getenv("ESTADOS_TTL", "1800"))
+
+    if backend == "redis":
+        from config.settings import settings  # pydantic solo cuando hay redis
+
+        return AlmacenEstadosRedis(ttl, settings.redis_url)
+    if backend == "sql":
+        url = os.getenv("ESTADOS_SQL_URL")
+        if url:
+            from config.database import engine_aparte
+            return AlmacenEstadosSQL(ttl, engine_aparte(url))
+        from config.database import engine
+        return AlmacenEstadosSQL(ttl, engine)
+    return AlmacenEstadosMemoria(ttl)
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+class CuboTokens:
+    """Token bucket: `tasa` tokens por segundo con ráfagas de hasta `capacidad`"""
+
+    def __init__(self, tasa: float, capacidad: float | None = None):
+        self.tasa = tasa
+        self.capacidad = capacidad if capacidad is not None else tasa
+        self.tokens = self.capacidad
+        self.actualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reponer(self, ahora: float):
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+
+    def intentar(self, n: float = 1) -> bool:
+        """Toma n tokens si hay; no bloquea"""
+        with self._lock:
+            self._reponer(time.monotonic())
+            if self.tokens >= n:
+                self.tokens -= n
+                return True
+            return False
+
+    def reservar(self, n: float = 1) -> float:
+        """Reserva n tokens y devuelve cuántos segundos hay que esperar pa' usarlos"""
+        with self._lock:
+            self._reponer(time.monotonic())
+            self.tokens -= n
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.tasa
+
+    def falta(self, n: float = 1) -> float:
+        """Segundos hasta que haya n tokens, sin tomarlos"""
+        with self._lock:
+            self._reponer(time.monotonic())
+            return 0.0 if self.tokens >= n else (n - self.tokens) / self.tasa
+
+    def esperar(self, n: float = 1):
+        """Bloquea hasta poder usar n tokens (en orden de llegada)"""
+        espera = self.reservar(n)
+        if espera > 0:
+            time.sleep(espera)
+
+    def ajustar(self, tasa: float, capacidad: float | None = None):
+        """Cambia la tasa (p. ej. al repartir el límite del bot entre varios nodos)"""
+        with self._lock:
+            self._reponer(time.monotonic())
+            self.tasa = tasa
+            self.capacidad = capacidad if capacidad is not None else tasa
+            self.tokens = min(self.tokens, self.capacidad)
+
+    def pausar(self, segundos: float):
+        """Vacía el cubo por `segundos` (p. ej. cuando Telegram manda retry_after)"""
+        with self._lock:
+            self._reponer(time.monotonic())
+            self.tokens = min(self.tokens, -segundos * self.tasa)
+
+
+class LimitadorPorClave:
+    """Un CuboTokens por clave (chat_id), con las claves menos usadas desalojadas"""
+
+    def __init__(self, tasa: float, capacidad: float | None = None, max_claves: int = 100_000):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.max_claves = max_claves
+        self._cubos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cubo(self, clave: str) -> CuboTokens:
+        with self._lock:
+            cubo = self._cubos.get(clave)
+            if cubo is None:
+                cubo = CuboTokens(self.tasa, self.capacidad)
+                self._cubos[clave] = cubo
+                if len(self._cubos) > self.max_claves:
+                    self._cubos.popitem(last=False)
+            else:
+                self._cubos.move_to_end(clave)
+            return cubo
+
+    def intentar(self, clave: str, n: float = 1) -> bool:
+        return self.cubo(clave).intentar(n)
+
+    def reservar(self, clave: str, n: float = 1) -> float:
+        return self.cubo(clave).reservar(n)
+
+    def esperar(self, clave: str, n: float = 1):
+        self.cubo(clave).esperar(n)
+
+    def descartar_si(self, condicion) -> int:
+        """Saca los cubos de las claves para las que condicion(clave) es verdad"""
+        with self._lock:
+            fuera = [clave for clave in self._cubos if condicion(clave)]
+            for clave in fuera:
+                del self._cubos[clave]
+        return len(fuera)
@@ -0,0 +1,199 @@
+import threading
+import time
+from contextvars import ContextVar
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Buckets en segundos: de 1 ms a 10 s, que es donde viven nuestras etapas
+BUCKETS_POR_DEFECTO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _formatear_etiquetas(etiquetas: tuple) -> str:
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, n: float = 1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + n
+
+    def valor(self, **etiquetas) -> float:
+        return self._valores.get(tuple(sorted(etiquetas.items())), 0)
+
+    def exportar(self) -> list:
+        with self._lock:
+            return [f"{self.nombre}{_formatear_etiquetas(k)} {v}" for k, v in self._valores.items()]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, buckets: tuple = BUCKETS_POR_DEFECTO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # Conteos por bucket (no acumulados) + suma + total
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self) -> list:
+        lineas = []
+        with self._lock:
+            series = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave + (('le', limite),))} {acumulado}")
+            lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave + (('le', '+Inf'),))} {total}")
+            lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_formatear_etiquetas(clave)} {total}")
+        return lineas
+
+
+class Medidor:
+    """
+    Gauge calculado al exportar (tamaño de colas, caches, pool de la base).
+    La función devuelve un número o un dict {valor_de_etiqueta: número}.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, funcion, etiqueta: str = "tipo"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiqueta = etiqueta
+
+    def exportar(self) -> list:
+        try:
+            valor = self.funcion()
+        except Exception as e:
+            print(f"Error calculando métrica {self.nombre}: {e}")
+            return []
+        if isinstance(valor, dict):
+            return [
+                f"{self.nombre}{_formatear_etiquetas(((self.etiqueta, clave),))} {v}"
+                for clave, v in valor.items() if isinstance(v, (int, float))
+            ]
+        return [f"{self.nombre} {valor}"]
+
+
+class Metricas:
+    """
+    Registro de métricas del pipeline de mensajes, exportadas en formato
+    Prometheus en /metrics.
+    """
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+        # ContextVar y no threading.local: también separa tareas asyncio del mismo hilo
+        self._comando = ContextVar("comando", default="ninguno")
+
+        self.etapas = self.histograma(
+            "conuco_etapa_segundos", "Duración de cada etapa del pipeline, por etapa y comando"
+        )
+        self.mensajes = self.histograma(
+            "conuco_mensaje_segundos", "Duración total de procesar un mensaje, por comando"
+        )
+        self.errores = self.contador("conuco_errores_total", "Errores por etapa")
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre: str, ayuda: str) -> Contador:
+        return self._registrar(Contador(nombre, ayuda))
+
+    def histograma(self, nombre: str, ayuda: str, buckets: tuple = BUCKETS_POR_DEFECTO) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, buckets))
+
+    def medidor(self, nombre: str, ayuda: str, funcion, etiqueta: str = "tipo") -> Medidor:
+        return self._registrar(Medidor(nombre, ayuda, funcion, etiqueta))
+
+    @property
+    def comando_actual(self) -> str:
+        return self._comando.get()
+
+    @contextmanager
+    def comando(self, comando: str = "ninguno"):
+        """
+        Mide un mensaje completo y atribuye al comando todo lo que se mida
+        dentro (DB, clima, envío...). Si el comando se conoce más tarde, se
+        ajusta con cambiar_comando.
+        """
+        token = self._comando.set(comando)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mensajes.observar(time.perf_counter() - inicio, comando=self._comando.get())
+            self._comando.reset(token)
+
+    def cambiar_comando(self, comando: str):
+        """Pone nombre al comando en curso cuando se conoce después de empezar a medir"""
+        self._comando.set(comando)
+
+    @contextmanager
+    def medir(self, etapa: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errores.sumar(etapa=etapa)
+            raise
+        finally:
+            self.observar_etapa(etapa, time.perf_counter() - inicio)
+
+    def medido(self, etapa: str):
+        """Decorador: mide cada llamada a la función como la etapa indicada"""
+        def decorador(funcion):
+            @wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self.medir(etapa):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def observar_etapa(self, etapa: str, segundos: float):
+        self.etapas.observar(segundos, etapa=etapa, comando=self.comando_actual)
+
+    def exportar(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.exportar())
+        return "\n".join(lineas) + "\n"
+
+
+metricas = Metricas()
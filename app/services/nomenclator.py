@@ -0,0 +1,140 @@
+"""
+Resolución de zona a partir de lo que escribe el agricultor o de la
+ubicación que comparte en Telegram.
+
+El nomenclátor (data/lugares_rd.csv, o el archivo de LUGARES_CSV) trae
+municipios, distritos y parajes con sus coordenadas. Al armar el catálogo
+cada lugar se asigna una vez a la zona agroecológica más cercana (k-d tree
+sobre las coordenadas de las zonas); después resolver un texto es buscar
+la frase en el enrutador de nombres y una ubicación es una búsqueda de
+vecino más cercano.
+"""
+import csv
+import math
+import os
+import re
+from .enrutador import Enrutador
+
+RUTA_LUGARES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "lugares_rd.csv")
+
+# "18.91, -70.74" o "18.91 -70.74": lo que manda una ubicación de Telegram (ver extraer_mensaje)
+_COORDENADAS = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*[,; ]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+KM_POR_GRADO = 111.32
+
+
+def cargar_lugares(ruta: str | None = None) -> list:
+    """Lee el nomenclátor: [{nombre, tipo, provincia, latitud, longitud, alias: [...]}]"""
+    ruta = ruta or os.getenv("LUGARES_CSV", RUTA_LUGARES)
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            return [
+                {
+                    "nombre": fila["nombre"],
+                    "tipo": fila.get("tipo") or "municipio",
+                    "provincia": fila.get("provincia"),
+                    "latitud": float(fila["latitud"]),
+                    "longitud": float(fila["longitud"]),
+                    "alias": [a for a in (fila.get("alias") or "").split("|") if a]
+                }
+                for fila in csv.DictReader(archivo)
+            ]
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error leyendo el nomenclátor {ruta}: {e}")
+        return []
+
+
+class ArbolKD:
+    """
+    k-d tree de 2 dimensiones sobre (lat, lon) proyectadas a km (equirectangular
+    alrededor del centro del país; de sobra pa' distancias dentro de la isla).
+    """
+
+    def __init__(self, puntos: list, latitud_ref: float = 18.8):
+        # puntos: [(latitud, longitud, valor)]
+        self.escala_lon = math.cos(math.radians(latitud_ref))
+        self._raiz = self._construir([(self._proyectar(lat, lon), valor) for lat, lon, valor in puntos], 0)
+
+    def _proyectar(self, latitud: float, longitud: float) -> tuple:
+        return (latitud * KM_POR_GRADO, longitud * KM_POR_GRADO * self.escala_lon)
+
+    def _construir(self, puntos: list, eje: int):
+        if not puntos:
+            return None
+        puntos.sort(key=lambda p: p[0][eje])
+        medio = len(puntos) // 2
+        return (
+            puntos[medio],
+            eje,
+            self._construir(puntos[:medio], 1 - eje),
+            self._construir(puntos[medio + 1:], 1 - eje)
+        )
+
+    def cercano(self, latitud: float, longitud: float) -> tuple | None:
+        """(valor, distancia_km) del punto más cercano, o None si el árbol está vacío"""
+        objetivo = self._proyectar(latitud, longitud)
+        mejor = [None, float("inf")]
+
+        def visitar(nodo):
+            if nodo is None:
+                return
+            (punto, valor), eje, menor, mayor = nodo
+            distancia = math.dist(punto, objetivo)
+            if distancia < mejor[1]:
+                mejor[0], mejor[1] = valor, distancia
+            diferencia = objetivo[eje] - punto[eje]
+            cerca, lejos = (menor, mayor) if diferencia < 0 else (mayor, menor)
+            visitar(cerca)
+            if abs(diferencia) < mejor[1]:
+                visitar(lejos)
+
+        visitar(self._raiz)
+        return None if mejor[0] is None else (mejor[0], mejor[1])
+
+
+class ResolutorZonas:
+    """Texto libre o coordenadas → zona_id (o None si no se reconoce el lugar)"""
+
+    def __init__(self, zonas: list, lugares: list):
+        self.max_km = float(os.getenv("ZONA_MAX_KM", "120"))
+        con_coordenadas = [z for z in zonas if z.get("latitud") is not None and z.get("longitud") is not None]
+        self.arbol = ArbolKD([(float(z["latitud"]), float(z["longitud"]), z["id"]) for z in con_coordenadas])
+
+        # Los nombres de las zonas van primero: "Constanza" es la zona, no solo el municipio
+        sinonimos = {("zona", z["id"]): [z["nombre"]] for z in zonas if z.get("nombre")}
+        self._zona_de = {("zona", z["id"]): z["id"] for z in zonas}
+        self._nombre_de = {("zona", z["id"]): z.get("nombre") for z in zonas}
+        for i, lugar in enumerate(lugares):
+            cercana = self.arbol.cercano(lugar["latitud"], lugar["longitud"])
+            if cercana is None or cercana[1] > self.max_km:
+                continue
+            sinonimos[("lugar", i)] = [lugar["nombre"], *lugar["alias"]]
+            self._zona_de[("lugar", i)] = cercana[0]
+            self._nombre_de[("lugar", i)] = lugar["nombre"]
+        self.enrutador = Enrutador(sinonimos)
+
+    def por_coordenadas(self, latitud: float, longitud: float) -> int | None:
+        cercana = self.arbol.cercano(latitud, longitud)
+        if cercana is None or cercana[1] > self.max_km:
+            return None
+        return cercana[0]
+
+    def resolver(self, texto: str) -> int | None:
+        return self.buscar(texto)[0]
+
+    def buscar(self, texto: str) -> tuple:
+        """
+        (zona_id, lugar reconocido, aproximada): aproximada si el lugar salió
+        por error de dedo y hay que confirmarlo. (None, None, False) si no se
+        reconoce nada.
+        """
+        coordenadas = _COORDENADAS.match(texto)
+        if coordenadas:
+            return self.por_coordenadas(float(coordenadas.group(1)), float(coordenadas.group(2))), None, False
+        clave, aproximada = self.enrutador.buscar_en_texto(texto)
+        if clave is None:
+            return None, None, False
+        return self._zona_de[clave], self._nombre_de[clave], aproximada
+
+
+lugares = cargar_lugares()
@@ -0,0 +1,69 @@
+"""
+Reparto de chats entre nodos (PARTICIONES=1, ver tasks/particiones.py).
+
+AnilloConsistente decide qué nodo es dueño de cada chat_id: cada nodo
+ocupa PARTICION_VIRTUALES puntos del anillo y el chat va al primer punto
+a partir de su hash. Cuando un nodo entra o sale solo se mueven los chats
+de sus puntos (más o menos 1/N del total), no todos como con hash % N.
+
+MembresiaSQL guarda qué nodos están vivos: cada uno late (actualiza su
+fila) cada pocos segundos y los que dejan de latir salen del anillo.
+"""
+import bisect
+import hashlib
+import time
+from sqlalchemy import text
+
+
+def _hash(clave: str) -> int:
+    # Estable entre procesos (hash() de Python cambia en cada arranque) y bien repartido
+    return int.from_bytes(hashlib.blake2b(clave.encode(), digest_size=8).digest(), "big")
+
+
+class AnilloConsistente:
+    def __init__(self, nodos, virtuales: int = 64):
+        self.nodos = frozenset(nodos)
+        self.virtuales = virtuales
+        puntos = sorted((_hash(f"{nodo}#{i}"), nodo) for nodo in self.nodos for i in range(virtuales))
+        self._hashes = [h for h, _ in puntos]
+        self._duenos = [nodo for _, nodo in puntos]
+
+    def nodo(self, chat_id: str) -> str | None:
+        """Nodo dueño del chat, o None si el anillo está vacío"""
+        if not self._hashes:
+            return None
+        indice = bisect.bisect(self._hashes, _hash(str(chat_id))) % len(self._hashes)
+        return self._duenos[indice]
+
+
+class MembresiaSQL:
+    """
+    Nodos vivos en una tabla compartida. Funciona con PostgreSQL (necesita
+    migrations/010_nodos_particion.sql) y con SQLite, igual que AlmacenEstadosSQL.
+    """
+
+    def __init__(self, engine, vencimiento: float):
+        from config.database import esquema_sqlite
+
+        self.engine = engine
+        self.vencimiento = vencimiento
+        esquema_sqlite(engine, "010_nodos_particion.sql")
+
+    def latir(self, nodo: str, direccion: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO nodos_particion (nodo, direccion, latido) VALUES (:n, :d, :t)
+                ON CONFLICT (nodo) DO UPDATE SET direccion = excluded.direccion, latido = excluded.latido
+            """), {"n": nodo, "d": direccion, "t": time.time()})
+
+    def vivos(self) -> dict:
+        """{nodo: dirección} de los que latieron dentro del vencimiento"""
+        with self.engine.connect() as conn:
+            filas = conn.execute(text(
+                "SELECT nodo, direccion FROM nodos_particion WHERE latido > :desde"
+            ), {"desde": time.time() - self.vencimiento}).fetchall()
+        return {fila.nodo: fila.direccion for fila in filas}
+
+    def salir(self, nodo: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM nodos_particion WHERE nodo = :n"), {"n": nodo})
@@ -0,0 +1,41 @@
+import threading
+from config.entorno import cargar_entorno
+
+
+class Perezoso:
+    """
+    Servicio que se construye la primera vez que se usa, no al importar el
+    módulo: importar whatsapp_service o clima_service no exige credenciales
+    ni abre sesiones HTTP, y un script que no los usa no los paga.
+
+    Se usa igual que el objeto (servicio.metodo(), servicio.atributo = x);
+    iniciar() lo construye en el momento, pa' fallar temprano al arrancar
+    un proceso si falta configuración.
+    """
+
+    def __init__(self, fabrica):
+        object.__setattr__(self, "_fabrica", fabrica)
+        object.__setattr__(self, "_objeto", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def iniciar(self):
+        if self._objeto is None:
+            with self._lock:
+                if self._objeto is None:
+                    # Los servicios leen su configuración del entorno al construirse
+                    cargar_entorno()
+                    object.__setattr__(self, "_objeto", self._fabrica())
+        return self._objeto
+
+    @property
+    def construido(self) -> bool:
+        return self._objeto is not None
+
+    def __getattr__(self, nombre):
+        return getattr(self.iniciar(), nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self.iniciar(), nombre, valor)
+
+    def __repr__(self) -> str:
+        return f"Perezoso({self._objeto!r})" if self.construido else f"Perezoso({self._fabrica.__name__}, sin construir)"
@@ -0,0 +1,168 @@
+"""
+Precios de mercado: carga de archivos y resumen por cultivo.
+
+Los archivos (CSV, JSON Lines o JSON, como los que publica MERCADOM o
+fixtures locales en data/precios/) se leen fila por fila y se guardan en
+lotes en precios_mercado: un precio por (cultivo, mercado, día). Después
+recalcular_resumen arma en una sola consulta el resumen de cada cultivo
+(último precio, promedios de 7 y 30 días, tendencia) en resumen_precios,
+que es lo único que lee REPORTE (vía el catálogo en memoria).
+
+Columnas que se entienden (en cualquier orden, sin importar mayúsculas):
+    fecha                 2026-10-18 o 18/10/2026
+    producto | cultivo    nombre o sinónimo del cultivo (Tomate, Guineo...)
+    codigo                código del cultivo (TOM), en vez de producto
+    mercado               opcional, MERCADOM por defecto
+    unidad                libra (por defecto), quintal o kilo
+    precio_mayor | mayor | precio
+    precio_detalle | detalle   opcional
+"""
+import csv
+import json
+import os
+from datetime import date, datetime
+from sqlalchemy import text
+
+# Todo se guarda por libra
+LIBRAS_POR_UNIDAD = {"libra": 1, "lb": 1, "quintal": 100, "qq": 100, "kilo": 2.20462, "kg": 2.20462}
+
+GUARDAR_PRECIOS = text("""
+    INSERT INTO precios_mercado (cultivo_id, mercado, fecha, precio_mayor, precio_detalle)
+    VALUES (:cultivo_id, :mercado, :fecha, :precio_mayor, :precio_detalle)
+    ON CONFLICT (cultivo_id, mercado, fecha) DO UPDATE SET
+        precio_mayor = EXCLUDED.precio_mayor, precio_detalle = EXCLUDED.precio_detalle
+""")
+
+# Promedio entre mercados por día, ventanas de 7 y 30 días y el último día de cada cultivo
+RECALCULAR_RESUMEN = text("""
+    WITH diario AS (
+        SELECT cultivo_id, fecha, avg(precio_mayor) AS mayor, avg(precio_detalle) AS detalle, count(*) AS mercados
+        FROM precios_mercado
+        WHERE fecha > :hoy - 60 AND fecha <= :hoy
+        GROUP BY cultivo_id, fecha
+    ), ventanas AS (
+        SELECT cultivo_id, fecha, mayor, detalle, mercados,
+               avg(mayor) OVER (PARTITION BY cultivo_id ORDER BY fecha
+                                RANGE BETWEEN INTERVAL '6 days' PRECEDING AND CURRENT ROW) AS promedio_7d,
+               avg(mayor) OVER (PARTITION BY cultivo_id ORDER BY fecha
+                                RANGE BETWEEN INTERVAL '29 days' PRECEDING AND CURRENT ROW) AS promedio_30d,
+               row_number() OVER (PARTITION BY cultivo_id ORDER BY fecha DESC) AS reciente
+        FROM diario
+    )
+    INSERT INTO resumen_precios (cultivo_id, fecha, precio_mayor, precio_detalle, promedio_7d, promedio_30d,
+                                 variacion_7d, tendencia, mercados, actualizado_en)
+    SELECT cultivo_id, fecha, round(mayor, 2), round(detalle, 2), round(promedio_7d, 2), round(promedio_30d, 2),
+           round((mayor - promedio_7d) / NULLIF(promedio_7d, 0) * 100, 1),
+           CASE
+               WHEN promedio_7d > promedio_30d * (1 + :umbral) THEN 'sube'
+               WHEN promedio_7d < promedio_30d * (1 - :umbral) THEN 'baja'
+               ELSE 'estable'
+           END,
+           mercados, now()
+    FROM ventanas
+    WHERE reciente = 1
+    ON CONFLICT (cultivo_id) DO UPDATE SET
+        fecha = EXCLUDED.fecha, precio_mayor = EXCLUDED.precio_mayor, precio_detalle = EXCLUDED.precio_detalle,
+        promedio_7d = EXCLUDED.promedio_7d, promedio_30d = EXCLUDED.promedio_30d,
+        variacion_7d = EXCLUDED.variacion_7d, tendencia = EXCLUDED.tendencia,
+        mercados = EXCLUDED.mercados, actualizado_en = now()
+""")
+
+
+def leer_registros(ruta: str):
+    """Registros crudos (dicts con las llaves en minúscula) de un archivo, uno a uno"""
+    extension = os.path.splitext(ruta)[1].lower()
+    with open(ruta, encoding="utf-8-sig") as archivo:
+        if extension == ".csv":
+            filas = csv.DictReader(archivo)
+        elif extension in (".jsonl", ".ndjson"):
+            filas = (json.loads(linea) for linea in archivo if linea.strip())
+        elif extension == ".json":
+            # Un arreglo JSON no se puede leer por partes sin otra librería; pa' archivos grandes, JSON Lines
+            datos = json.load(archivo)
+            filas = datos.get("precios", []) if isinstance(datos, dict) else datos
+        else:
+            raise ValueError(f"Formato de precios no soportado: {ruta}")
+        for fila in filas:
+            yield {str(llave).strip().lower(): valor for llave, valor in fila.items()}
+
+
+def _fecha(valor) -> date:
+    valor = str(valor).strip()
+    if "/" in valor:
+        return datetime.strptime(valor, "%d/%m/%Y").date()
+    return date.fromisoformat(valor[:10])
+
+
+def _numero(valor) -> float | None:
+    if valor is None or str(valor).strip() == "":
+        return None
+    return float(str(valor).replace("RD$", "").replace(",", "").strip())
+
+
+class IngestorPrecios:
+    def __init__(self, datos_referencia):
+        self.datos_referencia = datos_referencia
+        self._cultivo_de = {}
+
+    def _cultivo_id(self, registro: dict) -> int | None:
+        """Id del cultivo por código o por nombre (con el enrutador de cultivos), recordado por nombre"""
+        nombre = registro.get("codigo") or registro.get("producto") or registro.get("cultivo")
+        if not nombre:
+            return None
+        if nombre not in self._cultivo_de:
+            cultivo = self.datos_referencia.cultivo_por_codigo(str(nombre).strip().upper())
+            if cultivo is None:
+                opcion = self.datos_referencia.enrutador_cultivos.resolver(str(nombre))
+                codigo = self.datos_referencia.menu.get(opcion, {}).get("codigo") if opcion else None
+                cultivo = self.datos_referencia.cultivo_por_codigo(codigo) if codigo else None
+            self._cultivo_de[nombre] = cultivo["id"] if cultivo else None
+        return self._cultivo_de[nombre]
+
+    def normalizar(self, registro: dict) -> dict | None:
+        """Registro crudo → fila de precios_mercado por libra, o None si no se entiende"""
+        try:
+            cultivo_id = self._cultivo_id(registro)
+            mayor = _numero(registro.get("precio_mayor") or registro.get("mayor") or registro.get("precio"))
+            if cultivo_id is None or mayor is None:
+                return None
+            libras = LIBRAS_POR_UNIDAD.get(str(registro.get("unidad") or "libra").strip().lower())
+            if libras is None:
+                return None
+            detalle = _numero(registro.get("precio_detalle") or registro.get("detalle"))
+            return {
+                "cultivo_id": cultivo_id,
+                "mercado": str(registro.get("mercado") or "MERCADOM").strip().upper()[:60],
+                "fecha": _fecha(registro["fecha"]),
+                "precio_mayor": round(mayor / libras, 2),
+                "precio_detalle": round(detalle / libras, 2) if detalle is not None else None
+            }
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    def cargar(self, db, rutas: list, lote: int = 5000) -> dict:
+        """Guarda los precios de los archivos en lotes de `lote` filas; no hace commit"""
+        stats = {"archivos": 0, "filas": 0, "descartadas": 0}
+        for ruta in rutas:
+            stats["archivos"] += 1
+            pendientes = {}
+            for registro in leer_registros(ruta):
+                fila = self.normalizar(registro)
+                if fila is None:
+                    stats["descartadas"] += 1
+                    continue
+                # Un mismo (cultivo, mercado, día) repetido en el lote rompería el ON CONFLICT: gana el último
+                pendientes[(fila["cultivo_id"], fila["mercado"], fila["fecha"])] = fila
+                if len(pendientes) >= lote:
+                    db.execute(GUARDAR_PRECIOS, list(pendientes.values()))
+                    stats["filas"] += len(pendientes)
+                    pendientes = {}
+            if pendientes:
+                db.execute(GUARDAR_PRECIOS, list(pendientes.values()))
+                stats["filas"] += len(pendientes)
+        return stats
+
+    def recalcular_resumen(self, db, hoy: date | None = None) -> int:
+        """Rehace resumen_precios con lo guardado hasta `hoy`; devuelve cuántos cultivos quedaron"""
+        umbral = float(os.getenv("PRECIOS_UMBRAL_TENDENCIA", "0.03"))
+        return db.execute(RECALCULAR_RESUMEN, {"hoy": hoy or date.today(), "umbral": umbral}).rowcount
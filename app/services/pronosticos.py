@@ -0,0 +1,172 @@
+"""
+Almacén local de pronósticos por zona (migrations/006_pronosticos.sql).
+
+Una fila por (zona, día) en pronosticos_diarios con los valores del día, y
+otra en pronosticos_horarios con las 24 horas guardadas como arreglos (una
+columna por variable), así una ventana de una semana pa' todas las zonas es
+una sola búsqueda por la llave primaria y no miles de filas sueltas.
+
+Lo llena tasks/ingerir_pronosticos.py; con CLIMA_FUENTE=local el
+ClimaService lee de aquí en vez de llamar a Open-Meteo en cada REPORTE.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+
+VARIABLES_DIARIAS = (
+    "temperature_2m_max,temperature_2m_min,precipitation_sum,relative_humidity_2m_mean,"
+    "precipitation_probability_max,wind_speed_10m_max"
+)
+VARIABLES_HORARIAS = "temperature_2m,relative_humidity_2m,precipitation_probability,precipitation,wind_speed_10m"
+
+# columna de la tabla → variable diaria de Open-Meteo
+_DIARIAS = {
+    "temp_max": "temperature_2m_max",
+    "temp_min": "temperature_2m_min",
+    "lluvia": "precipitation_sum",
+    "humedad_media": "relative_humidity_2m_mean",
+    "prob_lluvia": "precipitation_probability_max",
+    "viento_max": "wind_speed_10m_max"
+}
+_HORARIAS = {
+    "temperatura": "temperature_2m",
+    "humedad": "relative_humidity_2m",
+    "prob_lluvia": "precipitation_probability",
+    "lluvia": "precipitation",
+    "viento": "wind_speed_10m"
+}
+
+GUARDAR_DIARIO = text("""
+    INSERT INTO pronosticos_diarios (zona_id, fecha, temp_max, temp_min, lluvia, humedad_media, prob_lluvia, viento_max, actualizado_en)
+    VALUES (:zona_id, :fecha, :temp_max, :temp_min, :lluvia, :humedad_media, :prob_lluvia, :viento_max, now())
+    ON CONFLICT (zona_id, fecha) DO UPDATE SET
+        temp_max = EXCLUDED.temp_max, temp_min = EXCLUDED.temp_min, lluvia = EXCLUDED.lluvia,
+        humedad_media = EXCLUDED.humedad_media, prob_lluvia = EXCLUDED.prob_lluvia,
+        viento_max = EXCLUDED.viento_max, actualizado_en = now()
+""")
+
+GUARDAR_HORARIO = text("""
+    INSERT INTO pronosticos_horarios (zona_id, fecha, temperatura, humedad, prob_lluvia, lluvia, viento)
+    VALUES (:zona_id, :fecha, :temperatura, :humedad, :prob_lluvia, :lluvia, :viento)
+    ON CONFLICT (zona_id, fecha) DO UPDATE SET
+        temperatura = EXCLUDED.temperatura, humedad = EXCLUDED.humedad, prob_lluvia = EXCLUDED.prob_lluvia,
+        lluvia = EXCLUDED.lluvia, viento = EXCLUDED.viento
+""")
+
+CONSULTA_VENTANA = text("""
+    SELECT zona_id, fecha, temp_max, temp_min, lluvia, humedad_media, prob_lluvia, viento_max
+    FROM pronosticos_diarios
+    WHERE zona_id = ANY(:zonas) AND fecha BETWEEN :desde AND :hasta
+    ORDER BY zona_id, fecha
+""")
+
+CONSULTA_HORAS = text("""
+    SELECT h.fecha + make_interval(hours => (x.hora - 1)::int) AS momento,
+           x.temperatura, x.humedad, x.prob_lluvia, x.lluvia, x.viento
+    FROM pronosticos_horarios h,
+         unnest(h.temperatura, h.humedad, h.prob_lluvia, h.lluvia, h.viento)
+             WITH ORDINALITY AS x(temperatura, humedad, prob_lluvia, lluvia, viento, hora)
+    WHERE h.zona_id = :zona AND h.fecha BETWEEN CAST(:desde AS date) AND CAST(:hasta AS date)
+      AND h.fecha + make_interval(hours => (x.hora - 1)::int) BETWEEN :desde AND :hasta
+    ORDER BY momento
+""")
+
+
+def filas_pronostico(zona_id: int, data: dict) -> tuple:
+    """
+    Respuesta de Open-Meteo de una zona → (filas diarias, filas horarias)
+    listas pa' GUARDAR_DIARIO y GUARDAR_HORARIO.
+    """
+    diario = data.get("daily") or {}
+    diarias = []
+    for i, fecha in enumerate(diario.get("time", [])):
+        fila = {"zona_id": zona_id, "fecha": date.fromisoformat(fecha)}
+        for columna, variable in _DIARIAS.items():
+            valores = diario.get(variable) or []
+            fila[columna] = valores[i] if i < len(valores) else None
+        diarias.append(fila)
+
+    horario = data.get("hourly") or {}
+    por_dia = {}
+    for i, momento in enumerate(horario.get("time", [])):
+        fecha = date.fromisoformat(momento[:10])
+        dia = por_dia.setdefault(fecha, {columna: [None] * 24 for columna in _HORARIAS})
+        hora = int(momento[11:13])
+        for columna, variable in _HORARIAS.items():
+            valores = horario.get(variable) or []
+            dia[columna][hora] = valores[i] if i < len(valores) else None
+    # Una variable que no vino queda NULL, no como arreglo de NULLs
+    horarias = [
+        {"zona_id": zona_id, "fecha": fecha,
+         **{columna: valores if any(v is not None for v in valores) else None for columna, valores in columnas.items()}}
+        for fecha, columnas in por_dia.items()
+    ]
+    return diarias, horarias
+
+
+def resumen_dia(fila) -> dict:
+    """Fila de pronosticos_diarios en el formato de ClimaService (el de hoy)"""
+    return {
+        "temperatura_max_24h": fila.temp_max,
+        "lluvia_24h": fila.lluvia,
+        "humedad_media": fila.humedad_media,
+        "prob_lluvia": fila.prob_lluvia
+    }
+
+
+def dia_ventana(fila) -> dict:
+    """Fila de pronosticos_diarios como un día de la ventana (proximos_dias)"""
+    return {
+        "fecha": fila.fecha,
+        "temperatura_max": fila.temp_max,
+        "temperatura_min": fila.temp_min,
+        "lluvia": fila.lluvia,
+        "humedad_media": fila.humedad_media,
+        "prob_lluvia": fila.prob_lluvia,
+        "viento_max": fila.viento_max
+    }
+
+
+class AlmacenPronosticos:
+    def guardar(self, db, zona_id: int, data: dict) -> int:
+        """Guarda (o reemplaza) los días de una respuesta de Open-Meteo; devuelve cuántos días"""
+        diarias, horarias = filas_pronostico(zona_id, data)
+        if diarias:
+            db.execute(GUARDAR_DIARIO, diarias)
+        if horarias:
+            db.execute(GUARDAR_HORARIO, horarias)
+        return len(diarias)
+
+    def ventana(self, db, zona_ids: list, desde: date, hasta: date) -> dict:
+        """{zona_id: [día, ...]} de desde a hasta (inclusive), en orden de fecha"""
+        resultado = {zona_id: [] for zona_id in zona_ids}
+        for fila in db.execute(CONSULTA_VENTANA, {"zonas": list(zona_ids), "desde": desde, "hasta": hasta}):
+            resultado[fila.zona_id].append(fila)
+        return resultado
+
+    def resumenes(self, db, zona_ids: list, hoy: date, dias: int) -> dict:
+        """
+        {zona_id: datos} con el formato de ClimaService: el resumen de hoy más
+        proximos_dias con los días siguientes. Las zonas sin el día de hoy
+        guardado no aparecen.
+        """
+        resultado = {}
+        for zona_id, filas in self.ventana(db, zona_ids, hoy, hoy + timedelta(days=dias - 1)).items():
+            if not filas or filas[0].fecha != hoy:
+                continue
+            datos = resumen_dia(filas[0])
+            datos["proximos_dias"] = [dia_ventana(fila) for fila in filas[1:]]
+            resultado[zona_id] = datos
+        return resultado
+
+    def horas(self, db, zona_id: int, desde: datetime, hasta: datetime) -> list:
+        """Pronóstico hora por hora de una zona entre dos momentos (inclusive)"""
+        return [dict(fila._mapping) for fila in db.execute(CONSULTA_HORAS, {"zona": zona_id, "desde": desde, "hasta": hasta})]
+
+    def purgar(self, db, antes_de: date) -> int:
+        """Borra los días anteriores a `antes_de`; devuelve cuántos días diarios se borraron"""
+        borrados = db.execute(text("DELETE FROM pronosticos_diarios WHERE fecha < :f"), {"f": antes_de}).rowcount
+        db.execute(text("DELETE FROM pronosticos_horarios WHERE fecha < :f"), {"f": antes_de})
+        return borrados
+
+
+almacen_pronosticos = AlmacenPronosticos()
@@ -1,14 +1,52 @@
+import asyncio
 import os
-import unicodedata
 from typing import Dict, Optional
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 import re
-import requests
-from dotenv import load_dotenv
 from sqlalchemy import text
 from .clima_service import clima_service  # CON PUNTO
+from .cache_respuestas import CacheReportes
+from .cliente_http import cliente_http
+from .cola_envios import ColaEnvios, INTERACTIVO
+from .estado_conversacion import crear_almacen_estados
+from .datos_referencia import datos_referencia
+from .enrutador import enrutador_comandos, normalizar_texto
+from .metricas import metricas
+from .perezoso import Perezoso
+
+CONSULTA_REPORTE_MATERIALIZADO = text(
+    "SELECT texto FROM reportes_diarios WHERE telefono = :p AND fecha = :f"
+)
+
+# Cultivo y zona salen del catálogo en memoria; aquí solo las siembras activas,
+# las más recientes primero. Va por idx_usuarios_telefono_zona e
+# idx_siembras_usuario_activa (migrations/003_indices_siembras.sql): el costo
+# no crece con el tamaño de la tabla, solo con :n.
+CONSULTA_SIEMBRAS_USUARIO = text("""
+    SELECT s.cultivo_id, s.fecha_siembra, u.zona_id
+    FROM usuarios u 
+    JOIN siembras s ON s.usuario_id = u.id AND s.activa = true 
+    WHERE u.telefono = :p 
+    ORDER BY s.created_at DESC LIMIT :n
+""")
+
+# Respuestas a "¿Te refieres a …?" cuando la zona salió por error de dedo
+RESPUESTAS_SI = {"SI", "S", "SII", "SIP", "CLARO", "DALE", "OK", "ESO", "ESE", "CORRECTO", "ASI ES"}
+RESPUESTAS_NO = {"NO", "N", "NOP", "NEGATIVO", "ESE NO", "NO ES"}
+
+DIAS_SEMANA = ["lun", "mar", "mié", "jue", "vie", "sáb", "dom"]
+
+# Consejos por etapa (los usan REPORTE y las alertas de cambio de etapa)
+CONSEJOS_ETAPA = {
+    "Crecimiento": "🌱 Las plantas están creciendo. Si las hojas se ven pálidas o crecen lento, pueden necesitar abono.",
+    "Floración": "🌸 Están saliendo flores. Un abono rico en fósforo ayuda, pero solo si no has abonado recientemente.",
+    "Fructificación": "🍅 Los frutos están engordando. Cuida que no les falte agua y vigila las plagas.",
+    "Cosecha": "✂️ Tiempo de cosechar. Revisa a diario pa' coger los frutos en su punto.",
+    "Establecimiento": "🌱 El banano se está estableciendo. Mantén limpia el área de maleza.",
+    "Desarrollo": "🍌 El banano está creciendo. Vigila manchas amarillas en hojas (sigatoka)."
+}
 
-load_dotenv()
 
 class WhatsAppService:
     def __init__(self):
@@ -18,121 +56,170 @@ class WhatsAppService:
         if not self.telegram_token:
             raise ValueError("TELEGRAM_BOT_TOKEN no configurado en el archivo .env")
         
-        self.telegram_base_url = f"https://api.telegram.org/bot{self.telegram_token}"
+        telegram_api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+        self.telegram_base_url = f"{telegram_api_url}/bot{self.telegram_token}"
         
-        self.estados_usuario = {}
-        self.cultivos_data = {
-            "1": {"nombre": "Tomate", "codigo": "TOM", "ciclo_dias": 90},
-            "2": {"nombre": "Ají Cubanela", "codigo": "AJI", "ciclo_dias": 120},
-            "3": {"nombre": "Banano", "codigo": "BAN", "ciclo_dias": 365}
+        # Estado de registros en curso; compartido entre workers si ESTADOS_BACKEND lo permite
+        self.estados_usuario = crear_almacen_estados()
+        
+        # Servir REPORTE desde reportes_diarios (ver tasks/materializar_reportes.py)
+        self.reportes_materializados = os.getenv("REPORTES_MATERIALIZADOS", "0") == "1"
+        
+        # Siembras por REPORTE; con más se avisa que hay otras (el mensaje tiene tope de 4096)
+        self.max_siembras_reporte = int(os.getenv("REPORTE_MAX_SIEMBRAS", "8"))
+        
+        # Último REPORTE por chat (REPORTE_CACHE_TTL segundos, 0 lo apaga)
+        self.cache_reportes = CacheReportes()
+        
+        # Respuestas y difusión por la cola de envíos (ver services/cola_envios.py)
+        self.envios_en_cola = os.getenv("TELEGRAM_ENVIOS", "directo") == "cola"
+        self._cola_envios = None
+        
+        # Tablas de despacho armadas una vez, no en cada mensaje
+        self._comandos = {
+            "REGISTRO": self.iniciar_registro,
+            "REPORTE": self.generar_reporte_inteligente,
+            "AYUDA": lambda chat_id, db: self.mostrar_ayuda()
         }
+        self._pasos = {
+            "seleccionar_cultivo": lambda chat_id, mensaje, estado, db: self.procesar_cultivo(chat_id, mensaje, estado),
+            "fecha_siembra": lambda chat_id, mensaje, estado, db: self.procesar_fecha_siembra(chat_id, mensaje, estado),
+            "ubicacion": self.completar_registro,
+            "confirmar_zona": self.confirmar_zona
+        }
+        
+        self.mensajes_enviados = metricas.contador(
+            "conuco_mensajes_enviados_total", "Mensajes enviados a Telegram por resultado"
+        )
 
-    def enviar_mensaje(self, chat_id: str, mensaje: str) -> bool:
-        """Envía mensaje vía Telegram Bot API"""
-        url = f"{self.telegram_base_url}/sendMessage"
+    @property
+    def cultivos_data(self) -> Dict:
+        """Menú de cultivos (1-Tomate, 2-Ají...) según el catálogo en memoria"""
+        return datos_referencia.menu
+
+    def enviar_telegram(self, chat_id: str, mensaje: str, reintentos: int | None = None):
+        """Un POST a sendMessage; devuelve la respuesta tal cual"""
         payload = {
             "chat_id": chat_id,
             "text": mensaje,
             "parse_mode": "HTML"
         }
-        
+        return cliente_http.post(f"{self.telegram_base_url}/sendMessage", json=payload, reintentos=reintentos)
+
+    @metricas.medido("envio")
+    def enviar_mensaje(self, chat_id: str, mensaje: str) -> bool:
+        """Envía mensaje vía Telegram Bot API"""
         try:
-            response = requests.post(url, json=payload)
+            response = self.enviar_telegram(chat_id, mensaje)
             if response.status_code == 200:
                 print(f"Mensaje enviado a {chat_id}")
+                self.mensajes_enviados.sumar(resultado="ok")
                 return True
             else:
+                self.mensajes_enviados.sumar(resultado=str(response.status_code))
                 print(f"Error enviando mensaje: {response.status_code}")
                 print(response.json())
                 return False
         except Exception as e:
+            self.mensajes_enviados.sumar(resultado="excepcion")
             print(f"Error inesperado enviando mensaje: {e}")
             return False
 
+    @property
+    def cola_envios(self) -> ColaEnvios:
+        if self._cola_envios is None:
+            # Un solo intento por POST: los reintentos y el 429 los maneja la cola
+            self._cola_envios = ColaEnvios(lambda chat_id, texto: self.enviar_telegram(chat_id, texto, reintentos=0))
+        return self._cola_envios
+
+    def responder(self, chat_id: str, mensaje: str, prioridad: int = INTERACTIVO) -> bool:
+        """
+        Con TELEGRAM_ENVIOS=cola encola el mensaje (sale cuando los límites de
+        Telegram lo permitan); si no, lo envía en el momento.
+        """
+        if self.envios_en_cola:
+            self.cola_envios.encolar(chat_id, mensaje, prioridad)
+            return True
+        return self.enviar_mensaje(chat_id, mensaje)
+
     def limpiar_texto(self, texto: str) -> str:
         """Limpia texto: mayúsculas, sin tildes, sin espacios extra"""
-        texto = texto.upper().strip()
-        texto = ''.join(
-            c for c in unicodedata.normalize('NFD', texto)
-            if unicodedata.category(c) != 'Mn'
-        )
-        return texto
+        return normalizar_texto(texto)
 
     def normalizar_comando(self, mensaje: str) -> str:
-        """Convierte sinónimos a comandos estándar"""
-        mensaje = self.limpiar_texto(mensaje)
-        sinonimos = {
-            "REGISTRAR": "REGISTRO",
-            "APUNTAR": "REGISTRO",
-            "ANOTAR": "REGISTRO",
-            "CLIMA": "REPORTE",
-            "CLIMITA": "REPORTE", 
-            "PRECIO": "REPORTE",
-            "PRECIOS": "REPORTE",
-            "INFO": "AYUDA",
-            "INFORMACION": "AYUDA",
-            "/START": "AYUDA",  # Comando típico de Telegram
-            "/HELP": "AYUDA"
-        }
-        return sinonimos.get(mensaje, mensaje)
+        """Convierte sinónimos (y errores de dedo) a comandos estándar"""
+        return enrutador_comandos.resolver(mensaje) or self.limpiar_texto(mensaje)
 
     def normalizar_cultivo(self, mensaje: str) -> str:
-        """Acepta cultivos por número o nombre"""
-        mensaje = self.limpiar_texto(mensaje)
-        
-        if mensaje in self.cultivos_data:
-            return mensaje
-            
-        nombres = {
-            "TOMATE": "1",
-            "AJI": "2",
-            "CUBANELA": "2",
-            "BANANO": "3",
-            "BANANA": "3",
-            "PLATANO": "3"
-        }
-        return nombres.get(mensaje, None)
+        """Acepta cultivos por número, código, nombre o sinónimo"""
+        return datos_referencia.enrutador_cultivos.resolver(mensaje)
 
     def procesar_mensaje_entrante(self, chat_id: str, mensaje: str, db) -> str:
-        comando_normalizado = self.normalizar_comando(mensaje)
+        datos_referencia.asegurar_cargado(db)
+        with metricas.medir("normalizacion"):
+            comando_normalizado = self.normalizar_comando(mensaje)
         
-        if chat_id in self.estados_usuario:
-            return self.continuar_conversacion(chat_id, mensaje, db)
+        with metricas.medir("estado"):
+            estado = self.estados_usuario.obtener(chat_id)
+        return self.despachar(chat_id, mensaje, comando_normalizado, estado, db)
+
+    async def procesar_mensaje_entrante_async(self, chat_id: str, mensaje: str, db) -> str:
+        """
+        Igual que procesar_mensaje_entrante pero con una AsyncSession (DB_ASYNC=1).
+        REPORTE, lo más frecuente, consulta la base sin bloquear el loop y pide
+        el clima en un hilo; el registro corre el camino síncrono con run_sync,
+        que solo toca la base.
+        """
+        await datos_referencia.asegurar_cargado_async(db)
+        with metricas.medir("normalizacion"):
+            comando_normalizado = self.normalizar_comando(mensaje)
         
-        comandos = {
-            "REGISTRO": lambda: self.iniciar_registro(chat_id, db),
-            "REPORTE": lambda: self.generar_reporte_inteligente(chat_id, db),
-            "AYUDA": lambda: self.mostrar_ayuda()
-        }
+        with metricas.medir("estado"):
+            estado = self.estados_usuario.obtener(chat_id)
+        if estado is None and comando_normalizado == "REPORTE":
+            metricas.cambiar_comando(comando_normalizado)
+            return await self.generar_reporte_async(chat_id, db)
+        return await db.run_sync(
+            lambda sesion: self.despachar(chat_id, mensaje, comando_normalizado, estado, sesion)
+        )
+
+    def despachar(self, chat_id: str, mensaje: str, comando_normalizado: str, estado: Dict | None, db) -> str:
+        """Manda el mensaje al paso de registro en curso o al comando que toque"""
+        if estado is not None:
+            metricas.cambiar_comando(f"REGISTRO:{estado['paso']}")
+            return self.continuar_conversacion(chat_id, mensaje, estado, db)
         
-        if comando_normalizado in comandos:
-            return comandos[comando_normalizado]()
+        manejador = self._comandos.get(comando_normalizado)
+        if manejador is not None:
+            metricas.cambiar_comando(comando_normalizado)
+            return manejador(chat_id, db)
         else:
+            metricas.cambiar_comando("DESCONOCIDO")
             return "No agarré ese comando, compa. Manda /help o AYUDA pa' ver opciones."
 
     def mensaje_bienvenida(self) -> str:
         return "¡Dime a ver, compa! 👋 Soy tu Conuco Smart. Manda REGISTRO pa' apuntar siembra o REPORTE pa' ver como va todo."
 
     def iniciar_registro(self, chat_id: str, db) -> str:
-        result = db.execute(text("SELECT COUNT(*) FROM usuarios WHERE telefono = :phone"), {"phone": chat_id})
-        if result.fetchone()[0] > 0:
-            return "Ya te conozco, manito. Manda REPORTE pa' ver lo de tu siembra."
+        result = db.execute(text("SELECT EXISTS(SELECT 1 FROM usuarios WHERE telefono = :phone)"), {"phone": chat_id})
+        saludo = "¡Otra siembra más, manito! Vamos a apuntarla." if result.scalar() else "¡Claro que si! Vamos a apuntar esa siembra."
         
-        self.estados_usuario[chat_id] = {"paso": "seleccionar_cultivo"}
-        opciones = "\n".join([f"{k}-{v['nombre']}" for k, v in self.cultivos_data.items()])
-        return f"¡Claro que si! Vamos a apuntar esa siembra. ¿Que sembraste?\n\n{opciones}\n\n(Manda el numero o el nombre)"
+        self.estados_usuario.guardar(chat_id, {"paso": "seleccionar_cultivo"})
+        return f"{saludo} ¿Que sembraste?\n\n{self.opciones_cultivos()}\n\n(Manda el numero o el nombre)"
 
-    def continuar_conversacion(self, chat_id: str, mensaje: str, db) -> str:
-        estado = self.estados_usuario[chat_id]
-        
-        pasos = {
-            "seleccionar_cultivo": lambda: self.procesar_cultivo(chat_id, mensaje, estado),
-            "fecha_siembra": lambda: self.procesar_fecha_siembra(chat_id, mensaje, estado),
-            "ubicacion": lambda: self.completar_registro(chat_id, mensaje, estado, db)
-        }
+    def opciones_cultivos(self) -> str:
+        return "\n".join([f"{k}-{v['nombre']}" for k, v in self.cultivos_data.items()])
+
+    def continuar_conversacion(self, chat_id: str, mensaje: str, estado: Dict, db) -> str:
+        paso_actual = estado["paso"]
         
-        if estado["paso"] in pasos:
-            return pasos[estado["paso"]]()
+        manejador = self._pasos.get(paso_actual)
+        if manejador is not None:
+            respuesta = manejador(chat_id, mensaje, estado, db)
+            # Si el paso avanzó hay que persistir el estado (completar_registro lo borra él mismo)
+            if estado["paso"] != paso_actual:
+                self.estados_usuario.guardar(chat_id, estado)
+            return respuesta
         else:
             return "No agarré eso. Manda /help si te perdiste."
 
@@ -148,7 +235,7 @@ class WhatsAppService:
             })
             return f"¡Perfecto! {cultivo['nombre']}. ¿Y cuando fue que lo sembraste?\n\n(Ejemplo: hoy, hace 10 dias, hace 2 semanas)"
         else:
-            return "No encontré ese cultivo, compa. Opciones:\n1-Tomate\n2-Ají\n3-Banano"
+            return f"No encontré ese cultivo, compa. Opciones:\n{self.opciones_cultivos()}"
 
     def procesar_fecha_siembra(self, chat_id: str, mensaje: str, estado: Dict) -> str:
         fecha_siembra = self.parsear_fecha(mensaje)
@@ -159,7 +246,7 @@ class WhatsAppService:
                 "paso": "ubicacion", 
                 "dias_transcurridos": dias
             })
-            return f"Listo ({dias} dias). Ahora dime, ¿en que municipio o paraje estas?"
+            return f"Listo ({dias} dias). Ahora dime, ¿en que municipio o paraje estas? (o comparte tu ubicación 📍)"
         else:
             return "Esa fecha no la agarré bien. Prueba asi:\n• hace 10 dias\n• 15/8/2025"
 
@@ -182,34 +269,63 @@ class WhatsAppService:
         return None
 
     def completar_registro(self, chat_id: str, ubicacion: str, estado: Dict, db) -> str:
+        zona_id, lugar, aproximada = datos_referencia.resolutor_zonas.buscar(ubicacion)
+        if zona_id is None:
+            # Sin zona no hay clima que dar: se vuelve a preguntar en vez de suponer una
+            return ("No encontré ese lugar, compa. Mándame el municipio (ej: Constanza, Baní, Mao) "
+                    "o comparte tu ubicación 📍 desde Telegram.")
+        if aproximada:
+            # Un error de dedo puede caer en otro pueblo: se confirma antes de apuntar la zona
+            repetida = estado["paso"] == "confirmar_zona"
+            estado.update({"paso": "confirmar_zona", "zona_propuesta": zona_id})
+            if repetida:
+                # continuar_conversacion solo guarda el estado cuando cambia el paso
+                self.estados_usuario.guardar(chat_id, estado)
+            return f"¿Te refieres a {lugar}? Responde SI, o mándame el municipio otra vez."
+        return self.guardar_registro(chat_id, zona_id, estado, db)
+
+    def confirmar_zona(self, chat_id: str, mensaje: str, estado: Dict, db) -> str:
+        respuesta = normalizar_texto(mensaje)
+        if respuesta in RESPUESTAS_SI:
+            return self.guardar_registro(chat_id, estado["zona_propuesta"], estado, db)
+        if respuesta in RESPUESTAS_NO:
+            estado["paso"] = "ubicacion"
+            return "Ta bien. Mándame el municipio o paraje otra vez (o comparte tu ubicación 📍)."
+        return self.completar_registro(chat_id, mensaje, estado, db)
+
+    def guardar_registro(self, chat_id: str, zona_id: int, estado: Dict, db) -> str:
         try:
-            zona_id = self.determinar_zona(ubicacion)
+            cultivo_id = self.obtener_id_cultivo(estado['cultivo_data']['codigo'], db)
+            if cultivo_id is None:
+                raise ValueError(f"Cultivo {estado['cultivo_data']['codigo']} no existe en la base de datos")
             
+            # Un solo viaje a la base: upsert del usuario y alta de la siembra con su id.
+            # La zona es del agricultor: la última que dijo vale pa' todas sus siembras
             db.execute(text("""
-                INSERT INTO usuarios (telefono, nombre, status, zona_id) 
-                VALUES (:p, :n, 'activo', :z) 
-                ON CONFLICT (telefono) DO UPDATE SET status = 'activo', zona_id = :z
+                WITH usuario AS (
+                    INSERT INTO usuarios (telefono, nombre, status, zona_id) 
+                    VALUES (:p, :n, 'activo', :z) 
+                    ON CONFLICT (telefono) DO UPDATE SET status = 'activo', zona_id = :z
+                    RETURNING id
+                )
+                INSERT INTO siembras (usuario_id, cultivo_id, fecha_siembra, dia_actual, activa) 
+                SELECT id, :cid, :f, :d, true FROM usuario
             """), {
                 "p": chat_id, 
                 "n": f"Agricultor {estado['cultivo_data']['nombre']}", 
-                "z": zona_id
-            })
-            
-            user_id = db.execute(text("SELECT id FROM usuarios WHERE telefono = :p"), {"p": chat_id}).fetchone()[0]
-            cultivo_id = db.execute(text("SELECT id FROM cultivos WHERE codigo = :c"), {"c": estado['cultivo_data']['codigo']}).fetchone()[0]
-            
-            db.execute(text("""
-                INSERT INTO siembras (usuario_id, cultivo_id, fecha_siembra, dia_actual, activa) 
-                VALUES (:uid, :cid, :f, :d, true)
-            """), {
-                "uid": user_id, 
+                "z": zona_id,
                 "cid": cultivo_id, 
                 "f": estado["fecha_siembra"], 
                 "d": estado["dias_transcurridos"]
             })
             
+            # El reporte de hoy ya guardado no incluye esta siembra
+            if self.reportes_materializados:
+                db.execute(text("DELETE FROM reportes_diarios WHERE telefono = :p"), {"p": chat_id})
+            
             db.commit()
-            del self.estados_usuario[chat_id]
+            self.estados_usuario.eliminar(chat_id)
+            self.cache_reportes.invalidar(chat_id)
             
             return f"¡De una! ✅ Apunté tu siembra de {estado['cultivo_data']['nombre']} en {self.obtener_nombre_zona(zona_id)}.\n\nManda REPORTE cuando quieras el dato del tiempo y precios."
             
@@ -218,101 +334,280 @@ class WhatsAppService:
             print(f"Error en registro: {e}")
             return "Se me enredó algo guardando eso. Intenta otra vez mandando REGISTRO."
 
-    def determinar_zona(self, ubicacion: str) -> int:
-        ubicacion = ubicacion.lower()
-        zonas = {
-            "santiago": 2,
-            "constanza": 3, 
-            "hato mayor": 4
-        }
-        for zona, id_zona in zonas.items():
-            if zona in ubicacion:
-                return id_zona
-        return 1
+    def obtener_id_cultivo(self, codigo: str, db) -> Optional[int]:
+        """Id del cultivo por código, desde el catálogo en memoria (se recarga si no está)"""
+        cultivo = datos_referencia.cultivo_por_codigo(codigo)
+        if cultivo is None:
+            datos_referencia.invalidar()
+            datos_referencia.asegurar_cargado(db)
+            cultivo = datos_referencia.cultivo_por_codigo(codigo)
+        return cultivo["id"] if cultivo else None
+
+    def invalidar_cache_cultivos(self):
+        """Fuerza recargar el catálogo en el próximo uso"""
+        datos_referencia.invalidar()
+
+    def determinar_zona(self, ubicacion: str) -> Optional[int]:
+        """Zona del municipio/paraje (o de las coordenadas compartidas); None si no se reconoce"""
+        return datos_referencia.resolutor_zonas.resolver(ubicacion)
 
     def obtener_nombre_zona(self, zona_id: int) -> str:
-        zonas = {1: "Azua", 2: "Santiago", 3: "Constanza", 4: "Hato Mayor"}
-        return zonas.get(zona_id, "Zona desconocida")
+        return datos_referencia.nombre_zona(zona_id)
+
+    def armar_siembra(self, fila, db=None) -> Optional[SimpleNamespace]:
+        """
+        Completa una fila (cultivo_id, fecha_siembra, zona_id) con los datos
+        del catálogo en memoria: nombre y ciclo del cultivo, precios y lat/lon.
+        """
+        cultivo = datos_referencia.cultivo(fila.cultivo_id)
+        zona = datos_referencia.zona(fila.zona_id)
+        if (cultivo is None or zona is None) and db is not None:
+            datos_referencia.invalidar()
+            datos_referencia.asegurar_cargado(db)
+            cultivo = datos_referencia.cultivo(fila.cultivo_id)
+            zona = datos_referencia.zona(fila.zona_id)
+        if cultivo is None or zona is None:
+            return None
+        return SimpleNamespace(
+            cultivo=cultivo["nombre"],
+            fecha_siembra=fila.fecha_siembra,
+            dias_ciclo_promedio=cultivo["dias_ciclo_promedio"],
+            zona_id=fila.zona_id,
+            latitud=zona.get("latitud"),
+            longitud=zona.get("longitud"),
+            precio_mercado_libra=cultivo.get("precio_mercado_libra"),
+            tendencia_precio=cultivo.get("tendencia_precio"),
+            resumen_precio=cultivo.get("resumen_precio")
+        )
 
     def generar_reporte_inteligente(self, chat_id: str, db) -> str:
         try:
-            siembra = db.execute(text("""
-                SELECT c.nombre as cultivo, s.fecha_siembra, c.dias_ciclo_promedio, 
-                       z.id as zona_id, z.latitud, z.longitud,
-                       c.precio_mercado_libra, c.tendencia_precio
-                FROM siembras s 
-                JOIN usuarios u ON u.id = s.usuario_id 
-                JOIN cultivos c ON c.id = s.cultivo_id 
-                JOIN zonas_agroecologicas z ON z.id = u.zona_id
-                WHERE u.telefono = :p AND s.activa = true 
-                ORDER BY s.created_at DESC LIMIT 1
-            """), {"p": chat_id}).fetchone()
+            # El mismo chat pidiendo REPORTE seguido: el texto de hace un rato, sin el join ni clima
+            en_cache = self.cache_reportes.obtener(chat_id)
+            if en_cache is not None:
+                return en_cache
+
+            if self.reportes_materializados:
+                materializado = db.execute(
+                    CONSULTA_REPORTE_MATERIALIZADO, {"p": chat_id, "f": datetime.now().date()}
+                ).fetchone()
+                if materializado:
+                    self.cache_reportes.guardar(chat_id, materializado.texto)
+                    return materializado.texto
             
-            if not siembra: 
+            # Todas las siembras activas en una consulta; cultivo y zona salen del catálogo
+            filas = db.execute(
+                CONSULTA_SIEMBRAS_USUARIO, {"p": chat_id, "n": self.max_siembras_reporte + 1}
+            ).fetchall()
+            siembras = [siembra for siembra in (self.armar_siembra(fila, db) for fila in filas) if siembra]
+            
+            if not siembras: 
                 return "No encontré tu siembra registrada, compa. Manda REGISTRO pa' empezar."
 
-            dias = (datetime.now().date() - siembra.fecha_siembra).days
-            progreso = round((dias / siembra.dias_ciclo_promedio) * 100, 1) if siembra.dias_ciclo_promedio > 0 else 0
-            
-            # Construir encabezado
-            cultivo_emoji = {"Tomate": "🍅", "Ají Cubanela": "🌶️", "Banano": "🍌"}.get(siembra.cultivo, "🌱")
-            
-            reporte = f"<b>{cultivo_emoji} {siembra.cultivo.upper()}</b>\n"
-            reporte += f"📅 {dias} dias ({progreso}% de crecimiento)\n"
-            reporte += f"📍 {self.obtener_nombre_zona(siembra.zona_id)}\n\n"
+            # Todas comparten la zona del agricultor: un solo clima
+            datos_clima = clima_service.obtener_clima_actual(
+                lat=siembras[0].latitud, lon=siembras[0].longitud, zona_id=siembras[0].zona_id
+            )
+            reporte = self.renderizar_reporte(siembras, datos_clima)
+            if datos_clima:
+                # Sin clima no se guarda, pa' que el próximo REPORTE lo vuelva a intentar
+                self.cache_reportes.guardar(chat_id, reporte)
+            return reporte
+
+        except Exception as e:
+            print(f"Error generando reporte: {e}")
+            return "Hubo un problema generando el reporte. Intenta otra vez en un rato."
+
+    async def generar_reporte_async(self, chat_id: str, db) -> str:
+        """generar_reporte_inteligente con AsyncSession; el clima (requests) va en un hilo"""
+        try:
+            en_cache = self.cache_reportes.obtener(chat_id)
+            if en_cache is not None:
+                return en_cache
+
+            if self.reportes_materializados:
+                materializado = (await db.execute(
+                    CONSULTA_REPORTE_MATERIALIZADO, {"p": chat_id, "f": datetime.now().date()}
+                )).fetchone()
+                if materializado:
+                    self.cache_reportes.guardar(chat_id, materializado.texto)
+                    return materializado.texto
             
-            # Procesar clima
-            datos_clima = clima_service.obtener_clima_actual(lat=siembra.latitud, lon=siembra.longitud)
+            filas = (await db.execute(
+                CONSULTA_SIEMBRAS_USUARIO, {"p": chat_id, "n": self.max_siembras_reporte + 1}
+            )).fetchall()
+            siembras = [self.armar_siembra(fila) for fila in filas]
+            if None in siembras:
+                # Cultivo o zona nuevos que el catálogo todavía no tiene
+                datos_referencia.invalidar()
+                await datos_referencia.asegurar_cargado_async(db)
+                siembras = [self.armar_siembra(fila) for fila in filas]
+            siembras = [siembra for siembra in siembras if siembra]
             
+            if not siembras: 
+                return "No encontré tu siembra registrada, compa. Manda REGISTRO pa' empezar."
+
+            datos_clima = await asyncio.to_thread(
+                clima_service.obtener_clima_actual, siembras[0].latitud, siembras[0].longitud, siembras[0].zona_id
+            )
+            reporte = self.renderizar_reporte(siembras, datos_clima)
             if datos_clima:
-                temp_max = datos_clima.get('temperatura_max_24h')
-                humedad = datos_clima.get('humedad_media')
-                
-                if temp_max is not None:
-                    clima_str = f"🌡️ <b>HOY:</b> {temp_max}°C"
-                    if humedad is not None:
-                        if humedad > 85:
-                            clima_str += ", con mucha humedad (bochorno)"
-                        elif humedad < 60:
-                            clima_str += ", ambiente seco"
-                        else:
-                            clima_str += ", humedad normal"
-                    
-                    reporte += clima_str + "\n\n"
-                    
-                    # Generar recomendación
-                    recomendacion = self._generar_recomendacion_estrategica(datos_clima, siembra.cultivo, dias)
-                    reporte += f"🔍 <b>REVISAR:</b>\n{recomendacion}\n\n"
-                else:
-                    reporte += "🌡️ No pude conseguir datos del clima ahora mismo.\n\n"
-            else:
-                reporte += "🌡️ No pude conseguir el dato del tiempo pa' tu zona.\n\n"
-            
-            # Agregar precio
-            if siembra.precio_mercado_libra:
-                fecha_hoy = datetime.now().strftime("%d/%m/%Y")
-                reporte += f"💰 <b>Precios MERCADOM - {fecha_hoy}:</b>\n"
-                reporte += f"• Detalle: RD${siembra.precio_mercado_libra + 3:.2f}/libra\n"
-                reporte += f"• Por mayor: RD${siembra.precio_mercado_libra:.2f}/libra\n\n"
-
-            reporte += "🌱 <i>Mi Conuco Smart</i>"
+                # Sin clima no se guarda, pa' que el próximo REPORTE lo vuelva a intentar
+                self.cache_reportes.guardar(chat_id, reporte)
             return reporte
 
         except Exception as e:
             print(f"Error generando reporte: {e}")
             return "Hubo un problema generando el reporte. Intenta otra vez en un rato."
 
-    def _obtener_etapa_cultivo(self, cultivo: str, dias: int) -> str:
-        etapas = {
-            "Tomate": [(30, "Crecimiento"), (55, "Floración"), (80, "Fructificación"), (float('inf'), "Cosecha")],
-            "Ají Cubanela": [(30, "Crecimiento"), (55, "Floración"), (80, "Fructificación"), (float('inf'), "Cosecha")],
-            "Banano": [(90, "Establecimiento"), (180, "Desarrollo"), (300, "Floración"), (float('inf'), "Fructificación")]
-        }
+    @metricas.medido("render")
+    def renderizar_reporte(self, siembras, datos_clima: dict | None) -> str:
+        """
+        Arma el texto del reporte con el clima de la zona: una siembra, o la
+        lista de siembras activas del agricultor (la más reciente primero)
+        combinadas en un solo mensaje.
+        """
+        if not isinstance(siembras, list):
+            siembras = [siembras]
+        if len(siembras) > 1:
+            return self._renderizar_combinado(siembras, datos_clima)
+        siembra = siembras[0]
+        dias, progreso = self._progreso(siembra)
+        
+        # Construir encabezado
+        reporte = f"<b>{self._emoji_cultivo(siembra.cultivo)} {siembra.cultivo.upper()}</b>\n"
+        reporte += f"📅 {dias} dias ({progreso}% de crecimiento)\n"
+        reporte += f"📍 {self.obtener_nombre_zona(siembra.zona_id)}\n\n"
+        
+        # Procesar clima
+        clima_str = self._linea_clima(datos_clima)
+        if clima_str:
+            reporte += clima_str + "\n"
+            reporte += self._linea_proximos(datos_clima) + "\n"
+            
+            # Generar recomendación
+            recomendacion = self._generar_recomendacion_estrategica(datos_clima, siembra.cultivo, dias)
+            reporte += f"🔍 <b>REVISAR:</b>\n{recomendacion}\n\n"
+        else:
+            reporte += self._sin_clima(datos_clima) + "\n\n"
+        
+        # Agregar precio
+        precio = self._precio(siembra)
+        if precio:
+            reporte += f"💰 <b>Precios MERCADOM - {precio['fecha'].strftime('%d/%m/%Y')}:</b>\n"
+            reporte += f"• Detalle: RD${precio['detalle']:.2f}/libra\n"
+            reporte += f"• Por mayor: RD${precio['mayor']:.2f}/libra\n"
+            if precio["tendencia"]:
+                reporte += f"{precio['tendencia']}\n"
+            reporte += "\n"
+
+        reporte += "🌱 <i>Mi Conuco Smart</i>"
+        return reporte
+
+    def _renderizar_combinado(self, siembras: list, datos_clima: dict | None) -> str:
+        """Varias siembras: el clima de la zona una vez y un bloque corto por siembra"""
+        mostradas = siembras[:self.max_siembras_reporte]
+        
+        reporte = f"<b>🌾 TUS SIEMBRAS ({len(mostradas)})</b>\n"
+        reporte += f"📍 {self.obtener_nombre_zona(mostradas[0].zona_id)}\n\n"
+        
+        clima_str = self._linea_clima(datos_clima)
+        reporte += (clima_str or self._sin_clima(datos_clima)) + "\n"
+        if clima_str:
+            reporte += self._linea_proximos(datos_clima)
+        reporte += "\n"
         
-        for limite, etapa in etapas.get(cultivo, [(float('inf'), "Desarrollo")]):
-            if dias < limite:
-                return etapa
-        return "Desarrollo"
+        for siembra in mostradas:
+            dias, progreso = self._progreso(siembra)
+            reporte += f"<b>{self._emoji_cultivo(siembra.cultivo)} {siembra.cultivo.upper()}</b> · {dias} dias ({progreso}%)\n"
+            if clima_str:
+                reporte += f"🔍 {self._generar_recomendacion_estrategica(datos_clima, siembra.cultivo, dias)}\n"
+            precio = self._precio(siembra)
+            if precio:
+                reporte += f"💰 Por mayor RD${precio['mayor']:.2f}/libra, detalle RD${precio['detalle']:.2f}\n"
+                if precio["tendencia"]:
+                    reporte += f"{precio['tendencia']}\n"
+            reporte += "\n"
+        
+        if len(siembras) > len(mostradas):
+            reporte += f"➕ Tienes más siembras activas; aquí van las {len(mostradas)} más recientes.\n\n"
+        
+        fechas = [precio["fecha"] for precio in map(self._precio, mostradas) if precio]
+        if fechas:
+            reporte += f"<i>Precios MERCADOM - {max(fechas).strftime('%d/%m/%Y')}</i>\n"
+        reporte += "🌱 <i>Mi Conuco Smart</i>"
+        return reporte
+
+    def _precio(self, siembra) -> dict | None:
+        """
+        Precio por libra pa' el reporte: el resumen de precios_mercado si lo
+        hay, si no el precio fijo del catálogo (detalle = mayor + 3).
+        """
+        resumen = getattr(siembra, "resumen_precio", None)
+        if resumen:
+            mayor = float(resumen["precio_mayor"])
+            detalle = float(resumen["precio_detalle"]) if resumen["precio_detalle"] is not None else mayor + 3
+            tendencia = None
+            if resumen["promedio_7d"] is not None:
+                flecha = {"sube": "📈 Subiendo", "baja": "📉 Bajando"}.get(resumen["tendencia"], "➡️ Estable")
+                tendencia = f"{flecha} (promedio 7 días RD${float(resumen['promedio_7d']):.2f})"
+            return {"fecha": resumen["fecha"], "mayor": mayor, "detalle": detalle, "tendencia": tendencia}
+        if siembra.precio_mercado_libra:
+            mayor = float(siembra.precio_mercado_libra)
+            return {"fecha": datetime.now().date(), "mayor": mayor, "detalle": mayor + 3, "tendencia": None}
+        return None
+
+    def _progreso(self, siembra) -> tuple:
+        """(días desde la siembra, % del ciclo)"""
+        dias = (datetime.now().date() - siembra.fecha_siembra).days
+        progreso = round((dias / siembra.dias_ciclo_promedio) * 100, 1) if siembra.dias_ciclo_promedio > 0 else 0
+        return dias, progreso
+
+    def _emoji_cultivo(self, cultivo: str) -> str:
+        return {"Tomate": "🍅", "Ají Cubanela": "🌶️", "Banano": "🍌"}.get(cultivo, "🌱")
+
+    def tiene_clima(self, datos_clima: dict | None) -> bool:
+        """True si con estos datos el reporte lleva la línea de HOY"""
+        return self._linea_clima(datos_clima) is not None
+
+    def _linea_clima(self, datos_clima: dict | None) -> str | None:
+        """La línea de HOY, o None si no hay temperatura"""
+        if not datos_clima:
+            return None
+        temp_max = datos_clima.get('temperatura_max_24h')
+        if temp_max is None:
+            return None
+        humedad = datos_clima.get('humedad_media')
+        clima_str = f"🌡️ <b>HOY:</b> {temp_max}°C"
+        if humedad is not None:
+            if humedad > 85:
+                clima_str += ", con mucha humedad (bochorno)"
+            elif humedad < 60:
+                clima_str += ", ambiente seco"
+            else:
+                clima_str += ", humedad normal"
+        return clima_str
+
+    def _linea_proximos(self, datos_clima: dict) -> str:
+        """Los días siguientes del pronóstico en una línea (vacía si no vinieron)"""
+        dias = [d for d in datos_clima.get("proximos_dias") or [] if d.get("temperatura_max") is not None]
+        if not dias:
+            return ""
+        partes = []
+        for dia in dias:
+            parte = f"{DIAS_SEMANA[dia['fecha'].weekday()]} {round(dia['temperatura_max'])}°"
+            if dia.get("prob_lluvia") is not None:
+                parte += f" {'🌧️' if dia['prob_lluvia'] > 50 else '💧'}{round(dia['prob_lluvia'])}%"
+            partes.append(parte)
+        return "📆 <b>PRÓXIMOS DÍAS:</b> " + " · ".join(partes) + "\n"
+
+    def _sin_clima(self, datos_clima: dict | None) -> str:
+        if datos_clima:
+            return "🌡️ No pude conseguir datos del clima ahora mismo."
+        return "🌡️ No pude conseguir el dato del tiempo pa' tu zona."
+
+    def _obtener_etapa_cultivo(self, cultivo: str, dias: int) -> str:
+        return datos_referencia.etapa(cultivo, dias)
 
     def _generar_recomendacion_estrategica(self, clima: dict, cultivo: str, dias_cultivo: int) -> str:
         temp_max = clima.get("temperatura_max_24h")
@@ -331,16 +626,7 @@ class WhatsAppService:
             return f"🌧️ VA A LLOVER ({prob_lluvia}%): Mira el cielo antes de regar. Si llueve, te ahorras el agua."
 
         # Consejos por etapa
-        consejos_etapa = {
-            "Crecimiento": "🌱 Las plantas están creciendo. Si las hojas se ven pálidas o crecen lento, pueden necesitar abono.",
-            "Floración": "🌸 Están saliendo flores. Un abono rico en fósforo ayuda, pero solo si no has abonado recientemente.",
-            "Fructificación": "🍅 Los frutos están engordando. Cuida que no les falte agua y vigila las plagas.",
-            "Cosecha": "✂️ Tiempo de cosechar. Revisa a diario pa' coger los frutos en su punto.",
-            "Establecimiento": "🌱 El banano se está estableciendo. Mantén limpia el área de maleza.",
-            "Desarrollo": "🍌 El banano está creciendo. Vigila manchas amarillas en hojas (sigatoka)."
-        }
-
-        return consejos_etapa.get(etapa, "✅ Todo se ve normal. Sigue con tus labores normales.")
+        return CONSEJOS_ETAPA.get(etapa, "✅ Todo se ve normal. Sigue con tus labores normales.")
 
     def mostrar_ayuda(self) -> str:
         return """<b>🤖 MI CONUCO SMART - COMANDOS:</b>
@@ -356,4 +642,4 @@ class WhatsAppService:
 
 <i>Escribe cualquier comando pa' empezar</i>"""
 
-whatsapp_service = WhatsAppService()
\ No newline at end of file
+whatsapp_service = Perezoso(WhatsAppService)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Alertas proactivas: avisa sin que el agricultor pregunte.
+
+Las reglas de clima (las mismas de _generar_recomendacion_estrategica, más
+la lluvia acumulada de la ventana de pronóstico) se evalúan una vez por
+zona, no por siembra; después una sola consulta trae las siembras activas
+de las zonas donde saltó alguna regla más las que cambiaron de etapa hoy
+(ver tasks/avanzar_siembras.py) y se arma un mensaje por usuario con todo
+lo que le toca.
+
+Cada (usuario, día, tipo de alerta) se manda una sola vez: alertas_enviadas
+lo registra antes de enviar (así dos corridas a la vez no lo mandan doble)
+y lo borra si el envío falla, así correrlo varias veces al día (cuando se
+refresca el clima) solo manda lo nuevo y reintenta lo que no llegó. Con
+enviar=False (prueba en seco) se cuentan sin registrar nada.
+
+Necesita migrations/004_etapa_siembras.sql y 005_alertas_enviadas.sql.
+
+    cd app && python -m tasks.alertas
+"""
+import os
+import time
+from datetime import date, timedelta
+from sqlalchemy import text
+from config.database import SessionLocal
+from services.datos_referencia import datos_referencia
+from services.whatsapp_service import CONSEJOS_ETAPA
+from tasks.difusion_matutina import difusion_matutina
+from tasks.reportes_lote import obtener_clima_zonas
+
+CONSULTA_SIEMBRAS_ALERTA = text("""
+    SELECT u.telefono, u.zona_id, s.cultivo_id, s.etapa,
+           s.etapa_desde = :hoy AND s.etapa_anterior IS NOT NULL AS cambio_etapa
+    FROM siembras s
+    JOIN usuarios u ON u.id = s.usuario_id
+    WHERE s.activa = true
+      AND (u.zona_id = ANY(:zonas) OR (s.etapa_desde = :hoy AND s.etapa_anterior IS NOT NULL))
+    ORDER BY u.telefono
+""")
+
+# Solo vuelven las que no se habían mandado hoy
+REGISTRAR_ALERTAS = text("""
+    INSERT INTO alertas_enviadas (telefono, fecha, tipo)
+    SELECT telefono, :hoy, tipo FROM unnest(CAST(:telefonos AS text[]), CAST(:tipos AS text[])) AS a(telefono, tipo)
+    ON CONFLICT DO NOTHING
+    RETURNING telefono, tipo
+""")
+
+
+# Las de un envío que falló: la próxima corrida del día las vuelve a intentar
+DESREGISTRAR_ALERTAS = text("""
+    DELETE FROM alertas_enviadas a
+    USING unnest(CAST(:telefonos AS text[]), CAST(:tipos AS text[])) AS f(telefono, tipo)
+    WHERE a.fecha = :hoy AND a.telefono = f.telefono AND a.tipo = f.tipo
+""")
+
+
+def _mayor(clima: dict, campo: str, limite: float) -> bool:
+    valor = clima.get(campo)
+    return valor is not None and valor > limite
+
+
+def _menor(clima: dict, campo: str, limite: float) -> bool:
+    valor = clima.get(campo)
+    return valor is not None and valor < limite
+
+
+def _lluvia_ventana(clima: dict) -> float:
+    """mm de lluvia de hoy más los días siguientes del pronóstico"""
+    dias = [clima.get("lluvia_24h")] + [d.get("lluvia") for d in clima.get("proximos_dias") or []]
+    return sum(mm for mm in dias if mm is not None)
+
+
+LLUVIA_ACUMULADA_MM = float(os.getenv("ALERTA_LLUVIA_ACUMULADA_MM", "40"))
+
+# (tipo, condición, texto) con los mismos umbrales que la recomendación de REPORTE
+REGLAS_CLIMA = [
+    (
+        "calor_humedad",
+        lambda c: _mayor(c, "temperatura_max_24h", 32) and _mayor(c, "humedad_media", 80),
+        lambda c: f"🔥💧 <b>CALOR Y HUMEDAD HOY</b> ({c['temperatura_max_24h']}°C): Revisa las hojas por si aparecen manchas. Si ves algo raro, actúa rápido pa' evitar hongos."
+    ),
+    (
+        "calor_seco",
+        lambda c: _mayor(c, "temperatura_max_24h", 32) and _menor(c, "humedad_media", 60),
+        lambda c: f"🔥☀️ <b>MUCHO CALOR SECO HOY</b> ({c['temperatura_max_24h']}°C): Si las hojas se ven agachadas, riégalas temprano y en la tarde."
+    ),
+    (
+        "lluvia_acumulada",
+        lambda c: _lluvia_ventana(c) >= LLUVIA_ACUMULADA_MM,
+        lambda c: f"🌊 <b>MUCHA AGUA EN CAMINO</b>: se esperan unos {round(_lluvia_ventana(c))} mm de aquí a {len(c.get('proximos_dias') or []) + 1} días. Limpia los drenajes y no abones antes del aguacero."
+    ),
+    (
+        "lluvia",
+        lambda c: _mayor(c, "prob_lluvia", 50),
+        lambda c: f"🌧️ <b>VA A LLOVER</b> ({c['prob_lluvia']}%): Mira el cielo antes de regar. Si llueve, te ahorras el agua."
+    )
+]
+
+
+def evaluar_clima(clima: dict | None) -> list:
+    """[(tipo, texto)] de las reglas de clima que saltan con el pronóstico de una zona"""
+    if not clima:
+        return []
+    return [(tipo, texto(clima)) for tipo, condicion, texto in REGLAS_CLIMA if condicion(clima)]
+
+
+def _alerta_etapa(etapa: str, cultivos: list) -> tuple:
+    nombres = " y ".join(dict.fromkeys(cultivos))
+    consejo = CONSEJOS_ETAPA.get(etapa, "")
+    return f"etapa:{etapa}", f"📈 <b>{nombres.upper()} PASÓ A {etapa.upper()}</b>\n{consejo}".rstrip()
+
+
+def candidatas(db, alertas_zona: dict, hoy: date) -> tuple:
+    """
+    {telefono: [(tipo, texto)]} con todas las alertas que saltan hoy (antes
+    de descartar las ya enviadas) y cuántas siembras se revisaron.
+    """
+    zonas = [zona_id for zona_id, alertas in alertas_zona.items() if alertas]
+    por_usuario = {}
+    siembras = 0
+    telefono, zona_id, etapas = None, None, {}
+
+    def cerrar():
+        alertas = list(alertas_zona.get(zona_id, []))
+        alertas += [_alerta_etapa(etapa, cultivos) for etapa, cultivos in etapas.items()]
+        if alertas:
+            por_usuario[telefono] = alertas
+
+    for fila in db.execute(CONSULTA_SIEMBRAS_ALERTA, {"hoy": hoy, "zonas": zonas}):
+        siembras += 1
+        if fila.telefono != telefono:
+            if telefono is not None:
+                cerrar()
+            telefono, zona_id, etapas = fila.telefono, fila.zona_id, {}
+        if fila.cambio_etapa:
+            cultivo = datos_referencia.cultivo(fila.cultivo_id)
+            etapas.setdefault(fila.etapa, []).append(cultivo["nombre"] if cultivo else "tu siembra")
+    if telefono is not None:
+        cerrar()
+    return por_usuario, siembras
+
+
+def iterar_nuevas(db, por_usuario: dict, hoy: date, stats: dict, lote: int = 5000,
+                  registradas: dict | None = None, persistir: bool = True):
+    """
+    Registra las alertas en alertas_enviadas por lotes y genera (telefono,
+    mensaje) solo con las que no se habían mandado hoy; en `registradas`
+    deja {telefono: tipos} de lo que registró. Con persistir=False cada lote
+    se deshace (rollback) después de ver cuáles son nuevas.
+    """
+    telefonos = list(por_usuario)
+    for i in range(0, len(telefonos), lote):
+        pares = [(t, tipo) for t in telefonos[i:i + lote] for tipo, _ in por_usuario[t]]
+        nuevas = db.execute(REGISTRAR_ALERTAS, {
+            "hoy": hoy, "telefonos": [t for t, _ in pares], "tipos": [tipo for _, tipo in pares]
+        }).fetchall()
+        if persistir:
+            db.commit()
+        else:
+            db.rollback()
+        stats["alertas"] += len(pares)
+        stats["repetidas"] += len(pares) - len(nuevas)
+
+        tipos_nuevos = {}
+        for fila in nuevas:
+            tipos_nuevos.setdefault(fila.telefono, set()).add(fila.tipo)
+        if registradas is not None:
+            registradas.update(tipos_nuevos)
+        for t, tipos in tipos_nuevos.items():
+            textos = [texto for tipo, texto in por_usuario[t] if tipo in tipos]
+            yield t, "<b>⚠️ AVISO PA' TU CONUCO</b>\n\n" + "\n\n".join(textos) + "\n\n🌱 <i>Mi Conuco Smart</i>"
+
+
+def desregistrar(db, alertas: dict, hoy: date, lote: int = 5000):
+    """Borra de alertas_enviadas {telefono: tipos} de envíos que fallaron"""
+    pares = [(t, tipo) for t, tipos in alertas.items() for tipo in tipos]
+    for i in range(0, len(pares), lote):
+        db.execute(DESREGISTRAR_ALERTAS, {
+            "hoy": hoy, "telefonos": [t for t, _ in pares[i:i + lote]], "tipos": [tipo for _, tipo in pares[i:i + lote]]
+        })
+    db.commit()
+
+
+def ejecutar(hoy: date | None = None, enviar: bool = True) -> dict:
+    """Evalúa las reglas y manda las alertas nuevas; devuelve estadísticas de la corrida"""
+    hoy = hoy or date.today()
+    stats = {"siembras": 0, "usuarios": 0, "alertas": 0, "repetidas": 0, "reportes": 0, "enviados": 0, "fallidos": 0}
+    inicio = time.monotonic()
+
+    db = SessionLocal()
+    try:
+        datos_referencia.asegurar_cargado(db)
+        alertas_zona = {zona_id: evaluar_clima(clima) for zona_id, clima in obtener_clima_zonas(db).items()}
+        por_usuario, stats["siembras"] = candidatas(db, alertas_zona, hoy)
+        stats["usuarios"] = len(por_usuario)
+
+        if not enviar:
+            # Prueba en seco: cuántos mensajes saldrían, sin dejar nada registrado
+            stats["reportes"] = sum(1 for _ in iterar_nuevas(db, por_usuario, hoy, stats, persistir=False))
+        else:
+            dias = int(os.getenv("ALERTAS_RETENCION_DIAS", "7"))
+            db.execute(text("DELETE FROM alertas_enviadas WHERE fecha < :f"), {"f": hoy - timedelta(days=dias)})
+            db.commit()
+
+            registradas, fallidas = {}, []
+
+            def al_terminar(telefono: str, entregado: bool):
+                if not entregado:
+                    fallidas.append(telefono)
+
+            mensajes = iterar_nuevas(db, por_usuario, hoy, stats, registradas=registradas)
+            difusion_matutina.enviar_todos(mensajes, stats, al_terminar)
+            desregistrar(db, {t: registradas[t] for t in fallidas}, hoy)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    stats["segundos"] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    stats = ejecutar()
+    print(
+        f"⚠️  Alertas: {stats['reportes']} mensajes ({stats['enviados']} enviados, {stats['fallidos']} fallidos) "
+        f"pa' {stats['usuarios']} usuarios de {stats['siembras']} siembras revisadas; "
+        f"{stats['repetidas']} ya se habían mandado hoy. {stats['segundos']}s"
+    )
@@ -0,0 +1,84 @@
+"""
+Mantenimiento nocturno de las siembras activas.
+
+Un solo UPDATE sobre todas las siembras activas:
+  - dia_actual: días desde fecha_siembra (se recalcula, no se suma 1, así
+    una noche que no corrió no deja la columna atrasada);
+  - etapa: la de etapas_cultivo pa' ese día (misma regla que
+    DatosReferencia.etapa: la primera etapa cuyo dia_limite sea mayor);
+  - etapa_anterior y etapa_desde: cuando la etapa cambia, marcan el cambio
+    del día pa' que las alertas lo encuentren por índice;
+  - activa = false cuando la siembra pasó su ciclo (dias_ciclo_promedio más
+    SIEMBRAS_GRACIA_DIAS, 30 por defecto, pa' la cosecha que se alarga).
+
+Necesita migrations/001_etapas_cultivo.sql y 004_etapa_siembras.sql.
+
+    cd app && python -m tasks.avanzar_siembras
+"""
+import os
+import time
+from datetime import date
+from sqlalchemy import text
+from config.database import SessionLocal
+
+AVANZAR_SIEMBRAS = text("""
+    WITH calculo AS (
+        SELECT s.id,
+               :hoy - s.fecha_siembra AS dia,
+               COALESCE(e.etapa, 'Desarrollo') AS etapa,
+               :hoy - s.fecha_siembra > c.dias_ciclo_promedio + :gracia AS vencida
+        FROM siembras s
+        JOIN cultivos c ON c.id = s.cultivo_id
+        LEFT JOIN LATERAL (
+            SELECT etapa FROM etapas_cultivo
+            WHERE cultivo_id = s.cultivo_id AND (dia_limite IS NULL OR dia_limite > :hoy - s.fecha_siembra)
+            ORDER BY dia_limite NULLS LAST
+            LIMIT 1
+        ) e ON true
+        WHERE s.activa = true
+    ), actualizadas AS (
+        UPDATE siembras s SET
+            dia_actual = calculo.dia,
+            etapa = calculo.etapa,
+            etapa_anterior = CASE WHEN s.etapa IS DISTINCT FROM calculo.etapa THEN s.etapa ELSE s.etapa_anterior END,
+            etapa_desde = CASE WHEN s.etapa IS DISTINCT FROM calculo.etapa THEN :hoy ELSE s.etapa_desde END,
+            activa = NOT calculo.vencida,
+            terminada_en = CASE WHEN calculo.vencida THEN :hoy END
+        FROM calculo
+        WHERE s.id = calculo.id
+        RETURNING s.etapa_desde = :hoy AND s.etapa_anterior IS NOT NULL AS cambio, calculo.vencida
+    )
+    SELECT count(*) AS siembras,
+           count(*) FILTER (WHERE cambio) AS cambios_etapa,
+           count(*) FILTER (WHERE vencida) AS desactivadas
+    FROM actualizadas
+""")
+
+
+def avanzar(hoy: date | None = None) -> dict:
+    """Avanza todas las siembras activas a `hoy`; devuelve estadísticas de la corrida"""
+    hoy = hoy or date.today()
+    gracia = int(os.getenv("SIEMBRAS_GRACIA_DIAS", "30"))
+    inicio = time.monotonic()
+
+    db = SessionLocal()
+    try:
+        fila = db.execute(AVANZAR_SIEMBRAS, {"hoy": hoy, "gracia": gracia}).one()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    stats = dict(fila._mapping)
+    stats["segundos"] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    stats = avanzar()
+    print(
+        f"🌱 Siembras avanzadas: {stats['siembras']} ({stats['cambios_etapa']} cambiaron de etapa, "
+        f"{stats['desactivadas']} pasaron su ciclo) en {stats['segundos']}s"
+    )
@@ -0,0 +1,364 @@
+"""
+Cola de procesamiento de mensajes de Telegram.
+
+Con TELEGRAM_MODO=cola el webhook solo encola el update y responde 200 al
+momento; un pool de workers hace el procesamiento (DB, clima) y envía la
+respuesta. Cada chat cae siempre en el mismo worker, así sus mensajes se
+procesan en orden.
+
+Backends (COLA_BACKEND):
+  memoria  hilos dentro del mismo proceso (pruebas locales, un solo worker);
+           con DB_ASYNC=1 es un event loop con una tarea por shard y la base
+           va por asyncpg, así COLA_WORKERS puede ser de cientos
+  redis    listas en Redis (settings.redis_url); los workers corren aparte:
+           cd app && python -m tasks.cola_mensajes
+"""
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+import zlib
+from config.database import sesion
+from services.deduplicador import crear_deduplicador
+from services.limitador import LimitadorPorClave
+from services.metricas import metricas
+from services.whatsapp_service import whatsapp_service
+
+# Mensajes por chat: MENSAJES_CHAT_TASA por segundo con ráfagas de MENSAJES_CHAT_RAFAGA.
+# Al que se pasa se le avisa una vez por minuto; lo demás se descarta sin tocar la base.
+limite_mensajes = LimitadorPorClave(
+    float(os.getenv("MENSAJES_CHAT_TASA", "0.5")), float(os.getenv("MENSAJES_CHAT_RAFAGA", "5"))
+)
+_avisos_limite = LimitadorPorClave(1 / 60, 1)
+mensajes_limitados = metricas.contador(
+    "conuco_mensajes_limitados_total", "Mensajes descartados por pasar el límite por chat"
+)
+
+# Telegram reenvía el update cuando tardamos en contestar: cada update_id se procesa una vez
+deduplicador = crear_deduplicador()
+updates_duplicados = metricas.contador(
+    "conuco_updates_duplicados_total", "Updates descartados porque su update_id ya se había recibido"
+)
+
+
+def admitir_update(update: dict) -> bool:
+    """False si el update_id ya llegó antes (un reintento de Telegram); no se procesa"""
+    update_id = update.get("update_id") if isinstance(update, dict) else None
+    if update_id is None or deduplicador.nuevo(update_id):
+        return True
+    updates_duplicados.sumar()
+    return False
+
+
+def ya_procesado(update: dict) -> bool:
+    """True si el update_id ya se marcó como procesado (sin registrar nada)"""
+    update_id = update.get("update_id") if isinstance(update, dict) else None
+    if update_id is None or not deduplicador.visto(update_id):
+        return False
+    updates_duplicados.sumar()
+    return True
+
+
+def marcar_procesado(update: dict):
+    update_id = update.get("update_id") if isinstance(update, dict) else None
+    if update_id is not None:
+        deduplicador.nuevo(update_id)
+
+
+def extraer_mensaje(update: dict) -> tuple | None:
+    """
+    Saca (chat_id, texto) de un update de Telegram, o None si no hay texto.
+    Una ubicación compartida llega como texto "lat,lon" (la entiende determinar_zona).
+    """
+    if not update or "message" not in update:
+        return None
+    message = update["message"]
+    chat_id = str(message["chat"]["id"])
+    text = message.get("text", "").strip()
+    if not text and "location" in message:
+        text = f"{message['location']['latitude']},{message['location']['longitude']}"
+    if not text:
+        return None
+    return chat_id, text
+
+
+def admitir_mensaje(chat_id: str) -> bool:
+    """False si el chat va muy rápido; el mensaje no se procesa"""
+    if limite_mensajes.intentar(chat_id):
+        return True
+    mensajes_limitados.sumar()
+    if _avisos_limite.intentar(chat_id):
+        whatsapp_service.responder(chat_id, "Calma, compa 😅 Me llegaron muchos mensajes juntos. Espera un momentico y mándame lo que necesites.")
+    return False
+
+
+def procesar_update(update: dict) -> bool:
+    """Procesa un update completo: genera la respuesta y la envía; False si falló"""
+    mensaje = extraer_mensaje(update)
+    if not mensaje:
+        return True
+    chat_id, text = mensaje
+
+    try:
+        print(f"Mensaje de {chat_id}: {text}")
+        with metricas.comando():
+            # La conexión vuelve al pool antes de esperar a Telegram
+            with sesion() as db:
+                respuesta = whatsapp_service.procesar_mensaje_entrante(chat_id, text, db)
+            if respuesta:
+                whatsapp_service.responder(chat_id, respuesta)
+        return True
+    except Exception as e:
+        print(f"Error procesando update de {chat_id}: {e}")
+        return False
+
+
+def agrupar_por_chat(updates: list, deduplicar: bool = True) -> tuple:
+    """
+    ({chat_id: [updates en orden de llegada]}, cuántos eran repetidos) de un
+    lote. Con deduplicar se saltan los ya marcados como procesados, pero no
+    se marca nada: eso lo hace procesar_chat(marcar=True) al terminar cada uno.
+    """
+    por_chat = {}
+    repetidos = 0
+    for update in updates:
+        if deduplicar and ya_procesado(update):
+            repetidos += 1
+            continue
+        mensaje = extraer_mensaje(update)
+        if mensaje:
+            por_chat.setdefault(mensaje[0], []).append(update)
+    return por_chat, repetidos
+
+
+def procesar_chat(chat_id: str, updates: list, marcar: bool = False) -> list:
+    """
+    Los mensajes de un chat en orden, con el límite por chat. Devuelve los
+    update_id que terminaron (procesados o descartados por el límite); los
+    que fallan no salen ahí. Con marcar, además se registran en el
+    deduplicador a medida que terminan.
+    """
+    terminados = []
+    for update in updates:
+        if not admitir_mensaje(chat_id) or procesar_update(update):
+            if marcar:
+                marcar_procesado(update)
+            terminados.append(update.get("update_id"))
+    return terminados
+
+
+def procesar_por_chat(pool, por_chat: dict, marcar: bool = False) -> list:
+    """
+    Un chat por tarea del pool y sus mensajes en orden, uno tras otro; los
+    chats distintos en paralelo. Vuelve cuando terminaron todos, con los
+    update_id que terminaron bien (ver procesar_chat).
+    """
+    tareas = [pool.submit(procesar_chat, chat_id, pendientes, marcar) for chat_id, pendientes in por_chat.items()]
+    return [update_id for tarea in tareas for update_id in tarea.result()]
+
+
+def sin_terminar(por_chat: dict, terminados: list) -> list:
+    """update_id del lote que no están entre los terminados"""
+    terminados = set(terminados)
+    return [
+        update["update_id"] for pendientes in por_chat.values() for update in pendientes
+        if update.get("update_id") is not None and update["update_id"] not in terminados
+    ]
+
+
+async def procesar_update_async(update: dict):
+    """procesar_update con sesión async"""
+    from config.database_async import sesion_async  # Solo hace falta con DB_ASYNC=1
+
+    mensaje = extraer_mensaje(update)
+    if not mensaje:
+        return
+    chat_id, text = mensaje
+
+    try:
+        print(f"Mensaje de {chat_id}: {text}")
+        with metricas.comando():
+            async with sesion_async() as db:
+                respuesta = await whatsapp_service.procesar_mensaje_entrante_async(chat_id, text, db)
+            if respuesta:
+                await asyncio.to_thread(whatsapp_service.responder, chat_id, respuesta)
+    except Exception as e:
+        print(f"Error procesando update de {chat_id}: {e}")
+
+
+def _shard(chat_id: str, total: int) -> int:
+    """Shard estable entre procesos (hash() de Python cambia en cada arranque)"""
+    return zlib.crc32(chat_id.encode()) % total
+
+
+class ColaMemoria:
+    """Un hilo y una cola por shard; el chat_id decide el shard"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._colas = [queue.Queue() for _ in range(workers)]
+        self._hilos = []
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilos:
+                return
+            for cola in self._colas:
+                hilo = threading.Thread(target=self._trabajar, args=(cola,), daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def _trabajar(self, cola: queue.Queue):
+        while True:
+            update = cola.get()
+            try:
+                procesar_update(update)
+            finally:
+                cola.task_done()
+
+    def encolar(self, chat_id: str, update: dict):
+        self._iniciar()
+        self._colas[_shard(chat_id, self.workers)].put(update)
+
+    def pendientes(self) -> int:
+        return sum(cola.qsize() for cola in self._colas)
+
+
+class ColaAsync:
+    """Un event loop en su propio hilo y una asyncio.Queue por shard"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._loop = None
+        self._colas = []
+        self._lock = threading.Lock()
+        self._lista = threading.Event()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._correr, daemon=True).start()
+            self._lista.wait()
+
+    def _correr(self):
+        asyncio.set_event_loop(self._loop)
+        self._colas = [asyncio.Queue() for _ in range(self.workers)]
+        for cola in self._colas:
+            self._loop.create_task(self._trabajar(cola))
+        self._lista.set()
+        self._loop.run_forever()
+
+    async def _trabajar(self, cola: asyncio.Queue):
+        while True:
+            update = await cola.get()
+            await procesar_update_async(update)
+
+    def encolar(self, chat_id: str, update: dict):
+        self._iniciar()
+        cola = self._colas[_shard(chat_id, self.workers)]
+        self._loop.call_soon_threadsafe(cola.put_nowait, update)
+
+    def pendientes(self) -> int:
+        return sum(cola.qsize() for cola in self._colas)
+
+
+class ColaRedis:
+    """Una lista de Redis por shard; cada shard lo consume un solo worker"""
+
+    def __init__(self, workers: int, redis_url: str, prefijo: str = "conuco:updates"):
+        import redis  # Solo hace falta con COLA_BACKEND=redis
+
+        self.workers = workers
+        self.prefijo = prefijo
+        self.redis = redis.Redis.from_url(redis_url)
+
+    def _clave(self, shard: int) -> str:
+        return f"{self.prefijo}:{shard}"
+
+    def encolar(self, chat_id: str, update: dict):
+        self.redis.rpush(self._clave(_shard(chat_id, self.workers)), json.dumps(update))
+
+    def pendientes(self) -> int:
+        return sum(self.redis.llen(self._clave(shard)) for shard in range(self.workers))
+
+    def trabajar(self, shards: list | None = None):
+        """Consume los shards indicados (todos por defecto), un hilo por shard"""
+        shards = range(self.workers) if shards is None else shards
+        hilos = []
+        for shard in shards:
+            hilo = threading.Thread(target=self._consumir, args=(shard,), daemon=True)
+            hilo.start()
+            hilos.append(hilo)
+        print(f"Workers de cola escuchando shards {list(shards)}")
+        for hilo in hilos:
+            hilo.join()
+
+    def _consumir(self, shard: int):
+        clave = self._clave(shard)
+        while True:
+            try:
+                _, dato = self.redis.blpop(clave)
+                procesar_update(json.loads(dato))
+            except Exception as e:
+                print(f"Error en worker del shard {shard}: {e}")
+
+
+class ColaMensajes:
+    """Punto de entrada para el webhook: decide si procesar en línea o encolar"""
+
+    def __init__(self):
+        self.modo = os.getenv("TELEGRAM_MODO", "sincrono")
+        self.backend = os.getenv("COLA_BACKEND", "memoria")
+        self.workers = int(os.getenv("COLA_WORKERS", "8"))
+        self._cola = None
+
+    @property
+    def activa(self) -> bool:
+        return self.modo == "cola"
+
+    @property
+    def cola(self):
+        if self._cola is None:
+            from config.settings import settings  # pydantic solo cuando hay cola
+
+            if self.backend == "redis":
+                self._cola = ColaRedis(self.workers, settings.redis_url)
+            elif settings.db_async:
+                self._cola = ColaAsync(self.workers)
+            else:
+                self._cola = ColaMemoria(self.workers)
+        return self._cola
+
+    def encolar(self, update: dict) -> bool:
+        """Encola el update; devuelve False si no trae un mensaje de texto"""
+        mensaje = extraer_mensaje(update)
+        if not mensaje:
+            return False
+        self.cola.encolar(mensaje[0], update)
+        return True
+
+    def pendientes(self) -> int:
+        return self.cola.pendientes()
+
+
+cola_mensajes = ColaMensajes()
+metricas.medidor(
+    "conuco_cola_pendientes", "Updates esperando en la cola de procesamiento",
+    lambda: cola_mensajes.pendientes() if cola_mensajes.activa else 0
+)
+
+
+if __name__ == "__main__":
+    # Uso: python -m tasks.cola_mensajes [shard ...]
+    if cola_mensajes.backend != "redis":
+        raise SystemExit("Los workers separados solo hacen falta con COLA_BACKEND=redis")
+    if os.getenv("CLIMA_PRECALENTAR", "0") == "1":
+        from tasks.precalentar_clima import iniciar_precalentamiento
+        iniciar_precalentamiento()
+    shards = [int(s) for s in sys.argv[1:]] or None
+    cola_mensajes.cola.trabajar(shards)
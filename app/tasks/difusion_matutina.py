@@ -0,0 +1,132 @@
+"""
+Difusión matutina: manda el reporte del día a cada usuario con siembras
+activas (todas sus siembras en un mensaje).
+
+Pensado pa' correr desde cron temprano en la mañana:
+    cd app && python -m tasks.difusion_matutina
+
+Los reportes se arman en lote (ver tasks.reportes_lote) y los envíos salen
+en paralelo respetando los límites de Telegram (~30 mensajes/s en total y
+1/s por chat). Con TELEGRAM_ENVIOS=cola los envíos pasan por la cola de
+envíos (con reintentos y fallidos guardados), detrás de las respuestas
+interactivas.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.database import SessionLocal
+from services.datos_referencia import datos_referencia
+from services.cola_envios import DIFUSION
+from services.limitador import CuboTokens, LimitadorPorClave
+from services.whatsapp_service import whatsapp_service
+from tasks.reportes_lote import iterar_reportes, obtener_clima_zonas
+
+
+class DifusionMatutina:
+    def __init__(self):
+        self.hilos = int(os.getenv("DIFUSION_HILOS", "16"))
+        self.lote = int(os.getenv("DIFUSION_LOTE", "1000"))
+        self.limite_global = CuboTokens(float(os.getenv("TELEGRAM_LIMITE_GLOBAL", "30")))
+        self.limite_chat = LimitadorPorClave(float(os.getenv("TELEGRAM_LIMITE_CHAT", "1")))
+        self._lock = threading.Lock()
+
+    def _contar(self, chat_id: str, entregado: bool, stats: dict, al_terminar):
+        with self._lock:
+            stats["enviados" if entregado else "fallidos"] += 1
+        if al_terminar is not None:
+            try:
+                al_terminar(chat_id, entregado)
+            except Exception as e:
+                print(f"Error en al_terminar de la difusión a {chat_id}: {e}")
+
+    def _encolar(self, chat_id: str, reporte: str, stats: dict, cupo: threading.BoundedSemaphore, al_terminar):
+        def terminado(entregado: bool):
+            self._contar(chat_id, entregado, stats, al_terminar)
+            cupo.release()
+
+        try:
+            whatsapp_service.cola_envios.encolar(chat_id, reporte, DIFUSION, terminado)
+        except Exception as e:
+            # Sin encolar, terminado nunca se llama: el cupo se devuelve aquí
+            print(f"Error encolando difusión a {chat_id}: {e}")
+            self._contar(chat_id, False, stats, al_terminar)
+            cupo.release()
+
+    def _enviar(self, chat_id: str, reporte: str, stats: dict, al_terminar):
+        self.limite_chat.esperar(chat_id)
+        self.limite_global.esperar()
+        enviado = whatsapp_service.enviar_mensaje(chat_id, reporte)
+        self._contar(chat_id, enviado, stats, al_terminar)
+
+    def enviar_todos(self, mensajes, stats: dict, al_terminar=None):
+        """
+        Envía (chat_id, texto) en paralelo dentro de los límites de Telegram.
+        Los None cuentan como fallidos; stats lleva reportes, enviados y fallidos.
+        `al_terminar(chat_id, entregado)` se llama con el resultado de cada envío.
+        """
+        # Cupo de envíos pendientes pa' no cargar en memoria todos los mensajes de golpe
+        cupo = threading.BoundedSemaphore(self.hilos * 4)
+
+        def enviar_y_liberar(chat_id, reporte):
+            try:
+                self._enviar(chat_id, reporte, stats, al_terminar)
+            except Exception as e:
+                print(f"Error enviando difusión a {chat_id}: {e}")
+                self._contar(chat_id, False, stats, al_terminar)
+            finally:
+                cupo.release()
+
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            for telefono, reporte in mensajes:
+                if reporte is None:
+                    with self._lock:
+                        stats["fallidos"] += 1
+                    continue
+                stats["reportes"] += 1
+                cupo.acquire()
+                if whatsapp_service.envios_en_cola:
+                    self._encolar(telefono, reporte, stats, cupo, al_terminar)
+                else:
+                    pool.submit(enviar_y_liberar, telefono, reporte)
+        if whatsapp_service.envios_en_cola:
+            # Cuando se recupera todo el cupo, la cola ya entregó (o dio por fallidos) todos
+            for _ in range(self.hilos * 4):
+                cupo.acquire()
+
+    def ejecutar(self) -> dict:
+        """Genera y envía todos los reportes; devuelve estadísticas de la corrida"""
+        stats = {"reportes": 0, "enviados": 0, "fallidos": 0, "zonas": 0, "zonas_sin_clima": 0}
+        inicio = time.monotonic()
+
+        db = SessionLocal()
+        try:
+            datos_referencia.asegurar_cargado(db)
+            clima_por_zona = obtener_clima_zonas(db)
+            stats["zonas"] = len(clima_por_zona)
+            stats["zonas_sin_clima"] = sum(1 for datos in clima_por_zona.values() if not datos)
+            fin_clima = time.monotonic()
+
+            self.enviar_todos(iterar_reportes(db, clima_por_zona, self.lote), stats)
+        finally:
+            db.close()
+
+        duracion = time.monotonic() - inicio
+        stats["segundos_clima"] = round(fin_clima - inicio, 2)
+        stats["segundos_total"] = round(duracion, 2)
+        stats["mensajes_por_segundo"] = round(stats["enviados"] / duracion, 1) if duracion > 0 else 0
+        return stats
+
+
+difusion_matutina = DifusionMatutina()
+
+
+if __name__ == "__main__":
+    print("📣 Iniciando difusión matutina...")
+    stats = difusion_matutina.ejecutar()
+    print(
+        f"✅ Difusión terminada: {stats['enviados']}/{stats['reportes']} enviados, "
+        f"{stats['fallidos']} fallidos, {stats['zonas']} zonas "
+        f"({stats['zonas_sin_clima']} sin clima) en {stats['segundos_total']}s "
+        f"({stats['mensajes_por_segundo']} msg/s)"
+    )
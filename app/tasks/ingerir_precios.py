@@ -0,0 +1,72 @@
+"""
+Ingesta de precios de mercado (services/precios.py).
+
+Lee los archivos de precios (CSV, JSON Lines o JSON) que se le pasen, o
+todos los de PRECIOS_DIR (app/data/precios por defecto, con un ejemplo
+de MERCADOM), guarda el historial por cultivo, mercado y día, y rehace
+resumen_precios: último precio, promedios de 7 y 30 días y tendencia.
+REPORTE lee el resumen del catálogo en memoria, que se recarga solo
+cuando cambia.
+
+    cd app && python -m tasks.ingerir_precios                     # PRECIOS_DIR
+    cd app && python -m tasks.ingerir_precios precios_hoy.csv     # archivos sueltos
+
+Necesita migrations/007_precios.sql.
+"""
+import os
+import sys
+import time
+from config.database import SessionLocal
+from services.datos_referencia import datos_referencia
+from services.precios import IngestorPrecios
+
+DIRECTORIO_PRECIOS = os.getenv(
+    "PRECIOS_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "precios")
+)
+EXTENSIONES = (".csv", ".json", ".jsonl", ".ndjson")
+
+
+def archivos_precios(rutas: list) -> list:
+    """Los archivos de precios de las rutas dadas (un directorio aporta todos los suyos, en orden)"""
+    archivos = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            archivos += [os.path.join(ruta, nombre) for nombre in sorted(os.listdir(ruta))
+                         if nombre.lower().endswith(EXTENSIONES)]
+        else:
+            archivos.append(ruta)
+    return archivos
+
+
+def ingerir(rutas: list | None = None) -> dict:
+    """Carga los precios y recalcula el resumen; devuelve estadísticas de la corrida"""
+    archivos = archivos_precios(rutas or [DIRECTORIO_PRECIOS])
+    inicio = time.monotonic()
+
+    db = SessionLocal()
+    try:
+        datos_referencia.asegurar_cargado(db)
+        ingestor = IngestorPrecios(datos_referencia)
+        stats = ingestor.cargar(db, archivos)
+        stats["cultivos"] = ingestor.recalcular_resumen(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    # Los otros procesos se enteran por el trigger de resumen_precios (NOTIFY que
+    # escucha el hilo de DatosReferencia desde su primera carga, o al vencer
+    # REFERENCIA_TTL si se apagó con REFERENCIA_NOTIFY=0); este, de una vez
+    datos_referencia.invalidar()
+    stats["segundos"] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    stats = ingerir(sys.argv[1:])
+    print(
+        f"💰 Precios guardados: {stats['filas']} de {stats['archivos']} archivos "
+        f"({stats['descartadas']} filas descartadas); resumen de {stats['cultivos']} cultivos en {stats['segundos']}s"
+    )
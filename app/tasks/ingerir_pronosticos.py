@@ -0,0 +1,66 @@
+"""
+Ingesta de pronósticos de varios días al almacén local (services/pronosticos.py).
+
+Pide a Open-Meteo CLIMA_DIAS_INGESTA días (7 por defecto), diarios y por
+hora, pa' todas las zonas en lotes de CLIMA_LOTE_ZONAS, y los guarda en
+pronosticos_diarios / pronosticos_horarios. Con CLIMA_FUENTE=local los
+REPORTE, la difusión y las alertas leen de ahí en vez de llamar a la API.
+
+    cd app && python -m tasks.ingerir_pronosticos          # una pasada
+    cd app && python -m tasks.ingerir_pronosticos 60       # cada 60 minutos
+
+Necesita migrations/006_pronosticos.sql.
+"""
+import os
+import sys
+import time
+from datetime import date, timedelta
+from config.database import SessionLocal
+from services.clima_service import clima_service
+from services.datos_referencia import datos_referencia
+from services.pronosticos import almacen_pronosticos
+
+
+def ingerir(dias: int | None = None) -> dict:
+    """Baja y guarda el pronóstico de todas las zonas; devuelve estadísticas de la corrida"""
+    dias = dias or int(os.getenv("CLIMA_DIAS_INGESTA", "7"))
+    retencion = int(os.getenv("CLIMA_RETENCION_DIAS", "30"))
+    stats = {"zonas": 0, "zonas_sin_datos": 0, "dias": 0}
+    inicio = time.monotonic()
+
+    db = SessionLocal()
+    try:
+        datos_referencia.asegurar_cargado(db)
+        zonas = [zona for zona in datos_referencia.zonas.values() if zona.get("latitud") is not None]
+        stats["zonas"] = len(zonas)
+
+        for zona, respuesta in zip(zonas, clima_service.consultar_pronosticos(zonas, dias)):
+            if not respuesta:
+                stats["zonas_sin_datos"] += 1
+                continue
+            stats["dias"] += almacen_pronosticos.guardar(db, zona["id"], respuesta)
+        stats["purgados"] = almacen_pronosticos.purgar(db, date.today() - timedelta(days=retencion))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    # Lo recién guardado reemplaza lo que había en el cache de este proceso
+    clima_service.limpiar_cache()
+    stats["segundos"] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    minutos = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    while True:
+        stats = ingerir()
+        print(
+            f"🌦️  Pronósticos guardados: {stats['dias']} días de {stats['zonas']} zonas "
+            f"({stats['zonas_sin_datos']} sin datos, {stats['purgados']} días viejos borrados) en {stats['segundos']}s"
+        )
+        if not minutos:
+            break
+        time.sleep(minutos * 60)
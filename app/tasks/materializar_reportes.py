@@ -0,0 +1,79 @@
+"""
+Materialización diaria de reportes en la tabla reportes_diarios.
+
+Arma el reporte de hoy de cada usuario con siembra activa y lo guarda; con
+REPORTES_MATERIALIZADOS=1 el comando REPORTE lo sirve con una sola búsqueda
+por (telefono, fecha) y solo genera en vivo si no lo encuentra.
+
+    cd app && python -m tasks.materializar_reportes          # una pasada
+    cd app && python -m tasks.materializar_reportes 60       # cada 60 minutos
+
+Solo se reescriben las filas cuyo texto cambió, así que correrlo seguido
+(p. ej. cuando se refresca el clima o los precios de una zona) es barato.
+Los usuarios de zonas sin clima en esta corrida se saltan: REPORTE les
+genera el reporte en vivo (que reintenta el clima) en vez de servir todo
+el día uno que dice que no hubo dato del tiempo.
+"""
+import os
+import sys
+import time
+from datetime import date
+from sqlalchemy import text
+from config.database import SessionLocal
+from services.datos_referencia import datos_referencia
+from services.whatsapp_service import whatsapp_service
+from tasks.reportes_lote import iterar_reportes, obtener_clima_zonas
+
+GUARDAR_REPORTE = text("""
+    INSERT INTO reportes_diarios (telefono, fecha, texto, generado_en)
+    VALUES (:telefono, :fecha, :texto, now())
+    ON CONFLICT (telefono, fecha) DO UPDATE SET texto = EXCLUDED.texto, generado_en = now()
+    WHERE reportes_diarios.texto IS DISTINCT FROM EXCLUDED.texto
+""")
+
+
+def materializar(lote: int | None = None) -> dict:
+    """Genera y guarda los reportes de hoy; devuelve estadísticas de la corrida"""
+    lote = lote or int(os.getenv("MATERIALIZAR_LOTE", "1000"))
+    stats = {"reportes": 0, "sin_datos": 0, "zonas_sin_clima": 0}
+    inicio = time.monotonic()
+    hoy = date.today()
+
+    db = SessionLocal()
+    try:
+        datos_referencia.asegurar_cargado(db)
+        clima_por_zona = obtener_clima_zonas(db)
+        con_clima = {zona_id for zona_id, clima in clima_por_zona.items() if whatsapp_service.tiene_clima(clima)}
+        stats["zonas_sin_clima"] = len(clima_por_zona) - len(con_clima)
+
+        pendientes = []
+        for telefono, reporte in iterar_reportes(db, clima_por_zona, lote, zonas=con_clima):
+            if reporte is None:
+                stats["sin_datos"] += 1
+                continue
+            pendientes.append({"telefono": telefono, "fecha": hoy, "texto": reporte})
+            stats["reportes"] += 1
+
+        # Se escribe al final pa' no mezclar el cursor en streaming con los INSERT
+        for i in range(0, len(pendientes), lote):
+            db.execute(GUARDAR_REPORTE, pendientes[i:i + lote])
+        db.execute(text("DELETE FROM reportes_diarios WHERE fecha < :hoy"), {"hoy": hoy})
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    stats["segundos"] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    minutos = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    while True:
+        stats = materializar()
+        print(f"📝 Reportes materializados: {stats['reportes']} ({stats['sin_datos']} sin datos, {stats['zonas_sin_clima']} zonas sin clima) en {stats['segundos']}s")
+        if not minutos:
+            break
+        time.sleep(minutos * 60)
@@ -0,0 +1,373 @@
+"""
+Modo particionado (PARTICIONES=1): varios nodos del bot, cada chat en uno.
+
+El dueño de cada chat_id sale de un anillo de hash consistente con los
+nodos vivos (services/particiones.py). El nodo que recibe un update (por
+el webhook o por getUpdates) lo procesa si el chat es suyo; si no, se lo
+pasa al dueño por HTTP interno (PARTICION_PUERTO) y espera a que termine.
+Así el estado de la conversación (con ESTADOS_BACKEND=memoria), el cache
+de REPORTE y los límites por chat viven en un solo nodo, sin nada
+compartido en el camino de cada mensaje.
+
+Cada nodo late en la tabla nodos_particion (migrations/010_nodos_particion.sql)
+cada PARTICION_LATIDO segundos y recalcula el anillo cuando alguien entra
+o sale. Al rebalancear:
+  - los estados de registro de los chats que cambiaron de dueño se le
+    mandan al nuevo dueño (solo con ESTADOS_BACKEND=memoria; redis y sql
+    ya son compartidos);
+  - se sueltan el cache de REPORTE y los límites de esos chats;
+  - el límite global de envíos (TELEGRAM_LIMITE_GLOBAL) se reparte entre
+    los nodos, porque es del bot y no de cada proceso.
+Un nodo que se apaga bien (Ctrl+C o SIGTERM) sale de la tabla y entrega sus
+estados antes de irse; uno que se cae los pierde, como pasaba sin
+particiones.
+
+El HTTP interno acepta updates a nombre de cualquier chat, así que sin
+PARTICION_SECRETO solo escucha en 127.0.0.1 (nodos en la misma máquina).
+Pa' nodos en varias máquinas hay que poner el mismo PARTICION_SECRETO en
+todos; entonces escucha en PARTICION_HOST (0.0.0.0 por defecto) y cada
+petición lleva el secreto en X-Particion-Secreto.
+
+Los nodos se levantan siempre con su propio proceso (uno por
+PARTICION_PUERTO); el webhook (main.py) no es nodo aunque corra con varios
+workers de uvicorn/gunicorn: cada worker solo lee los nodos vivos
+(conectar) y le pasa cada update al dueño de su chat.
+
+    cd app && PARTICION_PUERTO=8091 python -m tasks.particiones            # nodo
+    cd app && PARTICION_PUERTO=8090 python -m tasks.particiones --sondeo   # nodo que además lee getUpdates
+
+Prueba local con varios procesos: loadtest/particiones_local.py.
+"""
+import hmac
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from services.cliente_http import cliente_http
+from services.estado_conversacion import AlmacenEstadosMemoria, _deserializar, _serializar
+from services.metricas import metricas
+from services.particiones import AnilloConsistente, MembresiaSQL
+from services.whatsapp_service import whatsapp_service
+from tasks.cola_mensajes import (
+    agrupar_por_chat, limite_mensajes, marcar_procesado, procesar_chat, procesar_por_chat, sin_terminar
+)
+
+updates_reenviados = metricas.contador(
+    "conuco_updates_reenviados_total", "Updates pasados al nodo dueño del chat, por resultado"
+)
+
+
+class _ManejadorInterno(BaseHTTPRequestHandler):
+    """HTTP entre nodos: updates y estados de los chats de este nodo"""
+    coordinador = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass
+
+    def responder(self, codigo: int, cuerpo: dict):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        if self.path == "/particion":
+            self.responder(200, self.coordinador.estado())
+        else:
+            self.responder(404, {"ok": False})
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.coordinador.autorizado(self.headers.get("X-Particion-Secreto", "")):
+            self.responder(403, {"ok": False})
+        elif self.path == "/particion/updates":
+            self.responder(200, {"ok": True, "procesados": self.coordinador.recibir_updates(cuerpo.get("updates", []))})
+        elif self.path == "/particion/estados":
+            self.responder(200, {"ok": True, "guardados": self.coordinador.recibir_estados(cuerpo.get("estados", {}))})
+        else:
+            self.responder(404, {"ok": False})
+
+
+class CoordinadorParticiones:
+    def __init__(self):
+        self.activo = os.getenv("PARTICIONES", "0") == "1"
+        self.puerto = int(os.getenv("PARTICION_PUERTO", "8090"))
+        self.nodo = os.getenv("PARTICION_NODO") or f"{socket.gethostname()}-{os.getpid()}"
+        self.direccion = os.getenv("PARTICION_URL") or f"http://127.0.0.1:{self.puerto}"
+        self.secreto = os.getenv("PARTICION_SECRETO", "")
+        self.host = os.getenv("PARTICION_HOST") or ("0.0.0.0" if self.secreto else "127.0.0.1")
+        self.latido = float(os.getenv("PARTICION_LATIDO", "5"))
+        self.virtuales = int(os.getenv("PARTICION_VIRTUALES", "64"))
+        self.timeout = float(os.getenv("PARTICION_TIMEOUT", "60"))
+        self.workers = int(os.getenv("PARTICION_WORKERS", "16"))
+
+        self.anillo = AnilloConsistente([self.nodo], self.virtuales)
+        self.direcciones = {self.nodo: self.direccion}
+        self.stats = {"procesados": 0, "reenviados": 0, "recibidos": 0, "fallback": 0,
+                      "estados_enviados": 0, "estados_recibidos": 0, "rebalanceos": 0}
+        self.membresia = None
+        self._pool = None
+        self._servidor = None
+        self._detenido = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_stats = threading.Lock()
+
+    def autorizado(self, secreto: str) -> bool:
+        return hmac.compare_digest(secreto.encode(), self.secreto.encode())
+
+    def _sumar(self, clave: str, n: int = 1):
+        with self._lock_stats:
+            self.stats[clave] += n
+
+    def iniciar(self):
+        """Arranca el HTTP interno, se anota como vivo y late en un hilo de fondo"""
+        if not self.secreto and self.host not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError(
+                f"PARTICION_SECRETO no configurado: sin él el HTTP interno no puede escuchar en {self.host}, "
+                "cualquiera que llegue al puerto mandaría updates a nombre de cualquier chat"
+            )
+        self.membresia = MembresiaSQL(self._engine(), vencimiento=self.latido * 3)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="particion")
+
+        manejador = type("ManejadorInterno", (_ManejadorInterno,), {"coordinador": self})
+        self._servidor = ThreadingHTTPServer((self.host, self.puerto), manejador)
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+
+        self.actualizar()
+        threading.Thread(target=self._latir, args=(self.actualizar,), daemon=True).start()
+        print(f"🧩 Nodo {self.nodo} en {self.direccion}; nodos: {sorted(self.direcciones)}")
+
+    def conectar(self):
+        """
+        Solo enruta, sin ser nodo: lee los nodos vivos cada PARTICION_LATIDO
+        segundos pa' saber el dueño de cada chat, pero no se anota, no abre el
+        HTTP interno y ningún chat es suyo. Es lo que hace cada worker del
+        webhook, así da igual cuántos procesos levante el servidor.
+        """
+        self.membresia = MembresiaSQL(self._engine(), vencimiento=self.latido * 3)
+        self.anillo = AnilloConsistente([], self.virtuales)
+        self.direcciones = {}
+        self.mirar()
+        threading.Thread(target=self._latir, args=(self.mirar,), daemon=True).start()
+        print(f"🧩 Enrutando a los nodos: {sorted(self.direcciones)}")
+
+    def _engine(self):
+        url = os.getenv("PARTICION_SQL_URL")
+        if url:
+            from config.database import engine_aparte
+            return engine_aparte(url)
+        from config.database import obtener_engine
+        return obtener_engine()
+
+    def _latir(self, paso):
+        while not self._detenido.wait(self.latido):
+            try:
+                paso()
+            except Exception as e:
+                print(f"Error actualizando nodos de la partición: {e}")
+
+    def mirar(self):
+        """Rehace el anillo con los nodos vivos, sin latir (ver conectar)"""
+        vivos = self.membresia.vivos()
+        if set(vivos) != self.anillo.nodos:
+            self.anillo = AnilloConsistente(vivos, self.virtuales)
+        self.direcciones = vivos
+
+    def actualizar(self):
+        """Late y, si cambió quién está vivo, rehace el anillo y rebalancea"""
+        self.membresia.latir(self.nodo, self.direccion)
+        vivos = self.membresia.vivos()
+        vivos[self.nodo] = self.direccion
+        if set(vivos) != self.anillo.nodos:
+            self._aplicar(vivos)
+        else:
+            self.direcciones = vivos
+
+    def _aplicar(self, vivos: dict):
+        with self._lock:
+            self.anillo = AnilloConsistente(vivos, self.virtuales)
+            self.direcciones = vivos
+            self._sumar("rebalanceos")
+            print(f"🧩 Nodos: {sorted(vivos)}")
+            self._repartir_limite_global(len(vivos))
+            self._soltar_ajenos()
+
+    def _repartir_limite_global(self, nodos: int):
+        if whatsapp_service.envios_en_cola:
+            total = float(os.getenv("TELEGRAM_LIMITE_GLOBAL", "30"))
+            whatsapp_service.cola_envios.limite_global.ajustar(total / nodos)
+
+    def _soltar_ajenos(self):
+        """Entrega los estados de los chats que ya no son de este nodo y suelta sus caches"""
+        estados = whatsapp_service.estados_usuario
+        if isinstance(estados, AlmacenEstadosMemoria):
+            por_nodo = {}
+            for chat_id in estados.claves():
+                dueno = self.dueno(chat_id)
+                estado = estados.obtener(chat_id)
+                if dueno != self.nodo and estado is not None:
+                    por_nodo.setdefault(dueno, {})[chat_id] = _serializar(estado)
+            for nodo, lote in por_nodo.items():
+                try:
+                    self._enviar(nodo, "/particion/estados", {"estados": lote})
+                except Exception as e:
+                    print(f"No se pudieron pasar {len(lote)} estados a {nodo}: {e}")
+                    continue
+                for chat_id in lote:
+                    estados.eliminar(chat_id)
+                self._sumar("estados_enviados", len(lote))
+
+        ajeno = lambda chat_id: not self.es_propio(chat_id)
+        whatsapp_service.cache_reportes.descartar_si(ajeno)
+        limite_mensajes.descartar_si(ajeno)
+        if whatsapp_service.envios_en_cola:
+            whatsapp_service.cola_envios.limite_chat.descartar_si(ajeno)
+
+    def dueno(self, chat_id: str) -> str:
+        return self.anillo.nodo(chat_id)
+
+    def es_propio(self, chat_id: str) -> bool:
+        return self.anillo.nodo(chat_id) == self.nodo
+
+    def _enviar(self, nodo: str, ruta: str, cuerpo: dict):
+        response = cliente_http.post(
+            f"{self.direcciones[nodo]}{ruta}", json=cuerpo, reintentos=0,
+            headers={"X-Particion-Secreto": self.secreto}, timeout=(cliente_http.timeout_conexion, self.timeout)
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def reenviar(self, nodo: str, por_chat: dict, marcar: bool = False) -> bool:
+        """
+        Pasa los updates de unos chats a su dueño y espera a que los procese;
+        el dueño contesta con los update_id que terminaron. Si el nodo no
+        contesta la conexión (se cayó y todavía no venció su latido) se
+        procesan aquí. Si falla de otro modo (timeout, 5xx) no se sabe cuáles
+        procesó. En ambos casos, si alguno no terminó devuelve False y quien
+        llamó los hace reintentar (el webhook con 500, el sondeo sin avanzar
+        el offset). Con marcar se marcan como procesados solo los terminados.
+        """
+        updates = [update for pendientes in por_chat.values() for update in pendientes]
+        try:
+            terminados = self._enviar(nodo, "/particion/updates", {"updates": updates}).get("procesados", [])
+            updates_reenviados.sumar(len(updates), resultado="ok")
+            self._sumar("reenviados", len(updates))
+            if marcar:
+                for update_id in terminados:
+                    marcar_procesado({"update_id": update_id})
+        except requests.exceptions.ConnectionError as e:
+            print(f"Nodo {nodo} no responde ({e}); proceso aquí {len(updates)} updates")
+            updates_reenviados.sumar(len(updates), resultado="fallback")
+            self._sumar("fallback", len(updates))
+            terminados = [
+                update_id for chat_id, pendientes in por_chat.items()
+                for update_id in procesar_chat(chat_id, pendientes, marcar)
+            ]
+        except Exception as e:
+            print(f"Error pasando {len(updates)} updates a {nodo}: {e}")
+            updates_reenviados.sumar(len(updates), resultado="error")
+            return False
+        fallidos = sin_terminar(por_chat, terminados)
+        if fallidos:
+            print(f"{len(fallidos)} updates pasados a {nodo} no terminaron: {fallidos}")
+        return not fallidos
+
+    def procesar(self, por_chat: dict, marcar: bool = False) -> bool:
+        """
+        Procesa un lote agrupado por chat: los chats propios aquí, los demás
+        en su nodo (todo en paralelo). Vuelve cuando terminó todo el lote;
+        False si algún update no terminó, aquí o en otro nodo (ver reenviar).
+        """
+        propios, ajenos = {}, {}
+        for chat_id, pendientes in por_chat.items():
+            nodo = self.dueno(chat_id)
+            if nodo == self.nodo:
+                propios[chat_id] = pendientes
+            else:
+                ajenos.setdefault(nodo, {})[chat_id] = pendientes
+        tareas = [self._pool.submit(self.reenviar, nodo, chats, marcar) for nodo, chats in ajenos.items()]
+        terminados = procesar_por_chat(self._pool, propios, marcar)
+        self._sumar("procesados", len(terminados))
+        reenviados = [tarea.result() for tarea in tareas]
+        return all(reenviados) and not sin_terminar(propios, terminados)
+
+    def recibir_updates(self, updates: list) -> list:
+        """
+        Updates que otro nodo nos pasó: ya se deduplicaron al llegar, aquí
+        solo se procesan. Devuelve los update_id que terminaron, pa' que el
+        que los pasó marque solo esos.
+        """
+        por_chat, _ = agrupar_por_chat(updates, deduplicar=False)
+        terminados = procesar_por_chat(self._pool, por_chat)
+        self._sumar("recibidos", len(updates))
+        self._sumar("procesados", len(terminados))
+        return terminados
+
+    def recibir_estados(self, estados: dict) -> int:
+        for chat_id, datos in estados.items():
+            whatsapp_service.estados_usuario.guardar(chat_id, _deserializar(datos))
+        self._sumar("estados_recibidos", len(estados))
+        return len(estados)
+
+    def estado(self) -> dict:
+        with self._lock_stats:
+            stats = dict(self.stats)
+        return {"nodo": self.nodo, "direccion": self.direccion, "nodos": sorted(self.direcciones), **stats}
+
+    def detener(self):
+        """Sale del anillo y entrega sus estados a los nodos que quedan"""
+        self._detenido.set()
+        if self.membresia is None:
+            return
+        self.membresia.salir(self.nodo)
+        quedan = {nodo: direccion for nodo, direccion in self.membresia.vivos().items() if nodo != self.nodo}
+        if quedan:
+            with self._lock:
+                self.anillo = AnilloConsistente(quedan, self.virtuales)
+                self.direcciones = {**quedan, self.nodo: self.direccion}
+                self._soltar_ajenos()
+        self._servidor.shutdown()
+        print(f"🧩 Nodo {self.nodo} fuera; estados entregados: {self.stats['estados_enviados']}")
+
+
+coordinador_particiones = CoordinadorParticiones()
+metricas.medidor(
+    "conuco_particion_nodos", "Nodos vivos en el anillo de particiones",
+    lambda: len(coordinador_particiones.anillo.nodos) if coordinador_particiones.activo else 0
+)
+
+
+def _terminar(*_):
+    raise KeyboardInterrupt
+
+
+if __name__ == "__main__":
+    # Uso: python -m tasks.particiones [--sondeo]
+    # El mismo coordinador que ve tasks.sondeo_telegram (este archivo corre como __main__)
+    from tasks.particiones import coordinador_particiones as coordinador
+
+    coordinador.activo = True
+    whatsapp_service.iniciar()
+    coordinador.iniciar()
+    signal.signal(signal.SIGTERM, _terminar)
+    try:
+        if "--sondeo" in sys.argv:
+            from tasks.sondeo_telegram import SondeoTelegram
+            SondeoTelegram().correr()
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        coordinador.detener()
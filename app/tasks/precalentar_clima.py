@@ -0,0 +1,42 @@
+"""
+Precalentamiento del cache de clima para todas las zonas.
+
+Pide el pronóstico de todas las zonas de zonas_agroecologicas en una o pocas
+llamadas a Open-Meteo, así ningún REPORTE espera por el clima. El cache vive
+en memoria, por eso iniciar_precalentamiento() se llama dentro del mismo
+proceso que atiende los mensajes (con CLIMA_PRECALENTAR=1).
+"""
+import os
+import threading
+import time
+from config.database import SessionLocal
+from services.clima_service import clima_service
+from services.datos_referencia import datos_referencia
+
+
+def precalentar() -> int:
+    """Refresca el clima de todas las zonas; devuelve cuántas quedaron con datos"""
+    db = SessionLocal()
+    try:
+        datos_referencia.asegurar_cargado(db)
+    finally:
+        db.close()
+    zonas = [zona for zona in datos_referencia.zonas.values() if zona.get("latitud") is not None]
+    return clima_service.precalentar_cache(zonas)
+
+
+def iniciar_precalentamiento(minutos: int | None = None):
+    """Precalienta ahora y luego cada `minutos` en un hilo de fondo"""
+    minutos = minutos or int(os.getenv("CLIMA_PRECALENTAR_MINUTOS", "30"))
+
+    def ciclo():
+        while True:
+            try:
+                zonas = precalentar()
+                print(f"Clima precalentado pa' {zonas} zonas")
+            except Exception as e:
+                print(f"Error precalentando clima: {e}")
+            time.sleep(minutos * 60)
+
+    threading.Thread(target=ciclo, daemon=True).start()
+
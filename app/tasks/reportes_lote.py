@@ -0,0 +1,64 @@
+"""
+Generación de reportes en lote para todas las siembras activas.
+
+Lo comparten la difusión matutina y la materialización de reportes: una
+consulta con todas las siembras (cultivo y zona salen del catálogo en
+memoria), un reporte por usuario y el clima buscado una sola vez por zona.
+"""
+from sqlalchemy import text
+from services.clima_service import clima_service
+from services.datos_referencia import datos_referencia
+from services.whatsapp_service import whatsapp_service
+
+CONSULTA_ZONAS_ACTIVAS = text("""
+    SELECT DISTINCT u.zona_id
+    FROM siembras s
+    JOIN usuarios u ON u.id = s.usuario_id
+    WHERE s.activa = true
+""")
+
+CONSULTA_SIEMBRAS_ACTIVAS = text("""
+    SELECT u.telefono, s.cultivo_id, s.fecha_siembra, u.zona_id
+    FROM siembras s
+    JOIN usuarios u ON u.id = s.usuario_id
+    WHERE s.activa = true
+    ORDER BY u.telefono, s.created_at DESC
+""")
+
+
+def obtener_clima_zonas(db) -> dict:
+    """Clima de hoy de todas las zonas con siembras activas, en una o pocas llamadas"""
+    zona_ids = [zona_id for (zona_id,) in db.execute(CONSULTA_ZONAS_ACTIVAS).fetchall()]
+    zonas = [datos_referencia.zona(zona_id) for zona_id in zona_ids]
+    clima_por_zona = clima_service.obtener_clima_zonas([zona for zona in zonas if zona])
+    return {zona_id: clima_por_zona.get(zona_id) for zona_id in zona_ids}
+
+
+def iterar_reportes(db, clima_por_zona: dict, lote: int = 1000, zonas: set | None = None):
+    """
+    Genera (telefono, reporte) por cada usuario con siembras activas, leyendo
+    las filas en streaming: sus siembras van juntas en un solo reporte, como
+    en el comando REPORTE. Si ninguna tiene cultivo y zona conocidos el
+    reporte sale None. Con `zonas` solo salen los usuarios de esas zonas.
+    """
+    resultado = db.execute(
+        CONSULTA_SIEMBRAS_ACTIVAS,
+        execution_options={"stream_results": True, "yield_per": lote}
+    )
+    telefono, siembras, zona_id = None, [], None
+    for fila in resultado:
+        if zonas is not None and fila.zona_id not in zonas:
+            continue
+        if fila.telefono != telefono:
+            if telefono is not None:
+                yield telefono, _renderizar(siembras, clima_por_zona.get(zona_id))
+            telefono, siembras, zona_id = fila.telefono, [], fila.zona_id
+        siembra = whatsapp_service.armar_siembra(fila)
+        if siembra is not None:
+            siembras.append(siembra)
+    if telefono is not None:
+        yield telefono, _renderizar(siembras, clima_por_zona.get(zona_id))
+
+
+def _renderizar(siembras: list, datos_clima: dict | None) -> str | None:
+    return whatsapp_service.renderizar_reporte(siembras, datos_clima) if siembras else None
@@ -0,0 +1,147 @@
+"""
+Recepción por long polling (getUpdates) en vez del webhook /telegram.
+
+No hace falta un endpoint HTTPS público: el proceso le pide a Telegram
+lotes de hasta 100 updates (esperando hasta TELEGRAM_SONDEO_ESPERA
+segundos si no hay nada), los agrupa por chat y los procesa en un pool de
+TELEGRAM_SONDEO_WORKERS hilos: los mensajes de un chat van en orden, uno
+tras otro, y los chats distintos en paralelo. El offset se confirma
+(offset = último update_id + 1 en el siguiente getUpdates) solo cuando
+todo el lote terminó, así un proceso que se cae a medio lote vuelve a
+recibirlo. Cada update_id se marca en el deduplicador recién cuando se
+procesó, y al volver a recibir el lote se saltan los marcados: con
+UPDATES_DEDUP_BACKEND=redis eso sobrevive al reinicio y solo se procesa lo
+que faltaba; con memoria el registro se pierde al caerse y la parte ya
+procesada del lote se vuelve a procesar. Un update que falla (aquí o en el
+nodo dueño) también deja el offset quieto: el lote se vuelve a pedir con
+espera creciente, hasta TELEGRAM_SONDEO_REINTENTOS veces; después se da
+por perdido y se avanza, pa' que un mensaje que siempre falla no trabe al
+bot entero. Con PARTICIONES=1 cada chat se procesa en el nodo dueño (ver
+tasks/particiones.py).
+
+Telegram no entrega getUpdates mientras haya un webhook configurado
+(responde 409): hay que borrarlo antes con deleteWebhook. Con
+TELEGRAM_API_URL=http://localhost:8082 corre contra el Telegram falso de
+loadtest/servidores_falsos.py.
+
+    cd app && python -m tasks.sondeo_telegram
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.cliente_http import cliente_http
+from services.metricas import metricas
+from services.whatsapp_service import whatsapp_service
+from tasks.cola_mensajes import agrupar_por_chat, procesar_por_chat, sin_terminar
+from tasks.particiones import coordinador_particiones
+
+updates_recibidos = metricas.contador(
+    "conuco_sondeo_updates_total", "Updates recibidos por getUpdates"
+)
+
+
+class SondeoTelegram:
+    def __init__(self):
+        self.espera = int(os.getenv("TELEGRAM_SONDEO_ESPERA", "50"))
+        self.limite = int(os.getenv("TELEGRAM_SONDEO_LIMITE", "100"))
+        self.workers = int(os.getenv("TELEGRAM_SONDEO_WORKERS", "16"))
+        self.reintentos = int(os.getenv("TELEGRAM_SONDEO_REINTENTOS", "5"))
+        self.offset = None
+        self.detener = False
+
+    def pedir_updates(self, espera: int | None = None) -> list:
+        """Un getUpdates; con self.offset confirma todo lo anterior a él"""
+        espera = self.espera if espera is None else espera
+        payload = {"timeout": espera, "limit": self.limite, "allowed_updates": ["message"]}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        response = cliente_http.post(
+            f"{whatsapp_service.telegram_base_url}/getUpdates", json=payload, reintentos=0,
+            timeout=(cliente_http.timeout_conexion, espera + 10)
+        )
+        datos = response.json()
+        if response.status_code == 409:
+            raise SystemExit(f"Telegram no entrega updates con webhook activo; bórralo con deleteWebhook ({datos.get('description')})")
+        if not datos.get("ok"):
+            raise RuntimeError(f"getUpdates respondió {response.status_code}: {datos.get('description')}")
+        return datos["result"]
+
+    def procesar_lote(self, pool: ThreadPoolExecutor, updates: list, stats: dict) -> bool:
+        """
+        Procesa un lote completo (hasta que termina todo, antes de avanzar el
+        offset). False si algún update falló, aquí o en otro nodo: el lote se
+        vuelve a pedir sin avanzar el offset y los ya marcados se saltan.
+        """
+        por_chat, repetidos = agrupar_por_chat(updates)
+        stats["duplicados"] += repetidos
+        stats["chats"] += len(por_chat)
+        if coordinador_particiones.activo:
+            # Los chats de otros nodos se procesan allá; se espera igual a que terminen
+            return coordinador_particiones.procesar(por_chat, marcar=True)
+        return not sin_terminar(por_chat, procesar_por_chat(pool, por_chat, marcar=True))
+
+    def correr(self, max_lotes: int | None = None) -> dict:
+        """Pide y procesa lotes hasta detener (o max_lotes); devuelve estadísticas"""
+        stats = {"lotes": 0, "updates": 0, "chats": 0, "duplicados": 0, "errores": 0}
+        inicio = time.monotonic()
+        fallos = 0
+        lotes_fallidos = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sondeo") as pool:
+            try:
+                while not self.detener and (max_lotes is None or stats["lotes"] < max_lotes):
+                    try:
+                        updates = self.pedir_updates()
+                        fallos = 0
+                    except SystemExit:
+                        raise
+                    except Exception as e:
+                        stats["errores"] += 1
+                        espera = min(2 ** fallos, 30)
+                        fallos += 1
+                        print(f"Error pidiendo updates a Telegram: {e}; reintento en {espera}s")
+                        time.sleep(espera)
+                        continue
+                    if not updates:
+                        continue
+
+                    stats["lotes"] += 1
+                    stats["updates"] += len(updates)
+                    updates_recibidos.sumar(len(updates))
+                    if not self.procesar_lote(pool, updates, stats):
+                        stats["errores"] += 1
+                        if lotes_fallidos < self.reintentos:
+                            espera = min(2 ** lotes_fallidos, 30)
+                            lotes_fallidos += 1
+                            print(f"Lote con updates sin terminar; se vuelve a pedir en {espera}s")
+                            time.sleep(espera)
+                            continue
+                        print(f"Lote sin terminar tras {lotes_fallidos} reintentos; se avanza el offset")
+                    lotes_fallidos = 0
+                    self.offset = max(update["update_id"] for update in updates) + 1
+            except KeyboardInterrupt:
+                # Un lote a medias no avanzó el offset: Telegram lo vuelve a mandar
+                print("Deteniendo el sondeo...")
+
+        # Confirmar el último lote, que si no Telegram lo vuelve a mandar al arrancar
+        if self.offset is not None:
+            try:
+                self.pedir_updates(espera=0)
+            except Exception as e:
+                print(f"No se pudo confirmar el offset {self.offset}: {e}")
+
+        stats["segundos"] = round(time.monotonic() - inicio, 2)
+        return stats
+
+
+if __name__ == "__main__":
+    if os.getenv("CLIMA_PRECALENTAR", "0") == "1":
+        from tasks.precalentar_clima import iniciar_precalentamiento
+        iniciar_precalentamiento()
+    sondeo = SondeoTelegram()
+    print(f"📡 Escuchando Telegram por getUpdates con {sondeo.workers} workers")
+    stats = sondeo.correr()
+    print(
+        f"📡 {stats['updates']} updates en {stats['lotes']} lotes ({stats['chats']} chats, "
+        f"{stats['duplicados']} repetidos, {stats['errores']} errores) en {stats['segundos']}s"
+    )
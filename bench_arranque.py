@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+# Tiempo de importación de los puntos de entrada del bot (python -X importtime),
+# cada uno en un proceso limpio y sin DATABASE_URL ni TELEGRAM_BOT_TOKEN: importar
+# no debe exigir credenciales ni crear el engine o los servicios (se crean al
+# usarse, ver services/perezoso.py y config/database.obtener_engine). Sale con
+# código 1 si algún módulo pasa el presupuesto, pa' correrlo en CI.
+#
+#   python bench_arranque.py [presupuesto_ms]
+
+PRESUPUESTO_MS = float(sys.argv[1]) if len(sys.argv) > 1 else float(os.getenv("ARRANQUE_PRESUPUESTO_MS", "250"))
+REPETICIONES = 5
+MODULOS = [
+    "config.database",
+    "services.whatsapp_service",
+    "tasks.cola_mensajes",
+    "tasks.sondeo_telegram",
+    "tasks.difusion_matutina",
+    "tasks.alertas"
+]
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app")
+ENTORNO = {clave: valor for clave, valor in os.environ.items()
+           if clave not in ("DATABASE_URL", "TELEGRAM_BOT_TOKEN")}
+ENTORNO["PYTHONPATH"] = APP
+
+
+def medir(modulo: str) -> tuple:
+    """(µs acumulados del módulo, [(µs propios, paquete)] más caros) de una importación"""
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=os.path.dirname(APP), env=ENTORNO, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        raise SystemExit(f"❌ import {modulo} falló sin credenciales:\n{resultado.stderr.strip().splitlines()[-1]}")
+
+    total = 0
+    por_paquete = {}
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        nombre = nombre.strip()
+        paquete = nombre.split(".")[0]
+        por_paquete[paquete] = por_paquete.get(paquete, 0) + int(propio)
+        if nombre == modulo:
+            total = int(acumulado)
+    return total, sorted(((us, p) for p, us in por_paquete.items()), reverse=True)[:4]
+
+
+if __name__ == "__main__":
+    print(f"🚀 TIEMPO DE IMPORTACIÓN (mejor de {REPETICIONES}, presupuesto {PRESUPUESTO_MS:.0f} ms)")
+    print("=" * 78)
+    print(f"{'módulo':<28} {'ms':>7}  paquetes más caros")
+    excedidos = []
+    for modulo in MODULOS:
+        mediciones = [medir(modulo) for _ in range(REPETICIONES)]
+        total, paquetes = min(mediciones)
+        ms = total / 1000
+        marca = "⚠️ " if ms > PRESUPUESTO_MS else ""
+        detalle = ", ".join(f"{p} {us / 1000:.0f}" for us, p in paquetes)
+        print(f"{modulo:<28} {ms:>7.1f}  {marca}{detalle}")
+        if ms > PRESUPUESTO_MS:
+            excedidos.append(modulo)
+
+    if excedidos:
+        print(f"\n❌ Pasan de {PRESUPUESTO_MS:.0f} ms: {', '.join(excedidos)}")
+        sys.exit(1)
+    print("\n✅ Todo dentro del presupuesto")
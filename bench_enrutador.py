@@ -0,0 +1,105 @@
+import sys
+sys.path.append('app')
+
+import random
+import time
+import unicodedata
+from services.enrutador import Enrutador, SINONIMOS_COMANDOS, SINONIMOS_CULTIVOS, normalizar_texto
+
+# Compara el costo por mensaje de normalizar comando + cultivo antes (dict de
+# sinónimos armado en cada llamada, NFD carácter por carácter y recorrido del
+# menú) y ahora (Enrutador compilado), con catálogos de distintos tamaños.
+# No necesita base de datos.
+#
+#   python bench_enrutador.py [mensajes]
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def limpiar_texto_anterior(texto: str) -> str:
+    texto = texto.upper().strip()
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+def normalizar_comando_anterior(mensaje: str) -> str:
+    mensaje = limpiar_texto_anterior(mensaje)
+    sinonimos = {
+        "REGISTRAR": "REGISTRO", "APUNTAR": "REGISTRO", "ANOTAR": "REGISTRO",
+        "CLIMA": "REPORTE", "CLIMITA": "REPORTE", "PRECIO": "REPORTE", "PRECIOS": "REPORTE",
+        "INFO": "AYUDA", "INFORMACION": "AYUDA", "/START": "AYUDA", "/HELP": "AYUDA"
+    }
+    return sinonimos.get(mensaje, mensaje)
+
+
+def normalizar_cultivo_anterior(mensaje: str, menu: dict, nombres: dict) -> str:
+    mensaje = limpiar_texto_anterior(mensaje)
+    if mensaje in menu:
+        return mensaje
+    codigo = dict(nombres).get(mensaje)  # el original armaba este dict en cada llamada
+    for opcion, cultivo in menu.items():
+        if cultivo["codigo"] == codigo or limpiar_texto_anterior(cultivo["nombre"]) == mensaje:
+            return opcion
+    return None
+
+
+def catalogo(n: int) -> tuple:
+    """Los 3 cultivos reales más n-3 inventados, cada uno con 4 sinónimos"""
+    menu = {
+        "1": {"nombre": "Tomate", "codigo": "TOM"},
+        "2": {"nombre": "Ají Cubanela", "codigo": "AJI"},
+        "3": {"nombre": "Banano", "codigo": "BAN"}
+    }
+    sinonimos = {codigo: list(lista) for codigo, lista in SINONIMOS_CULTIVOS.items()}
+    for i in range(4, n + 1):
+        codigo = f"C{i:03d}"
+        menu[str(i)] = {"nombre": f"Cultivo Número {i}", "codigo": codigo}
+        sinonimos[codigo] = [f"CULTIVO{i}", f"SIEMBRA{i}", f"MATA{i}", f"RUBRO{i}"]
+    nombres = {s: codigo for codigo, lista in sinonimos.items() for s in lista}
+    enrutador = Enrutador({
+        opcion: [c["codigo"], c["nombre"], *sinonimos.get(c["codigo"], [])] for opcion, c in menu.items()
+    })
+    return menu, nombres, enrutador
+
+
+def mensajes(menu: dict) -> list:
+    """Mezcla realista: comandos, números del menú, nombres con tildes y errores"""
+    ultimo = list(menu.values())[-1]["nombre"]
+    base = [
+        ("REPORTE", "tomate"), ("reporte", "1"), ("Clima", "Ají Cubanela"), ("REGISTRO", "banano"),
+        ("/start", "guineo"), ("Regitro", "Tomte"), ("ayuda", ultimo), ("precio", "yuca")
+    ]
+    return [random.choice(base) for _ in range(N)]
+
+
+def medir(funcion, datos: list) -> float:
+    inicio = time.perf_counter()
+    for comando, cultivo in datos:
+        funcion(comando, cultivo)
+    return (time.perf_counter() - inicio) / len(datos) * 1e6
+
+
+if __name__ == "__main__":
+    random.seed(7)
+    enrutador_comandos = Enrutador(SINONIMOS_COMANDOS)
+    # "sin memoria" salta el cache de resultados: es el costo de un texto nunca visto
+    print(f"{'cultivos':>9} {'antes µs/msg':>13} {'sin memoria':>12} {'ahora µs/msg':>13} {'mejora':>7}")
+    for n in [3, 50, 500, 2000]:
+        menu, nombres, enrutador = catalogo(n)
+        datos = mensajes(menu)
+
+        def anterior(comando, cultivo):
+            normalizar_comando_anterior(comando)
+            normalizar_cultivo_anterior(cultivo, menu, nombres)
+
+        def nuevo(comando, cultivo):
+            enrutador_comandos.resolver(comando)
+            enrutador.resolver(cultivo)
+
+        def sin_memoria(comando, cultivo):
+            enrutador_comandos._buscar(normalizar_texto(comando))
+            enrutador._buscar(normalizar_texto(cultivo))
+
+        antes = medir(anterior, datos)
+        frio = medir(sin_memoria, datos)
+        ahora = medir(nuevo, datos)
+        print(f"{n:>9} {antes:>13.2f} {frio:>12.2f} {ahora:>13.2f} {antes / ahora:>6.1f}x")
@@ -0,0 +1,95 @@
+import sys
+sys.path.append('app')
+
+import statistics
+import time
+from datetime import date, timedelta
+from sqlalchemy import event, text
+from config.database import SessionLocal, engine
+from services.whatsapp_service import whatsapp_service
+
+# Compara el camino de escritura del registro antes (4 consultas) y ahora
+# (1 CTE + cache de cultivos) contra el PostgreSQL de DATABASE_URL.
+# Usa teléfonos "bench-*" y los borra al final.
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+viajes = {"total": 0}
+
+@event.listens_for(engine, "before_cursor_execute")
+def contar_consulta(conn, cursor, statement, parameters, context, executemany):
+    viajes["total"] += 1
+
+@event.listens_for(engine, "commit")
+def contar_commit(conn):
+    viajes["total"] += 1
+
+
+def registro_anterior(chat_id: str, estado: dict, db):
+    """El camino original de completar_registro, pa' comparar"""
+    zona_id = whatsapp_service.determinar_zona("Constanza")
+    db.execute(text("""
+        INSERT INTO usuarios (telefono, nombre, status, zona_id)
+        VALUES (:p, :n, 'activo', :z)
+        ON CONFLICT (telefono) DO UPDATE SET status = 'activo', zona_id = :z
+    """), {"p": chat_id, "n": f"Agricultor {estado['cultivo_data']['nombre']}", "z": zona_id})
+    user_id = db.execute(text("SELECT id FROM usuarios WHERE telefono = :p"), {"p": chat_id}).fetchone()[0]
+    cultivo_id = db.execute(text("SELECT id FROM cultivos WHERE codigo = :c"), {"c": estado['cultivo_data']['codigo']}).fetchone()[0]
+    db.execute(text("""
+        INSERT INTO siembras (usuario_id, cultivo_id, fecha_siembra, dia_actual, activa)
+        VALUES (:uid, :cid, :f, :d, true)
+    """), {"uid": user_id, "cid": cultivo_id, "f": estado["fecha_siembra"], "d": estado["dias_transcurridos"]})
+    db.commit()
+
+
+def registro_nuevo(chat_id: str, estado: dict, db):
+    whatsapp_service.completar_registro(chat_id, "Constanza", estado, db)
+
+
+def medir(nombre: str, funcion, db) -> dict:
+    tiempos = []
+    viajes["total"] = 0
+    for i in range(N):
+        estado = {
+            "cultivo_data": whatsapp_service.cultivos_data["1"],
+            "fecha_siembra": date.today() - timedelta(days=10),
+            "dias_transcurridos": 10,
+            "paso": "ubicacion"
+        }
+        inicio = time.perf_counter()
+        funcion(f"bench-{nombre}-{i}", estado, db)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "viajes": viajes["total"] / N,
+        "media": statistics.mean(tiempos),
+        "p95": tiempos[int(len(tiempos) * 0.95) - 1]
+    }
+
+
+def limpiar(db):
+    db.execute(text("""
+        DELETE FROM siembras WHERE usuario_id IN (SELECT id FROM usuarios WHERE telefono LIKE 'bench-%')
+    """))
+    db.execute(text("DELETE FROM usuarios WHERE telefono LIKE 'bench-%'"))
+    db.commit()
+
+
+if __name__ == "__main__":
+    print(f"⏱️  BENCHMARK DE REGISTRO ({N} registros por variante)")
+    print("=" * 50)
+
+    db = SessionLocal()
+    try:
+        limpiar(db)
+        whatsapp_service.obtener_id_cultivo("TOM", db)  # Calentar el cache como en producción
+        resultados = {
+            "antes": medir("antes", registro_anterior, db),
+            "ahora": medir("ahora", registro_nuevo, db)
+        }
+    finally:
+        limpiar(db)
+        db.close()
+
+    for nombre, r in resultados.items():
+        print(f"{nombre:>6}: {r['viajes']:.1f} viajes/registro, media {r['media']:.2f} ms, p95 {r['p95']:.2f} ms")
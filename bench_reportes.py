@@ -0,0 +1,108 @@
+import sys
+sys.path.append('app')
+
+import random
+import statistics
+import time
+from sqlalchemy import text
+from config.database import SessionLocal
+from services.whatsapp_service import CONSULTA_SIEMBRAS_USUARIO
+
+# Latencia de la consulta de REPORTE (todas las siembras activas de un
+# usuario) a medida que crece la tabla de siembras, con los índices de
+# migrations/003_indices_siembras.sql y con el planificador sin índices
+# (como antes de la migración). Contra el PostgreSQL de DATABASE_URL; usa
+# teléfonos "bench-rep-*" y los borra al final.
+#
+#   python bench_reportes.py [filas_maximas]
+
+MAXIMO = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+USUARIOS = 20_000
+MUESTRAS = 300
+MUESTRAS_SIN_INDICES = 20
+
+SIN_INDICES = ["SET LOCAL enable_indexscan = off", "SET LOCAL enable_indexonlyscan = off", "SET LOCAL enable_bitmapscan = off"]
+
+
+def sembrar_usuarios(db):
+    zona_id = db.execute(text("SELECT min(id) FROM zonas_agroecologicas")).scalar()
+    db.execute(text("""
+        INSERT INTO usuarios (telefono, nombre, status, zona_id)
+        SELECT 'bench-rep-' || i, 'Agricultor bench', 'activo', :z FROM generate_series(1, :n) i
+    """), {"z": zona_id, "n": USUARIOS})
+    db.commit()
+
+
+def agregar_siembras(db, filas: int):
+    """Siembras repartidas entre los usuarios bench; 9 de cada 10 ya cerradas (historial)"""
+    db.execute(text("""
+        WITH bench AS (
+            SELECT min(id) AS primero, count(*) AS cuantos FROM usuarios WHERE telefono LIKE 'bench-rep-%'
+        ), catalogo AS (
+            SELECT array_agg(id) AS ids FROM cultivos
+        )
+        INSERT INTO siembras (usuario_id, cultivo_id, fecha_siembra, dia_actual, activa, created_at)
+        SELECT b.primero + floor(random() * b.cuantos)::int,
+               c.ids[1 + floor(random() * cardinality(c.ids))::int],
+               current_date - (random() * 300)::int, 0, random() < 0.1,
+               now() - random() * interval '3 years'
+        FROM generate_series(1, :n), bench b, catalogo c
+    """), {"n": filas})
+    db.commit()
+    db.execute(text("ANALYZE siembras"))
+    db.commit()
+
+
+def medir(db, muestras: int, sin_indices: bool) -> dict:
+    tiempos = []
+    for _ in range(muestras):
+        telefono = f"bench-rep-{random.randint(1, USUARIOS)}"
+        if sin_indices:
+            for sentencia in SIN_INDICES:
+                db.execute(text(sentencia))
+        inicio = time.perf_counter()
+        db.execute(CONSULTA_SIEMBRAS_USUARIO, {"p": telefono, "n": 9}).fetchall()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.rollback()
+    tiempos.sort()
+    return {"p50": statistics.median(tiempos), "p95": tiempos[max(0, int(len(tiempos) * 0.95) - 1)]}
+
+
+def limpiar(db):
+    db.execute(text("""
+        DELETE FROM siembras WHERE usuario_id IN (SELECT id FROM usuarios WHERE telefono LIKE 'bench-rep-%')
+    """))
+    db.execute(text("DELETE FROM usuarios WHERE telefono LIKE 'bench-rep-%'"))
+    db.commit()
+
+
+if __name__ == "__main__":
+    random.seed(7)
+    print(f"⏱️  BENCHMARK DE REPORTE MULTI-SIEMBRA (hasta {MAXIMO:,} siembras, {USUARIOS:,} usuarios)")
+    print("=" * 70)
+
+    db = SessionLocal()
+    try:
+        faltan = [
+            nombre for nombre in ("idx_usuarios_telefono_zona", "idx_siembras_usuario_activa")
+            if not db.execute(text("SELECT to_regclass(:n) IS NOT NULL"), {"n": nombre}).scalar()
+        ]
+        if faltan:
+            print(f"⚠️  Faltan índices {faltan}: aplica migrations/003_indices_siembras.sql pa' medir el camino nuevo")
+
+        limpiar(db)
+        sembrar_usuarios(db)
+        total = db.execute(text("SELECT count(*) FROM siembras")).scalar()
+        print(f"{'siembras':>10} {'índices p50':>12} {'p95':>8} {'sin índices p50':>16} {'p95':>9}")
+        for objetivo in [10_000, 100_000, 1_000_000, 2_000_000, 5_000_000]:
+            if objetivo > MAXIMO:
+                break
+            if objetivo > total:
+                agregar_siembras(db, objetivo - total)
+                total = objetivo
+            con = medir(db, MUESTRAS, sin_indices=False)
+            sin = medir(db, MUESTRAS_SIN_INDICES, sin_indices=True)
+            print(f"{total:>10,} {con['p50']:>10.2f}ms {con['p95']:>6.2f}ms {sin['p50']:>14.2f}ms {sin['p95']:>7.2f}ms")
+    finally:
+        limpiar(db)
+        db.close()
@@ -0,0 +1,200 @@
+"""
+Generador de tráfico sintético de webhooks de Telegram contra /telegram.
+
+    python loadtest/generador_carga.py --tasa 100 --duracion 60 --usuarios 2000 \
+        --proporcion-registro 0.2 --rafaga 300 --cada-rafaga 15
+
+Cada usuario virtual es un chat: unos hacen el flujo completo de REGISTRO
+(cultivo, fecha, municipio) y luego piden REPORTE, otros solo REPORTE. Un
+chat no manda el siguiente mensaje hasta que el anterior fue respondido,
+igual que Telegram. Cada `--cada-rafaga` segundos se manda una ráfaga de
+REPORTE simultáneos (la hora pico de las 6am).
+
+Al final imprime p50/p95/p99, throughput, errores y, si están disponibles,
+las llamadas que recibieron los servidores falsos (servidores_falsos.py) y
+las consultas a la base que cuenta /telegram/status.
+"""
+import argparse
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+CULTIVOS = ["tomate", "aji", "banano", "1", "2", "3"]
+MUNICIPIOS = ["Constanza", "Santiago", "Hato Mayor", "Azua", "Jarabacoa", "paraje El Pinar, Constanza"]
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    indice = min(len(valores) - 1, max(0, int(round(p / 100 * len(valores))) - 1))
+    return valores[indice]
+
+
+class UsuarioVirtual:
+    def __init__(self, chat_id: int, registrar: bool):
+        self.chat_id = chat_id
+        self.guion = deque()
+        if registrar:
+            self.guion.extend([
+                ("registro", "REGISTRO"),
+                ("registro", random.choice(CULTIVOS)),
+                ("registro", f"hace {random.randint(1, 60)} dias"),
+                ("registro", random.choice(MUNICIPIOS))
+            ])
+        self.guion.append(("reporte", "REPORTE"))
+        self.ocupado = False
+
+    def siguiente(self) -> tuple:
+        """Próximo mensaje del guion; cuando se acaba, sigue pidiendo REPORTE"""
+        return self.guion.popleft() if self.guion else ("reporte", "REPORTE")
+
+
+class GeneradorCarga:
+    def __init__(self, args):
+        self.args = args
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrencia))
+        self.update_ids = itertools.count(random.randint(1, 10**6))
+        self.usuarios = [
+            UsuarioVirtual(args.chat_base + i, random.random() < args.proporcion_registro)
+            for i in range(args.usuarios)
+        ]
+        self.resultados = []
+        self._lock = threading.Lock()
+
+    def update(self, chat_id: int, texto: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": random.randint(1, 10**9),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Carga"},
+                "text": texto
+            }
+        }
+
+    def enviar(self, usuario: UsuarioVirtual, tipo: str, texto: str):
+        inicio = time.perf_counter()
+        try:
+            codigo = self.session.post(self.args.url, json=self.update(usuario.chat_id, texto), timeout=30).status_code
+        except requests.exceptions.RequestException:
+            codigo = 0
+        latencia = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.resultados.append((tipo, codigo, latencia))
+            usuario.ocupado = False
+
+    def tomar_libre(self, turno) -> UsuarioVirtual | None:
+        """Siguiente usuario sin mensaje en vuelo (round-robin)"""
+        for _ in range(len(self.usuarios)):
+            usuario = next(turno)
+            with self._lock:
+                if not usuario.ocupado:
+                    usuario.ocupado = True
+                    return usuario
+        return None
+
+    def ejecutar(self) -> float:
+        turno = itertools.cycle(self.usuarios)
+        intervalo = 1.0 / self.args.tasa
+        inicio = time.monotonic()
+        proxima_rafaga = inicio + self.args.cada_rafaga if self.args.rafaga else float("inf")
+        proximo = inicio
+
+        with ThreadPoolExecutor(max_workers=self.args.concurrencia) as pool:
+            while time.monotonic() - inicio < self.args.duracion:
+                ahora = time.monotonic()
+                if ahora >= proxima_rafaga:
+                    for _ in range(self.args.rafaga):
+                        usuario = self.tomar_libre(turno)
+                        if usuario:
+                            pool.submit(self.enviar, usuario, "rafaga", "REPORTE")
+                    proxima_rafaga += self.args.cada_rafaga
+
+                if ahora < proximo:
+                    time.sleep(min(proximo - ahora, 0.01))
+                    continue
+                proximo += intervalo
+                usuario = self.tomar_libre(turno)
+                if usuario:
+                    tipo, texto = usuario.siguiente()
+                    pool.submit(self.enviar, usuario, tipo, texto)
+        return time.monotonic() - inicio
+
+
+def leer_json(url: str | None) -> dict:
+    if not url:
+        return {}
+    try:
+        return requests.get(url, timeout=5).json()
+    except (requests.exceptions.RequestException, ValueError):
+        return {}
+
+
+def diferencia(antes: dict, despues: dict) -> dict:
+    return {
+        clave: valor - antes.get(clave, 0)
+        for clave, valor in despues.items() if isinstance(valor, (int, float))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tráfico sintético de webhooks de Telegram")
+    parser.add_argument("--url", default="http://localhost:8000/telegram")
+    parser.add_argument("--status-url", default="http://localhost:8000/telegram/status")
+    parser.add_argument("--clima-url", default="http://localhost:8081")
+    parser.add_argument("--telegram-url", default="http://localhost:8082")
+    parser.add_argument("--tasa", type=float, default=50, help="mensajes por segundo")
+    parser.add_argument("--duracion", type=float, default=30, help="segundos")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--proporcion-registro", type=float, default=0.2)
+    parser.add_argument("--rafaga", type=int, default=0, help="REPORTE simultáneos por ráfaga")
+    parser.add_argument("--cada-rafaga", type=float, default=15)
+    parser.add_argument("--concurrencia", type=int, default=64)
+    parser.add_argument("--chat-base", type=int, default=9_000_000_000)
+    args = parser.parse_args()
+
+    fuentes = {
+        "open_meteo": f"{args.clima_url}/stats",
+        "telegram": f"{args.telegram_url}/stats",
+        "bot": args.status_url
+    }
+    antes = {nombre: leer_json(url) for nombre, url in fuentes.items()}
+
+    print(f"🚜 Mandando ~{args.tasa} msg/s por {args.duracion}s a {args.url} ({args.usuarios} chats)")
+    generador = GeneradorCarga(args)
+    duracion = generador.ejecutar()
+    despues = {nombre: leer_json(url) for nombre, url in fuentes.items()}
+
+    resultados = generador.resultados
+    ok = [r for r in resultados if 200 <= r[1] < 300]
+    print("=" * 60)
+    print(f"Peticiones: {len(resultados)} en {duracion:.1f}s ({len(resultados) / duracion:.1f}/s), "
+          f"{len(resultados) - len(ok)} con error")
+    codigos = {}
+    for _, codigo, _ in resultados:
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+    print(f"Códigos HTTP: {dict(sorted(codigos.items()))}")
+
+    for tipo in ["total", "registro", "reporte", "rafaga"]:
+        latencias = [r[2] for r in resultados if tipo == "total" or r[0] == tipo]
+        if latencias:
+            print(f"{tipo:>9}: n={len(latencias):>6}  p50={percentil(latencias, 50):8.1f} ms  "
+                  f"p95={percentil(latencias, 95):8.1f} ms  p99={percentil(latencias, 99):8.1f} ms")
+
+    for nombre in ["open_meteo", "telegram"]:
+        if despues[nombre]:
+            print(f"Llamadas a {nombre} falso: {diferencia(antes[nombre], despues[nombre])}")
+    if "consultas_db" in despues["bot"]:
+        consultas = despues["bot"]["consultas_db"] - antes["bot"].get("consultas_db", 0)
+        print(f"Consultas a la base: {consultas} ({consultas / max(len(ok), 1):.2f} por mensaje)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Prueba local del modo particionado (tasks/particiones.py) con varios procesos.
+
+Levanta --nodos nodos en esta máquina (el primero además lee getUpdates
+del Telegram falso) y manda a medias el REGISTRO de --chats chats. Después
+entra un nodo nuevo y se apaga otro (SIGTERM), así los chats cambian de
+dueño con el registro a medio camino, y termina los registros con REPORTE.
+Al final revisa en la base que todos los registros se completaron (o sea,
+que el estado de la conversación siguió al chat) e imprime cuántos
+mensajes atendió cada nodo y cuántos estados se pasaron.
+
+Necesita servidores_falsos.py corriendo, y DATABASE_URL y
+TELEGRAM_BOT_TOKEN en el entorno:
+
+    python loadtest/servidores_falsos.py &
+    python loadtest/particiones_local.py --nodos 3 --chats 300
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import requests
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.append(APP)
+
+
+def estado_nodo(puerto: int) -> dict | None:
+    try:
+        return requests.get(f"http://127.0.0.1:{puerto}/particion", timeout=2).json()
+    except requests.exceptions.RequestException:
+        return None
+
+
+class Prueba:
+    def __init__(self, args):
+        self.args = args
+        self.telegram = args.telegram_url
+        self.nodos = {}
+        self.chats = [str(args.chat_base + i) for i in range(args.chats)]
+
+    def arrancar_nodo(self, indice: int, sondeo: bool = False):
+        entorno = dict(os.environ)
+        entorno.update({
+            "TELEGRAM_API_URL": self.telegram,
+            "PARTICION_PUERTO": str(self.args.puerto_base + indice),
+            "PARTICION_NODO": f"nodo-{indice}",
+            "PARTICION_LATIDO": "1",
+            "TELEGRAM_SONDEO_ESPERA": "1",
+            "ESTADOS_BACKEND": "memoria"
+        })
+        comando = [sys.executable, "-m", "tasks.particiones"] + (["--sondeo"] if sondeo else [])
+        self.nodos[indice] = subprocess.Popen(
+            comando, cwd=APP, env=entorno, stdout=subprocess.DEVNULL if not self.args.verbose else None
+        )
+
+    def esperar_nodos(self, cuantos: int, limite: float = 30):
+        """Hasta que todos los nodos vivos ven `cuantos` nodos en el anillo"""
+        fin = time.monotonic() + limite
+        while time.monotonic() < fin:
+            vistos = [estado_nodo(self.args.puerto_base + i) for i in self.nodos]
+            if all(e and len(e["nodos"]) == cuantos for e in vistos):
+                return
+            time.sleep(0.2)
+        raise SystemExit(f"❌ Los nodos no llegaron a ver {cuantos} nodos")
+
+    def entregados(self) -> int:
+        return requests.get(f"{self.telegram}/stats", timeout=5).json().get("mensajes_entregados", 0)
+
+    def fase(self, nombre: str, textos: list):
+        """Manda `textos` (en orden) desde cada chat y espera todas las respuestas"""
+        antes = self.entregados()
+        mensajes = [{"chat_id": int(chat), "text": texto} for texto in textos for chat in self.chats]
+        inicio = time.monotonic()
+        requests.post(f"{self.telegram}/encolar", json={"mensajes": mensajes}, timeout=30)
+        esperados = antes + len(mensajes)
+        while self.entregados() < esperados:
+            if time.monotonic() - inicio > self.args.limite:
+                raise SystemExit(f"❌ {nombre}: {self.entregados() - antes} de {len(mensajes)} respuestas")
+            time.sleep(0.2)
+        segundos = time.monotonic() - inicio
+        print(f"  {nombre:<32} {len(mensajes):>6} mensajes en {segundos:5.1f}s ({len(mensajes) / segundos:6.0f}/s)")
+
+    def limpiar(self):
+        from sqlalchemy import text
+        from config.database import sesion
+
+        with sesion() as db:
+            db.execute(text(
+                "DELETE FROM siembras WHERE usuario_id IN (SELECT id FROM usuarios WHERE telefono = ANY(:t))"
+            ), {"t": self.chats})
+            db.execute(text("DELETE FROM usuarios WHERE telefono = ANY(:t)"), {"t": self.chats})
+            db.commit()
+
+    def registrados(self) -> int:
+        from sqlalchemy import text
+        from config.database import sesion
+
+        with sesion() as db:
+            return db.execute(text("""
+                SELECT count(DISTINCT u.id) FROM usuarios u JOIN siembras s ON s.usuario_id = u.id
+                WHERE u.telefono = ANY(:t)
+            """), {"t": self.chats}).scalar()
+
+    def detener(self, indice: int):
+        proceso = self.nodos.pop(indice)
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=30)
+
+    def ejecutar(self):
+        n = self.args.nodos
+        self.limpiar()
+        print(f"🧩 PARTICIONES LOCALES: {n} nodos, {len(self.chats)} chats")
+        for i in range(n):
+            self.arrancar_nodo(i, sondeo=(i == 0))
+        self.esperar_nodos(n)
+
+        self.fase("REGISTRO + cultivo", ["REGISTRO", "1"])
+
+        self.arrancar_nodo(n)
+        self.esperar_nodos(n + 1)
+        print(f"  entró nodo-{n}")
+        self.fase("fecha de siembra", ["hace 10 dias"])
+
+        saliente = n - 1 if n > 1 else n
+        estados_saliente = estado_nodo(self.args.puerto_base + saliente)
+        self.detener(saliente)
+        self.esperar_nodos(n)
+        print(f"  salió nodo-{saliente} (procesó {estados_saliente['procesados']} mensajes)")
+        self.fase("municipio + REPORTE", ["Azua", "REPORTE"])
+
+        print(f"\n{'nodo':<8} {'procesados':>10} {'recibidos':>10} {'reenviados':>10} {'estados +/-':>12}")
+        for i in sorted(self.nodos):
+            e = estado_nodo(self.args.puerto_base + i)
+            print(f"{e['nodo']:<8} {e['procesados']:>10} {e['recibidos']:>10} {e['reenviados']:>10} "
+                  f"{e['estados_recibidos']:>5}/{e['estados_enviados']:<6}")
+
+        completos = self.registrados()
+        for i in list(self.nodos):
+            self.detener(i)
+        self.limpiar()
+        if completos != len(self.chats):
+            raise SystemExit(f"\n❌ Solo {completos} de {len(self.chats)} registros se completaron")
+        print(f"\n✅ {completos} registros completos a pesar de los rebalanceos")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modo particionado con varios procesos locales")
+    parser.add_argument("--nodos", type=int, default=3)
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--puerto-base", type=int, default=8090)
+    parser.add_argument("--telegram-url", default="http://localhost:8082")
+    parser.add_argument("--chat-base", type=int, default=8_800_000_000)
+    parser.add_argument("--limite", type=float, default=120, help="segundos máximos por fase")
+    parser.add_argument("--verbose", action="store_true")
+    prueba = Prueba(parser.parse_args())
+    try:
+        prueba.ejecutar()
+    finally:
+        for proceso in prueba.nodos.values():
+            proceso.kill()
+
+
+if __name__ == "__main__":
+    main()
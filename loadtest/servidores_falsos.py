@@ -0,0 +1,277 @@
+"""
+Servidores falsos de Open-Meteo y de la Bot API de Telegram pa' pruebas de carga.
+
+    python loadtest/servidores_falsos.py --latencia-ms 80 --tasa-error 0.02 --tasa-429 0.01
+
+Luego arranca el bot apuntando a ellos:
+
+    OPEN_METEO_URL=http://localhost:8081/v1/forecast
+    TELEGRAM_API_URL=http://localhost:8082
+
+Cada servidor cuenta las llamadas recibidas en GET /stats y las reinicia
+con POST /reset.
+
+El Telegram falso también atiende getUpdates (pa' tasks/sondeo_telegram.py):
+los mensajes se le cargan con POST /encolar y {"mensajes": [{"chat_id": 1,
+"text": "REPORTE"}, ...]}, y los entrega con update_id crecientes hasta que
+un getUpdates con offset los confirma.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class Inyeccion:
+    """Latencia y errores configurables, compartidos por ambos servidores"""
+
+    def __init__(self, latencia_ms: float, jitter_ms: float, tasa_error: float, tasa_429: float):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.tasa_429 = tasa_429
+
+    def esperar(self):
+        espera = self.latencia_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if espera > 0:
+            time.sleep(espera / 1000)
+
+
+class Contadores:
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, clave: str, n: int = 1):
+        with self._lock:
+            self._datos[clave] = self._datos.get(clave, 0) + n
+
+    def copia(self) -> dict:
+        with self._lock:
+            return dict(self._datos)
+
+    def reiniciar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class Buzon:
+    """Updates pendientes del Telegram falso, con la semántica de offset de getUpdates"""
+
+    def __init__(self):
+        self._updates = []
+        self._siguiente_id = 1
+        self._condicion = threading.Condition()
+
+    def agregar(self, mensajes: list) -> int:
+        with self._condicion:
+            for mensaje in mensajes:
+                chat_id = mensaje.get("chat_id")
+                self._updates.append({
+                    "update_id": self._siguiente_id,
+                    "message": {
+                        "message_id": self._siguiente_id,
+                        "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private"},
+                        "from": {"id": chat_id, "is_bot": False, "first_name": "Carga"},
+                        "text": mensaje.get("text", "")
+                    }
+                })
+                self._siguiente_id += 1
+            self._condicion.notify_all()
+            return len(self._updates)
+
+    def sacar(self, offset: int | None, limite: int, espera: float) -> list:
+        """Descarta lo confirmado (update_id < offset) y devuelve hasta `limite`, esperando si no hay"""
+        with self._condicion:
+            if offset is not None:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            self._condicion.wait_for(lambda: self._updates, timeout=espera)
+            return self._updates[:limite]
+
+    def pendientes(self) -> int:
+        with self._condicion:
+            return len(self._updates)
+
+
+class ManejadorBase(BaseHTTPRequestHandler):
+    inyeccion = None
+    contadores = None
+    protocol_version = "HTTP/1.1"  # keep-alive, como los servidores reales
+
+    def log_message(self, formato, *args):
+        pass
+
+    def responder(self, codigo: int, cuerpo, cabeceras: dict | None = None):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def leer_cuerpo(self) -> dict:
+        largo = int(self.headers.get("Content-Length", 0))
+        if not largo:
+            return {}
+        try:
+            return json.loads(self.rfile.read(largo))
+        except ValueError:
+            return {}
+
+    def atender_control(self) -> bool:
+        """Rutas comunes: /stats y /reset"""
+        ruta = urlsplit(self.path).path
+        if ruta == "/stats":
+            self.responder(200, self.contadores.copia())
+            return True
+        if ruta == "/reset":
+            self.leer_cuerpo()
+            self.contadores.reiniciar()
+            self.responder(200, {"ok": True})
+            return True
+        return False
+
+    def error_inyectado(self) -> bool:
+        if random.random() < self.inyeccion.tasa_error:
+            self.contadores.sumar("errores_inyectados")
+            self.responder(500, {"ok": False, "error": "error inyectado"})
+            return True
+        return False
+
+
+class ManejadorOpenMeteo(ManejadorBase):
+    def do_GET(self):
+        if self.atender_control():
+            return
+        self.contadores.sumar("peticiones")
+        self.inyeccion.esperar()
+        if self.error_inyectado():
+            return
+
+        params = parse_qs(urlsplit(self.path).query)
+        latitudes = params.get("latitude", ["18.5"])[0].split(",")
+        dias = int(params.get("forecast_days", ["1"])[0])
+        self.contadores.sumar("zonas", len(latitudes))
+
+        respuestas = [self.pronostico(float(lat), dias) for lat in latitudes]
+        self.responder(200, respuestas[0] if len(respuestas) == 1 else respuestas)
+
+    def pronostico(self, lat: float, dias: int) -> dict:
+        """Pronóstico sintético pero estable por latitud y día"""
+        semilla = random.Random(int(lat * 1000) + date.today().toordinal())
+        fechas = [(date.today() + timedelta(days=i)).isoformat() for i in range(dias)]
+        horas = [f"{fecha}T{h:02d}:00" for fecha in fechas for h in range(24)]
+        return {
+            "latitude": lat,
+            "daily": {
+                "time": fechas,
+                "temperature_2m_max": [round(semilla.uniform(26, 36), 1) for _ in fechas],
+                "temperature_2m_min": [round(semilla.uniform(16, 24), 1) for _ in fechas],
+                "precipitation_sum": [round(semilla.uniform(0, 20), 1) for _ in fechas],
+                "relative_humidity_2m_mean": [semilla.randint(50, 95) for _ in fechas],
+                "precipitation_probability_max": [semilla.randint(0, 100) for _ in fechas],
+                "wind_speed_10m_max": [round(semilla.uniform(5, 40), 1) for _ in fechas]
+            },
+            "hourly": {
+                "time": horas,
+                "temperature_2m": [round(semilla.uniform(18, 34), 1) for _ in horas],
+                "relative_humidity_2m": [semilla.randint(45, 100) for _ in horas],
+                "precipitation_probability": [semilla.randint(0, 100) for _ in horas],
+                "precipitation": [round(semilla.uniform(0, 3), 1) for _ in horas],
+                "wind_speed_10m": [round(semilla.uniform(0, 30), 1) for _ in horas]
+            }
+        }
+
+
+class ManejadorTelegram(ManejadorBase):
+    buzon = None
+
+    def do_GET(self):
+        if self.atender_control():
+            return
+        self.responder(404, {"ok": False})
+
+    def do_POST(self):
+        if self.atender_control():
+            return
+        cuerpo = self.leer_cuerpo()
+        if urlsplit(self.path).path == "/encolar":
+            self.responder(200, {"ok": True, "pendientes": self.buzon.agregar(cuerpo.get("mensajes", []))})
+            return
+        metodo = urlsplit(self.path).path.rsplit("/", 1)[-1]
+        self.contadores.sumar(f"peticiones_{metodo}")
+        self.inyeccion.esperar()
+        if self.error_inyectado():
+            return
+
+        if metodo == "getUpdates":
+            # Tope de espera corto pa' que las pruebas no se queden colgadas
+            espera = min(float(cuerpo.get("timeout", 0)), 5)
+            updates = self.buzon.sacar(cuerpo.get("offset"), int(cuerpo.get("limit", 100)), espera)
+            self.contadores.sumar("updates_entregados", len(updates))
+            self.responder(200, {"ok": True, "result": updates})
+            return
+        if metodo != "sendMessage":
+            self.responder(404, {"ok": False, "description": f"Método {metodo} no soportado"})
+            return
+        if random.random() < self.inyeccion.tasa_429:
+            self.contadores.sumar("respuestas_429")
+            self.responder(429, {
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            })
+            return
+
+        self.contadores.sumar("mensajes_entregados")
+        self.responder(200, {"ok": True, "result": {
+            "message_id": random.randint(1, 10**9),
+            "chat": {"id": cuerpo.get("chat_id")},
+            "text": cuerpo.get("text")
+        }})
+
+
+def crear_servidor(manejador, puerto: int, inyeccion: Inyeccion) -> ThreadingHTTPServer:
+    clase = type(manejador.__name__, (manejador,), {"inyeccion": inyeccion, "contadores": Contadores(), "buzon": Buzon()})
+    servidor = ThreadingHTTPServer(("0.0.0.0", puerto), clase)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-Meteo y Telegram falsos pa' pruebas de carga")
+    parser.add_argument("--puerto-clima", type=int, default=8081)
+    parser.add_argument("--puerto-telegram", type=int, default=8082)
+    parser.add_argument("--latencia-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="fracción de respuestas 500")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="fracción de sendMessage con 429")
+    args = parser.parse_args()
+
+    inyeccion = Inyeccion(args.latencia_ms, args.jitter_ms, args.tasa_error, args.tasa_429)
+    servidores = [
+        crear_servidor(ManejadorOpenMeteo, args.puerto_clima, inyeccion),
+        crear_servidor(ManejadorTelegram, args.puerto_telegram, inyeccion)
+    ]
+    for servidor in servidores:
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    print(f"🌤️  Open-Meteo falso en http://localhost:{args.puerto_clima}/v1/forecast")
+    print(f"✈️  Telegram falso en http://localhost:{args.puerto_telegram}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for servidor in servidores:
+            servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+-- Etapas de cada cultivo (día en que termina cada etapa) y aviso de cambios
+-- en el catálogo pa' que DatosReferencia se recargue sin reiniciar.
+
+CREATE TABLE IF NOT EXISTS etapas_cultivo (
+    cultivo_id INTEGER NOT NULL REFERENCES cultivos(id),
+    dia_limite INTEGER,  -- NULL = hasta el final del ciclo
+    etapa VARCHAR(50) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_etapas_cultivo_cultivo ON etapas_cultivo (cultivo_id);
+
+INSERT INTO etapas_cultivo (cultivo_id, dia_limite, etapa)
+SELECT c.id, e.dia_limite, e.etapa
+FROM cultivos c
+JOIN (VALUES
+    ('TOM', 30, 'Crecimiento'), ('TOM', 55, 'Floración'), ('TOM', 80, 'Fructificación'), ('TOM', NULL, 'Cosecha'),
+    ('AJI', 30, 'Crecimiento'), ('AJI', 55, 'Floración'), ('AJI', 80, 'Fructificación'), ('AJI', NULL, 'Cosecha'),
+    ('BAN', 90, 'Establecimiento'), ('BAN', 180, 'Desarrollo'), ('BAN', 300, 'Floración'), ('BAN', NULL, 'Fructificación')
+) AS e(codigo, dia_limite, etapa) ON e.codigo = c.codigo
+WHERE NOT EXISTS (SELECT 1 FROM etapas_cultivo);
+
+CREATE OR REPLACE FUNCTION notificar_datos_referencia() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('datos_referencia', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cultivos_referencia ON cultivos;
+CREATE TRIGGER trg_cultivos_referencia AFTER INSERT OR UPDATE OR DELETE ON cultivos
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_datos_referencia();
+
+DROP TRIGGER IF EXISTS trg_zonas_referencia ON zonas_agroecologicas;
+CREATE TRIGGER trg_zonas_referencia AFTER INSERT OR UPDATE OR DELETE ON zonas_agroecologicas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_datos_referencia();
+
+DROP TRIGGER IF EXISTS trg_etapas_referencia ON etapas_cultivo;
+CREATE TRIGGER trg_etapas_referencia AFTER INSERT OR UPDATE OR DELETE ON etapas_cultivo
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_datos_referencia();
@@ -0,0 +1,10 @@
+-- Reportes ya armados por usuario y día, pa' que REPORTE los sirva con una
+-- sola búsqueda por clave (ver tasks/materializar_reportes.py).
+
+CREATE TABLE IF NOT EXISTS reportes_diarios (
+    telefono VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    texto TEXT NOT NULL,
+    generado_en TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (telefono, fecha)
+);
@@ -0,0 +1,27 @@
+-- Índices pa' que REPORTE (todas las siembras activas de un usuario, las más
+-- recientes primero) sea una búsqueda por índice sin importar cuántas
+-- siembras haya en la tabla (ver CONSULTA_SIEMBRAS_USUARIO).
+--
+-- CONCURRENTLY pa' no bloquear los registros mientras se arman en tablas
+-- grandes. Hay que correrlo fuera de una transacción (psql -f lo hace así).
+
+-- telefono → id y zona sin ir a la tabla (index-only scan)
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_usuarios_telefono_zona
+    ON usuarios (telefono) INCLUDE (id, zona_id);
+
+-- Ese índice pasa a ser el UNIQUE (telefono) de la tabla en lugar del de
+-- usuarios_telefono_key, pa' no mantener dos árboles únicos sobre la misma
+-- columna en cada registro. ON CONFLICT (telefono) lo usa igual.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'idx_usuarios_telefono_zona') THEN
+        ALTER TABLE usuarios
+            DROP CONSTRAINT IF EXISTS usuarios_telefono_key,
+            ADD CONSTRAINT idx_usuarios_telefono_zona UNIQUE USING INDEX idx_usuarios_telefono_zona;
+    END IF;
+END $$;
+
+-- Siembras activas de un usuario ya ordenadas: el LIMIT corta sin ordenar
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_siembras_usuario_activa
+    ON siembras (usuario_id, activa, created_at DESC)
+    INCLUDE (cultivo_id, fecha_siembra);
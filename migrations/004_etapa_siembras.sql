@@ -0,0 +1,11 @@
+-- Etapa actual de cada siembra, calculada cada noche por
+-- tasks/avanzar_siembras.py junto con dia_actual. Los reportes y las alertas
+-- la leen hecha en vez de recalcularla fila por fila.
+
+ALTER TABLE siembras ADD COLUMN IF NOT EXISTS etapa VARCHAR(50);
+ALTER TABLE siembras ADD COLUMN IF NOT EXISTS etapa_anterior VARCHAR(50);  -- NULL = primera etapa calculada
+ALTER TABLE siembras ADD COLUMN IF NOT EXISTS etapa_desde DATE;            -- día en que entró a la etapa
+ALTER TABLE siembras ADD COLUMN IF NOT EXISTS terminada_en DATE;           -- desactivada por pasar el ciclo
+
+-- Cambios de etapa de un día dado (alertas de "tu siembra entró en floración")
+CREATE INDEX IF NOT EXISTS idx_siembras_etapa_desde ON siembras (etapa_desde) WHERE activa = true;
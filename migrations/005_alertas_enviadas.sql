@@ -0,0 +1,10 @@
+-- Alertas ya mandadas por usuario, día y tipo, pa' no repetirlas si
+-- tasks/alertas.py corre varias veces el mismo día.
+
+CREATE TABLE IF NOT EXISTS alertas_enviadas (
+    telefono VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    tipo VARCHAR(80) NOT NULL,
+    enviada_en TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (telefono, fecha, tipo)
+);
@@ -0,0 +1,28 @@
+-- Pronósticos de varios días por zona, llenados por tasks/ingerir_pronosticos.py
+-- (ver services/pronosticos.py). Las horas de cada día van en arreglos de 24
+-- posiciones, una columna por variable: una semana de todas las zonas son
+-- pocas filas y se leen por la llave primaria.
+
+CREATE TABLE IF NOT EXISTS pronosticos_diarios (
+    zona_id INTEGER NOT NULL REFERENCES zonas_agroecologicas(id),
+    fecha DATE NOT NULL,
+    temp_max REAL,
+    temp_min REAL,
+    lluvia REAL,
+    humedad_media SMALLINT,
+    prob_lluvia SMALLINT,
+    viento_max REAL,
+    actualizado_en TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (zona_id, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS pronosticos_horarios (
+    zona_id INTEGER NOT NULL REFERENCES zonas_agroecologicas(id),
+    fecha DATE NOT NULL,
+    temperatura REAL[],
+    humedad SMALLINT[],
+    prob_lluvia SMALLINT[],
+    lluvia REAL[],
+    viento REAL[],
+    PRIMARY KEY (zona_id, fecha)
+);
@@ -0,0 +1,32 @@
+-- Historial de precios por cultivo, mercado y día (tasks/ingerir_precios.py)
+-- y el resumen ya calculado que lee REPORTE (ver services/precios.py).
+
+CREATE TABLE IF NOT EXISTS precios_mercado (
+    cultivo_id INTEGER NOT NULL REFERENCES cultivos(id),
+    mercado VARCHAR(60) NOT NULL,
+    fecha DATE NOT NULL,
+    precio_mayor NUMERIC(10,2) NOT NULL,   -- RD$ por libra
+    precio_detalle NUMERIC(10,2),
+    PRIMARY KEY (cultivo_id, mercado, fecha)
+);
+
+-- Las ventanas del resumen recorren los últimos días de cada cultivo
+CREATE INDEX IF NOT EXISTS idx_precios_mercado_cultivo_fecha ON precios_mercado (cultivo_id, fecha);
+
+CREATE TABLE IF NOT EXISTS resumen_precios (
+    cultivo_id INTEGER PRIMARY KEY REFERENCES cultivos(id),
+    fecha DATE NOT NULL,                   -- día del último precio
+    precio_mayor NUMERIC(10,2) NOT NULL,   -- promedio entre mercados ese día
+    precio_detalle NUMERIC(10,2),
+    promedio_7d NUMERIC(10,2),
+    promedio_30d NUMERIC(10,2),
+    variacion_7d NUMERIC(6,1),             -- por ciento del último precio contra el promedio de 7 días
+    tendencia VARCHAR(20) NOT NULL,        -- sube / baja / estable (7 días contra 30)
+    mercados INTEGER NOT NULL,
+    actualizado_en TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- El catálogo en memoria trae el resumen: se recarga cuando cambia
+DROP TRIGGER IF EXISTS trg_resumen_precios_referencia ON resumen_precios;
+CREATE TRIGGER trg_resumen_precios_referencia AFTER INSERT OR UPDATE OR DELETE ON resumen_precios
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_datos_referencia();
@@ -0,0 +1,11 @@
+-- Estados de conversación en curso por chat (ESTADOS_BACKEND=sql, ver
+-- services/estado_conversacion.py). expira_en va en segundos epoch; los
+-- vencidos se borran de a poco al guardar.
+
+CREATE TABLE IF NOT EXISTS estados_conversacion (
+    chat_id VARCHAR(64) PRIMARY KEY,
+    datos TEXT NOT NULL,
+    expira_en DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_estados_conversacion_expira ON estados_conversacion (expira_en);
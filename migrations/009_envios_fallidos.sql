@@ -0,0 +1,15 @@
+-- Envíos a Telegram que no se pudieron entregar (ENVIOS_FALLIDOS_BACKEND=sql,
+-- ver services/cola_envios.py). reenviado_en queda en NULL hasta que
+-- reencolar_fallidos los vuelve a mandar.
+
+CREATE TABLE IF NOT EXISTS envios_fallidos (
+    id SERIAL PRIMARY KEY,
+    chat_id VARCHAR(64) NOT NULL,
+    texto TEXT NOT NULL,
+    intentos INTEGER NOT NULL,
+    ultimo_error TEXT,
+    creado_en TIMESTAMP NOT NULL DEFAULT now(),
+    reenviado_en TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_envios_fallidos_pendientes ON envios_fallidos (id) WHERE reenviado_en IS NULL;
@@ -0,0 +1,9 @@
+-- Nodos vivos del modo particionado (PARTICIONES=1, ver services/particiones.py
+-- y tasks/particiones.py). Cada nodo actualiza latido (segundos epoch) cada
+-- PARTICION_LATIDO segundos; los que dejan de latir salen del anillo.
+
+CREATE TABLE IF NOT EXISTS nodos_particion (
+    nodo VARCHAR(120) PRIMARY KEY,
+    direccion TEXT NOT NULL,
+    latido DOUBLE PRECISION NOT NULL
+);
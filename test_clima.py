@@ -21,10 +21,12 @@ datos_clima = clima_service.obtener_clima_actual(lat=LATITUD_PRUEBA, lon=LONGITU
 # Verificamos y mostramos el resultado
 if datos_clima:
     print("\n✅ ¡Éxito! Se recibieron los datos del clima:")
-    print(f"   🌡️ Temperatura Actual:   {datos_clima.get('temperatura_actual')}°C")
-    print(f"   💨 Velocidad del Viento: {datos_clima.get('velocidad_viento')} km/h")
     print(f"   📈 Temp. Máx. (24h):     {datos_clima.get('temperatura_max_24h')}°C")
     print(f"   💧 Lluvia (24h):         {datos_clima.get('lluvia_24h')} mm")
+    print(f"   💦 Humedad media:        {datos_clima.get('humedad_media')}%")
+    print(f"   🌧️ Prob. de lluvia:      {datos_clima.get('prob_lluvia')}%")
+    for dia in datos_clima.get('proximos_dias', []):
+        print(f"   📆 {dia['fecha']}: máx {dia['temperatura_max']}°C, lluvia {dia['lluvia']} mm ({dia['prob_lluvia']}%)")
 else:
     print("\n❌ ¡Fallo! No se pudieron obtener los datos del clima.")
     print("   Revisa la consola en busca de mensajes de error de la API.")